@@ -0,0 +1,314 @@
+"""
+Command-line maintenance tools.
+
+Usage (from the backend directory):
+
+    python -m app.cli copy-db --source sqlite:////app/data/vyaya.db \\
+        --target postgresql+psycopg://vyaya:secret@db/vyaya
+    python -m app.cli export --format parquet --start-date 2024-01-01 \\
+        --end-date 2024-12-31 --output receipts-2024.parquet
+    python -m app.cli import statement.ofx
+    python -m app.cli gc --dry-run
+    python -m app.cli reextract --dry-run
+    python -m app.cli fx-backfill --include-zero
+    python -m app.cli maintenance --full-check
+    python -m app.cli backup --output /backups/vyaya.db
+"""
+import argparse
+import logging
+import sys
+from collections import Counter
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy import func, insert, inspect, literal_column, select, text
+
+logger = logging.getLogger(__name__)
+
+
+# Float amount columns of databases created before amounts moved to minor units
+LEGACY_MONEY_COLUMNS = ("amount", "amount_usd")
+
+
+def convert_legacy_money(row: dict) -> dict:
+    """
+    Fill a copied receipt's minor-unit amounts from its legacy float columns.
+
+    Rows the source already migrated keep their minor units; the float
+    columns are dropped either way (see database.migrate_money_columns).
+    """
+    from .services.money import USD_EXPONENT, currency_exponent, to_minor
+
+    amount, amount_usd = (row.pop(name, None) for name in LEGACY_MONEY_COLUMNS)
+    if row.get("currency_exponent") is None:
+        row["currency_exponent"] = currency_exponent(row.get("currency"))
+    if row.get("amount_minor") is None and row.get("amount_usd_minor") is None:
+        row["amount_minor"] = to_minor(amount, row["currency_exponent"])
+        row["amount_usd_minor"] = to_minor(amount_usd, USD_EXPONENT)
+    return row
+
+
+def copy_db(args) -> int:
+    """Copy every table from one database URL to another."""
+    from . import models  # noqa: F401
+    from .database import Base, create_db_engine
+    from .services.search import install_search_indexes
+
+    source = create_db_engine(args.source)
+    target = create_db_engine(args.target)
+
+    Base.metadata.create_all(bind=target)
+    existing = set(inspect(source).get_table_names())
+
+    # Parents before children so foreign keys hold on the target
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            print(f"{table.name:<22} skipped (not in source)")
+            continue
+
+        with target.connect() as conn:
+            if conn.execute(select(func.count()).select_from(table)).scalar():
+                print(f"{table.name} already has rows on the target; refusing to copy", file=sys.stderr)
+                return 1
+
+        source_columns = {column["name"] for column in inspect(source).get_columns(table.name)}
+        columns = [column for column in table.columns if column.name in source_columns]
+        if table.name == "receipts":
+            # Older databases keep amounts in the float columns the model no longer maps
+            columns += [literal_column(name) for name in LEGACY_MONEY_COLUMNS if name in source_columns]
+
+        copied = 0
+        with source.connect() as src, target.begin() as dst:
+            query = select(*columns).select_from(table)
+            result = src.execution_options(stream_results=True, yield_per=args.batch_size).execute(query)
+            for rows in result.partitions():
+                values = [row._asdict() for row in rows]
+                if table.name == "receipts":
+                    values = [convert_legacy_money(value) for value in values]
+                dst.execute(insert(table), values)
+                copied += len(rows)
+
+            # Explicit ids were inserted, so move serial sequences past them
+            if target.dialect.name == "postgresql" and "id" in table.c and table.c.id.type.python_type is int:
+                dst.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                    f"COALESCE((SELECT MAX(id) FROM {table.name}), 0) + 1, false)"
+                ))
+        print(f"{table.name:<22} {copied:>9} rows")
+
+    install_search_indexes(target)
+    return 0
+
+
+def export(args) -> int:
+    """Stream receipts to a file (or stdout) in the requested format."""
+    from .services.export import check_format, export_receipts
+
+    try:
+        check_format(args.format)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    chunks = export_receipts(args.format, args.start_date, args.end_date, args.category_id, args.images)
+    if args.output == "-":
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        return 0
+
+    written = 0
+    with open(args.output, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            written += len(chunk)
+    print(f"Wrote {written / 1_000_000:.1f} MB to {args.output}", file=sys.stderr)
+    return 0
+
+
+def import_file(args) -> int:
+    """Bulk import a CSV or OFX file, printing progress as batches commit."""
+    from .services.importer import detect_format, import_receipts
+
+    from .services.fx_backfill import backfill_usd_amounts
+
+    def report(result):
+        print(f"  {result.imported} imported, {result.skipped} skipped, {result.duplicates} duplicates, "
+              f"{result.failed} failed ({result.duration_seconds:.1f}s)", file=sys.stderr)
+
+    fmt = args.format or detect_format(args.file)
+    try:
+        with open(args.file, encoding="utf-8-sig", errors="replace", newline="") as f:
+            result = import_receipts(f, fmt, args.currency, report)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    for error in result.errors:
+        print(f"row {error['row']}: {error['error']}", file=sys.stderr)
+    print(f"Imported {result.imported} receipts in {result.duration_seconds:.1f}s "
+          f"({result.skipped} skipped, {result.duplicates} duplicates, {result.failed} failed)")
+
+    # No scheduler runs in this process to pick up rows whose rate lookup failed
+    if result.unconverted:
+        backfill = backfill_usd_amounts()
+        print(f"Converted {backfill.converted} of {result.unconverted} receipts to USD "
+              f"({backfill.unresolved} left for the next FX backfill)")
+    return 1 if result.failed else 0
+
+
+def gc(args) -> int:
+    """Reconcile receipt files on disk against the database."""
+    from .services.storage import collect_garbage
+
+    report = collect_garbage(dry_run=args.dry_run)
+    for key, value in report.to_dict().items():
+        print(f"{key:<22} {value}")
+    return 0
+
+
+def fx_backfill(args) -> int:
+    """Convert receipts missing a USD amount."""
+    from .services.fx_backfill import backfill_usd_amounts
+
+    report = backfill_usd_amounts(include_zero=args.include_zero)
+    for key, value in report.to_dict().items():
+        print(f"{key:<22} {value}")
+    return 0
+
+
+def maintenance(args) -> int:
+    """Run database maintenance, or switch the database to incremental vacuum."""
+    from .services.maintenance import MaintenanceUnavailable, enable_incremental_vacuum, run_maintenance
+
+    if args.enable_incremental_vacuum:
+        try:
+            enable_incremental_vacuum()
+        except MaintenanceUnavailable as e:
+            print(e, file=sys.stderr)
+            return 1
+        print("Database switched to incremental auto-vacuum")
+        return 0
+
+    report = run_maintenance(full_check=args.full_check)
+    for key, value in report.to_dict().items():
+        print(f"{key:<22} {value}")
+    return 0 if report.healthy else 1
+
+
+def backup(args) -> int:
+    """Take an online backup of the SQLite database."""
+    from .services.maintenance import BackupFailed, MaintenanceUnavailable, backup_database
+
+    try:
+        report = backup_database(args.output, args.pages_per_step)
+    except (BackupFailed, MaintenanceUnavailable) as e:
+        print(e, file=sys.stderr)
+        return 1
+    for key, value in report.to_dict().items():
+        print(f"{key:<22} {value}")
+    return 0
+
+
+def reextract(args) -> int:
+    """Queue receipts still awaiting review that were extracted with an older prompt."""
+    from .config import get_settings
+    from .database import SessionLocal
+    from .models import Receipt
+    from .services.prompts import CURRENT_VERSIONS
+
+    if not args.dry_run and get_settings().queue_backend != "database":
+        print("reextract needs QUEUE_BACKEND=database so running workers see the jobs", file=sys.stderr)
+        return 1
+
+    db = SessionLocal()
+    try:
+        stale = db.query(Receipt).filter(
+            Receipt.status == "review",
+            Receipt.image_path != "manual_entry",
+            (Receipt.prompt_version.is_(None)) | (Receipt.prompt_version.notin_(CURRENT_VERSIONS)),
+        ).all()
+        counts = Counter(receipt.prompt_version or "unversioned" for receipt in stale)
+        for version, count in sorted(counts.items()):
+            print(f"{version:<22} {count}")
+        if args.dry_run or not stale:
+            return 0
+
+        from .services.worker import enqueue_receipt
+
+        for receipt in stale:
+            receipt.status = "processing"
+        db.commit()
+        for receipt in stale:
+            enqueue_receipt(receipt.id, receipt.image_path, args.lane)
+        print(f"Queued {len(stale)} receipts on the {args.lane} lane")
+        return 0
+    finally:
+        db.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Vyaya maintenance tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    copy = commands.add_parser("copy-db", help="copy all data between databases (e.g. SQLite to PostgreSQL)")
+    copy.add_argument("--source", required=True, help="source database URL")
+    copy.add_argument("--target", required=True, help="target database URL (tables are created if missing)")
+    copy.add_argument("--batch-size", type=int, default=1000)
+    copy.set_defaults(handler=copy_db)
+
+    exp = commands.add_parser("export", help="export receipts to CSV, JSONL or Parquet")
+    exp.add_argument("--format", choices=("csv", "jsonl", "parquet"), default="csv")
+    exp.add_argument("--output", default="-", help="output file, or - for stdout (default)")
+    exp.add_argument("--start-date", type=date.fromisoformat)
+    exp.add_argument("--end-date", type=date.fromisoformat)
+    exp.add_argument("--category-id", type=int)
+    exp.add_argument("--images", action="store_true", help="write a zip containing the export and receipt images")
+    exp.set_defaults(handler=export)
+
+    imp = commands.add_parser(
+        "import",
+        help="bulk import receipts from a CSV or OFX/QFX file",
+        description="Bulk import receipts. Rows an earlier import of the same statement created are skipped; "
+                    "rows whose exchange rate could not be fetched are converted to USD by the FX backfill.",
+    )
+    imp.add_argument("file")
+    imp.add_argument("--format", choices=("csv", "ofx"), help="defaults to the file extension")
+    imp.add_argument("--currency", default="USD", help="currency for rows that don't name one")
+    imp.set_defaults(handler=import_file)
+
+    collect = commands.add_parser("gc", help="remove orphaned receipt files and move old ones to the cold tier")
+    collect.add_argument("--dry-run", action="store_true", help="report what would change without touching files")
+    collect.set_defaults(handler=gc)
+
+    fx = commands.add_parser("fx-backfill", help="convert receipts that are missing a USD amount")
+    fx.add_argument("--include-zero", action="store_true",
+                    help="also convert non-zero amounts stored with a zero USD amount")
+    fx.set_defaults(handler=fx_backfill)
+
+    maint = commands.add_parser("maintenance", help="optimize, analyze, vacuum and integrity-check the database")
+    maint.add_argument("--full-check", action="store_true", help="run integrity_check instead of quick_check")
+    maint.add_argument("--enable-incremental-vacuum", action="store_true",
+                       help="switch an existing SQLite database to incremental vacuum (full VACUUM; stop the app first)")
+    maint.set_defaults(handler=maintenance)
+
+    back = commands.add_parser("backup", help="online backup of the SQLite database")
+    back.add_argument("--output", type=Path, help="backup file (default: a timestamped file in BACKUP_DIR)")
+    back.add_argument("--pages-per-step", type=int, default=256, help="pages copied between pauses")
+    back.set_defaults(handler=backup)
+
+    redo = commands.add_parser("reextract", help="re-run extraction for receipts from an older prompt version")
+    redo.add_argument("--dry-run", action="store_true", help="only count the stale receipts per prompt version")
+    redo.add_argument("--lane", choices=("interactive", "bulk", "background"), default="background")
+    redo.set_defaults(handler=reextract)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,33 +1,179 @@
 """Database connection and session management."""
 
-from sqlalchemy import create_engine, event
+import hashlib
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import sessionmaker, declarative_base
 from pathlib import Path
 
 from .config import get_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Bump when init_db() gains a data migration that no model change triggers
+SCHEMA_REVISION = 1
+
+def engine_options(database_url: str) -> dict:
+    """
+    Engine keyword arguments for the configured backend.
+
+    SQLite needs cross-thread connections. PostgreSQL gets a pool sized for
+    the worker threads plus request handlers, pre-ping to survive server
+    restarts, and a server-side statement timeout.
+    """
+    if make_url(database_url).get_backend_name() == "sqlite":
+        return {"connect_args": {"check_same_thread": False}}  # Needed for SQLite
 
-# Ensure data directory exists
-Path(settings.data_dir).mkdir(parents=True, exist_ok=True)
+    pool_size = settings.db_pool_size or settings.worker_concurrency + 5
+    return {
+        "pool_size": pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        "pool_pre_ping": True,
+        "connect_args": {"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"},
+    }
 
-# Create SQLite engine with proper settings
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False},  # Needed for SQLite
-    echo=settings.debug,
-)
 
-# Enable foreign keys for SQLite
-@event.listens_for(engine, "connect")
+def create_db_engine(database_url: str):
+    """Create an engine with backend-specific pooling and connection setup."""
+    new_engine = create_engine(database_url, echo=settings.debug, **engine_options(database_url))
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine, "connect", set_sqlite_pragma)
+    return new_engine
+
+
+# Enable foreign keys for SQLite, plus WAL and a busy timeout so the API and
+# standalone worker processes can share the file without "database is locked".
+# New databases use incremental auto-vacuum so maintenance can shrink them
+# online (the pragma has no effect once tables exist).
 def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
     cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
     cursor.close()
 
+
+engine = create_db_engine(settings.database_url)
+IS_SQLITE = engine.dialect.name == "sqlite"
+
+# Per-request SQL statement counter (see count_statements)
+_statement_counter: ContextVar[Optional[list]] = ContextVar("statement_counter", default=None)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _statement_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+@contextmanager
+def count_statements():
+    """
+    Count SQL statements executed in the current context.
+
+    Yields a one-element list holding the running count, so the value can be
+    read after the block (or from tasks that inherited the context) exits.
+    """
+    counter = [0]
+    token = _statement_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _statement_counter.reset(token)
+
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Writes to these tables bump data_version, which keys cached API responses
+# and their ETags. Writes only mark the session; the bump runs once, just
+# before the transaction commits, so the version and the data become visible
+# together, whichever process wrote them.
+VERSIONED_TABLES = frozenset({"receipts", "categories", "receipt_tombstones"})
+_BUMP_DATA_VERSION = text("UPDATE data_version SET version = version + 1 WHERE id = 1")
+_NEXT_DATA_VERSION = text("UPDATE data_version SET version = version + 1 WHERE id = 1 RETURNING version")
+_DATA_CHANGED = "data_version_changed"  # session.info: tables with rows awaiting a change_seq
+
+# Rows written to these tables are stamped with the version their
+# transaction committed as (change_seq), the delta-sync cursor. Writers
+# queue on the data_version row from the bump to the commit, so versions
+# become visible in order and a reader that sees one has seen every smaller
+# one. Writes clear change_seq and the commit fills in every cleared row.
+SEQUENCED_TABLES = frozenset({"receipts", "receipt_tombstones"})
+_STAMP_CHANGE_SEQ = {
+    name: text(f"UPDATE {name} SET change_seq = :version WHERE change_seq IS NULL") for name in SEQUENCED_TABLES
+}
+
+
+def _mark_changed(session, table_name: Optional[str], sequenced: bool = True) -> None:
+    if table_name in VERSIONED_TABLES:
+        tables = session.info.setdefault(_DATA_CHANGED, set())
+        if sequenced and table_name in SEQUENCED_TABLES:
+            tables.add(table_name)
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def clear_change_seq(session, flush_context, instances):
+    for obj in session.new | session.dirty:
+        if getattr(obj, "__tablename__", None) in SEQUENCED_TABLES and (
+            obj in session.new or session.is_modified(obj)
+        ):
+            obj.change_seq = None
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def mark_data_changed_after_flush(session, flush_context):
+    for obj in session.new | session.dirty:
+        _mark_changed(session, getattr(obj, "__tablename__", None))
+    for obj in session.deleted:
+        _mark_changed(session, getattr(obj, "__tablename__", None), sequenced=False)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def mark_data_changed_on_bulk_write(orm_execute_state):
+    """Bulk INSERT/UPDATE/DELETE statements bypass the flush."""
+    state = orm_execute_state
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    name = getattr(getattr(state.statement, "table", None), "name", None)
+    if state.is_update and name in SEQUENCED_TABLES:
+        state.statement = state.statement.values(change_seq=None)
+    # Inserted rows get change_seq's default, NULL
+    _mark_changed(state.session, name, sequenced=not state.is_delete)
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def bump_data_version(session):
+    # The commit's own flush runs after this hook, so flush first to see its writes
+    session.flush()
+    tables = session.info.pop(_DATA_CHANGED, None)
+    if tables is None:
+        return
+    conn = session.connection()
+    version = conn.execute(_NEXT_DATA_VERSION).scalar()
+    for name in sorted(tables):
+        conn.execute(_STAMP_CHANGE_SEQ[name], {"version": version})
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def forget_data_changed(session):
+    session.info.pop(_DATA_CHANGED, None)
+
+
+def current_data_version(db) -> int:
+    """The data version as of this session's view of the database."""
+    return db.execute(text("SELECT version FROM data_version WHERE id = 1")).scalar() or 0
+
 # Base class for models
 Base = declarative_base()
 
@@ -41,7 +187,125 @@ def get_db():
         db.close()
 
 
-def init_db():
-    """Initialize database tables."""
+def schema_fingerprint() -> str:
+    """Hash of the tables, columns and indexes the models define, plus SCHEMA_REVISION."""
+    parts = [f"revision:{SCHEMA_REVISION}"]
+    for table in Base.metadata.sorted_tables:
+        parts.append(f"table:{table.name}")
+        parts += [
+            f"column:{column.name}:{column.type.compile(dialect=engine.dialect)}:{column.nullable}"
+            for column in table.columns
+        ]
+        parts += sorted(f"index:{index.name}" for index in table.indexes)
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def stored_schema_fingerprint() -> Optional[str]:
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT fingerprint FROM schema_version WHERE id = 1")).scalar()
+    except DBAPIError:
+        return None  # Fresh database, or one created before schema_version existed
+
+
+def init_db() -> bool:
+    """
+    Create and migrate the database schema.
+
+    Costs a single query when the schema fingerprint stored by the last run
+    matches the models. Returns True if the schema had to be (re)applied.
+    """
     from . import models  # noqa: F401
+    from .services.search import install_search_indexes
+    
+    Path(settings.data_dir).mkdir(parents=True, exist_ok=True)
+    fingerprint = schema_fingerprint()
+    if stored_schema_fingerprint() == fingerprint:
+        logger.info("Database schema is up to date")
+        return False
+    
     Base.metadata.create_all(bind=engine)
+    sync_schema()
+    migrate_money_columns()
+    install_search_indexes(engine)
+    
+    with engine.begin() as conn:
+        # Migrations may have rewritten data, so cached responses are stale too
+        bumped = conn.execute(_BUMP_DATA_VERSION).rowcount
+        if not bumped:
+            conn.execute(models.DataVersion.__table__.insert().values(id=1, version=1))
+        # Rows from before change_seq existed, or written outside a session
+        version = conn.execute(text("SELECT version FROM data_version WHERE id = 1")).scalar()
+        for statement in _STAMP_CHANGE_SEQ.values():
+            conn.execute(statement, {"version": version})
+        conn.execute(text("DELETE FROM schema_version"))
+        conn.execute(
+            models.SchemaVersion.__table__.insert().values(id=1, fingerprint=fingerprint, applied_at=models.get_eastern_time())
+        )
+    logger.info("Database schema applied")
+    return True
+
+
+def sync_schema():
+    """
+    Bring existing tables up to date with the models.
+
+    create_all() only creates missing tables, so columns and indexes added to
+    a model later are created here. Only additive changes are handled.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+
+
+def migrate_money_columns():
+    """
+    Move receipt amounts from the legacy float columns to integer minor units.
+
+    Databases created before amounts moved to minor units still have the
+    float `amount` and `amount_usd` columns. Rows not converted yet are
+    converted in one UPDATE. The float columns are left in place (unused)
+    so a downgrade still finds its data.
+    """
+    from .services.money import CURRENCY_EXPONENTS, DEFAULT_EXPONENT, USD_EXPONENT
+
+    def by_currency(value) -> str:
+        whens = " ".join(f"WHEN '{code}' THEN {value(exponent)}" for code, exponent in CURRENCY_EXPONENTS.items())
+        return f"CASE UPPER(currency) {whens} ELSE {value(DEFAULT_EXPONENT)} END"
+
+    columns = {column["name"] for column in inspect(engine).get_columns("receipts")}
+
+    with engine.begin() as conn:
+        # Rows that predate the currency_exponent column
+        conn.execute(text(
+            f"UPDATE receipts SET currency_exponent = {by_currency(lambda e: e)} WHERE currency_exponent IS NULL"
+        ))
+
+        if not {"amount", "amount_usd"} <= columns:
+            return
+        # The inner ROUND strips binary noise (0.285 * 100 = 28.4999...) first
+        migrated = conn.execute(text(f"""
+            UPDATE receipts SET
+                amount_minor = CAST(ROUND(ROUND(CAST(amount AS NUMERIC) * {by_currency(lambda e: 10 ** e)}, 6)) AS BIGINT),
+                amount_usd_minor = CAST(ROUND(ROUND(CAST(amount_usd AS NUMERIC) * {10 ** USD_EXPONENT}, 6)) AS BIGINT)
+            WHERE amount_minor IS NULL AND amount_usd_minor IS NULL
+              AND (amount IS NOT NULL OR amount_usd IS NOT NULL)
+        """)).rowcount
+
+    if migrated:
+        logger.info(f"Migrated {migrated} receipt amounts to integer minor units")
@@ -1,51 +1,64 @@
 """FastAPI application entry point."""
 
+import threading
+import time
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.routing import Match
 
 from .config import get_settings
-from .database import init_db, SessionLocal
-from .models import Category, DEFAULT_CATEGORIES
-from .routers import receipts, dashboard
-
-from .services.worker import start_worker
+from .database import init_db, count_statements
+from .routers import admin, receipts, dashboard
+
+from .services import events, fx_backfill, scheduler
+from .services.categorizer import seed_categories
+from .services.llm import get_client
+from .services.maintenance import foreground, run_maintenance
+from .services.metrics import HTTP_DB_STATEMENTS, HTTP_REQUEST_SECONDS
+from .services.profiling import continuous as continuous_profiler, profile
+from .services.storage import collect_garbage
+from .services.tracing import setup_tracing, tracer
+from .services.worker import receipt_queue, start_worker
 
 settings = get_settings()
 
 
-def seed_categories():
-    """Seed default categories if they don't exist."""
-    db = SessionLocal()
-    try:
-        existing = db.query(Category).count()
-        if existing == 0:
-            for cat_data in DEFAULT_CATEGORIES:
-                category = Category(**cat_data)
-                db.add(category)
-            db.commit()
-    finally:
-        db.close()
-
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application startup and shutdown events."""
     # Startup
-    init_db()
-    seed_categories()
+    setup_tracing()
+    if init_db():
+        seed_categories()
     
     # Ensure receipts directory exists
     settings.receipts_dir.mkdir(parents=True, exist_ok=True)
     
-    # Start background worker
-    start_worker()
+    # Start background workers unless extraction runs in separate
+    # `python -m app.worker` processes
+    if settings.embedded_worker:
+        start_worker()
+        # Build the LLM client off the startup path so the first upload doesn't wait for it
+        threading.Thread(target=get_client, name="llm-client-init", daemon=True).start()
+        scheduler.schedule("storage-gc", settings.storage_gc_interval_hours * 3600, collect_garbage)
+        scheduler.schedule("db-maintenance", settings.db_maintenance_interval_hours * 3600, run_maintenance)
+    # Resolves the USD amounts that request handlers leave for later
+    fx_backfill.start()
+    # Event streams also carry changes committed by standalone workers and other API processes
+    events.start_relay()
+    continuous_profiler.start()
     
     yield
     
-    # Shutdown (cleanup if needed)
+    # Shutdown: stop handing out jobs
+    receipt_queue.close()
+    scheduler.stop()
 
 
 app = FastAPI(
@@ -53,8 +66,26 @@ app = FastAPI(
     description="Self-hosted receipt management and expense tracking",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """
+    Gzip large responses, except event streams (compression would buffer
+    events), receipt files (images and audio are already compressed) and
+    exports (streamed at disk speed; Parquet and zip are compressed).
+    """
+
+    SKIP_PREFIXES = ("/api/receipts/events", "/api/receipts/export", "/api/receipts/image/", "/static/")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.SKIP_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 # CORS middleware for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -64,9 +95,70 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON payloads such as 100-row receipt pages
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=1024)
+
+
+
+def _route_template(request: Request) -> str:
+    """Resolve the route template for a request to keep label cardinality bounded."""
+    for route in request.app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+def profiling_requested(request: Request) -> bool:
+    """X-Profile: 1 or ?profile=1, from a client holding the admin token."""
+    flagged = request.headers.get("x-profile") == "1" or request.query_params.get("profile") == "1"
+    return flagged and admin.valid_admin_token(request.headers.get("x-admin-token"))
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """
+    Record request latency and SQL statement count, and open a server span per route.
+    
+    Requests asking for a profile are sampled while they run; the profile's
+    file name comes back in the X-Profile header.
+    """
+    start = time.perf_counter()
+    status = 500
+    route = _route_template(request)
+    with (
+        foreground.track(request.url.path),
+        tracer.start_as_current_span(f"{request.method} {route}") as span,
+        count_statements() as statements,
+    ):
+        try:
+            if profiling_requested(request):
+                # Sync handlers and DB work run on the threadpool, not the event loop
+                with profile(f"{request.method} {route}", all_threads=True) as profiled:
+                    response = await call_next(request)
+                if profiled.path:
+                    response.headers["X-Profile"] = profiled.path.name
+            else:
+                response = await call_next(request)
+            status = response.status_code
+            if settings.expose_query_count:
+                response.headers["X-DB-Statements"] = str(statements[0])
+            return response
+        finally:
+            span.set_attribute("http.status_code", status)
+            span.set_attribute("db.statements", statements[0])
+            HTTP_REQUEST_SECONDS.labels(
+                method=request.method,
+                route=route,
+                status=str(status),
+            ).observe(time.perf_counter() - start)
+            HTTP_DB_STATEMENTS.labels(method=request.method, route=route).observe(statements[0])
+
+
 # Include routers
 app.include_router(receipts.router)
 app.include_router(dashboard.router)
+app.include_router(admin.router)
 
 # Mount static files for receipt images
 app.mount(
@@ -90,3 +182,9 @@ async def root():
 async def health_check():
     """API health check."""
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
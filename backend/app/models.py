@@ -3,10 +3,20 @@
 import uuid
 from datetime import datetime, date
 from zoneinfo import ZoneInfo
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Text, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, Integer, BigInteger, SmallInteger, String, Float, Date, DateTime, Text, ForeignKey, case, cast
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import relationship, validates
 
 from .database import Base
+from .services.money import (
+    CURRENCY_EXPONENTS,
+    DEFAULT_EXPONENT,
+    USD_EXPONENT,
+    currency_exponent,
+    from_minor,
+    rescale_minor,
+    to_minor,
+)
 
 
 
@@ -44,24 +54,167 @@ class Receipt(Base):
     
     id = Column(String(36), primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
     vendor = Column(String(255), index=True)
-    amount = Column(Float, nullable=True)
-    amount_usd = Column(Float, nullable=True)
+    # Money in integer minor units (see services/money.py); amount_usd is in cents
+    amount_minor = Column(BigInteger, nullable=True)
+    amount_usd_minor = Column(BigInteger, nullable=True)
+    currency_exponent = Column(SmallInteger, nullable=False, default=DEFAULT_EXPONENT)
     currency = Column(String(3), default="USD")
     transaction_date = Column(Date, nullable=True, index=True)
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
-    image_path = Column(String(500), nullable=False)
+    image_path = Column(String(500), nullable=False, index=True)  # Shared by receipts with identical files
     raw_ocr_text = Column(Text, nullable=True)
     status = Column(String(20), default="processing", index=True)  # processing, review, completed, failed
+    processed_at = Column(DateTime, nullable=True, index=True)  # When the worker last finished extraction
+    processing_attempt = Column(Integer, nullable=True)  # Latest worker attempt; older attempts' results are dropped
+    change_seq = Column(BigInteger, nullable=True, index=True)  # Data version of the last change; the sync cursor
+    prompt_version = Column(String(32), nullable=True, index=True)  # Extraction prompt, e.g. "image/2"; NULL before versioning
+    import_key = Column(String(64), nullable=True, index=True)  # Statement row a bulk import created it from; re-imports skip it
     created_at = Column(DateTime, default=get_eastern_time)
-    updated_at = Column(DateTime, default=get_eastern_time, onupdate=get_eastern_time)
+    updated_at = Column(DateTime, default=get_eastern_time, onupdate=get_eastern_time, index=True)
     
-    # Relationship
+    # Relationships
     category = relationship("Category", back_populates="receipts")
+    # The database deletes the file row with its receipt (ON DELETE CASCADE),
+    # so deleting a receipt doesn't load the row first
+    file = relationship(
+        "ReceiptFile", uselist=False, cascade="all, delete-orphan", passive_deletes=True, back_populates="receipt"
+    )
+    
+    @hybrid_property
+    def amount(self):
+        return from_minor(self.amount_minor, self._exponent())
+    
+    @amount.setter
+    def amount(self, value):
+        self.currency_exponent = self._exponent()
+        self.amount_minor = to_minor(value, self.currency_exponent)
+        # Kept so a currency assigned next converts the exact value, not the rounded one
+        self._assigned_amount = (value, self.amount_minor)
+    
+    @amount.expression
+    def amount(cls):
+        scale = case(
+            {exponent: 10 ** exponent for exponent in set(CURRENCY_EXPONENTS.values())},
+            value=cls.currency_exponent,
+            else_=10 ** DEFAULT_EXPONENT,
+        )
+        return cast(cls.amount_minor, Float) / scale
+    
+    @hybrid_property
+    def amount_usd(self):
+        return from_minor(self.amount_usd_minor, USD_EXPONENT)
+    
+    @amount_usd.setter
+    def amount_usd(self, value):
+        self.amount_usd_minor = to_minor(value, USD_EXPONENT)
+    
+    @amount_usd.expression
+    def amount_usd(cls):
+        return cast(cls.amount_usd_minor, Float) / 10 ** USD_EXPONENT
+    
+    @validates("currency")
+    def _rescale_amount(self, key, currency):
+        """Keep the stored amount's value when the currency's exponent changes."""
+        exponent = currency_exponent(currency)
+        assigned = self.__dict__.get("_assigned_amount")
+        if assigned is not None and assigned[1] == self.amount_minor:
+            # amount was set first (as in Receipt(amount=..., currency=...))
+            self.amount_minor = to_minor(assigned[0], exponent)
+        elif self.amount_minor is not None:
+            self.amount_minor = rescale_minor(self.amount_minor, self._exponent(), exponent)
+        self.currency_exponent = exponent
+        return currency
+    
+    def _exponent(self) -> int:
+        if self.currency_exponent is not None:
+            return self.currency_exponent
+        return currency_exponent(self.currency)
     
     def __repr__(self):
         return f"<Receipt(id={self.id}, vendor='{self.vendor}', status='{self.status}')>"
 
 
+class ReceiptFile(Base):
+    """Metadata of an uploaded receipt file, captured while it was written."""
+    
+    __tablename__ = "receipt_files"
+    
+    receipt_id = Column(String(36), ForeignKey("receipts.id", ondelete="CASCADE"), primary_key=True)
+    mime_type = Column(String(50), nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    sha256 = Column(String(64), nullable=False, index=True)
+    width = Column(Integer, nullable=True)  # Images only, as stored (before EXIF rotation)
+    height = Column(Integer, nullable=True)
+    orientation = Column(SmallInteger, nullable=True)  # EXIF orientation tag
+    captured_at = Column(DateTime, nullable=True)  # EXIF DateTimeOriginal
+    created_at = Column(DateTime, default=get_eastern_time)
+    
+    # Relationship
+    receipt = relationship("Receipt", back_populates="file")
+    
+    def __repr__(self):
+        return f"<ReceiptFile(receipt_id={self.receipt_id}, mime_type='{self.mime_type}', size_bytes={self.size_bytes})>"
+
+
+class ReceiptTombstone(Base):
+    """Marker left behind by a deleted receipt so delta-sync clients can drop it."""
+    
+    __tablename__ = "receipt_tombstones"
+    
+    receipt_id = Column(String(36), primary_key=True)
+    deleted_at = Column(DateTime, default=get_eastern_time, nullable=False, index=True)
+    change_seq = Column(BigInteger, nullable=True, index=True)  # Data version of the deletion; the sync cursor
+    
+    def __repr__(self):
+        return f"<ReceiptTombstone(receipt_id={self.receipt_id}, deleted_at={self.deleted_at})>"
+
+
+class ProcessingJob(Base):
+    """Queued receipt extraction, used when the queue is shared through the database."""
+    
+    __tablename__ = "processing_jobs"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    receipt_id = Column(String(36), nullable=False, index=True)
+    file_path = Column(String(500), nullable=False)
+    lane = Column(String(20), nullable=False, default="interactive")
+    trace_context = Column(Text, nullable=True)  # JSON-encoded propagation headers
+    enqueued_at = Column(Float, nullable=False, index=True)  # Unix timestamp
+    claimed_at = Column(Float, nullable=True, index=True)  # Unix timestamp, NULL while queued
+    claimed_by = Column(String(100), nullable=True)
+    profile = Column(Boolean, nullable=True, default=False)  # Profile the job when it runs
+    attempts = Column(Integer, nullable=True, default=0)  # Runs that ran out of time
+    available_at = Column(Float, nullable=True)  # Unix timestamp; retries wait until then
+    
+    def __repr__(self):
+        return f"<ProcessingJob(id={self.id}, receipt_id={self.receipt_id}, lane='{self.lane}')>"
+
+
+class SchemaVersion(Base):
+    """Fingerprint of the schema last applied by init_db(), so unchanged schemas skip migration."""
+    
+    __tablename__ = "schema_version"
+    
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    applied_at = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<SchemaVersion(fingerprint={self.fingerprint[:12]}, applied_at={self.applied_at})>"
+
+
+class DataVersion(Base):
+    """Counter bumped in every transaction that writes receipts or categories (see database.py)."""
+    
+    __tablename__ = "data_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<DataVersion(version={self.version})>"
+
+
 # Default categories to seed
 DEFAULT_CATEGORIES = [
     {"name": "Groceries", "icon": "🛒", "color": "#86efac"},      # Pastel green
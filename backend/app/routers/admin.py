@@ -0,0 +1,86 @@
+"""Admin API endpoints: database maintenance, backups and profiles."""
+
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+
+from ..config import get_settings
+from ..schemas import BackupResult, MaintenanceResult
+from ..services.maintenance import BackupFailed, MaintenanceUnavailable, backup_database, run_maintenance
+from ..services.profiling import continuous as continuous_profiler
+
+settings = get_settings()
+
+
+def valid_admin_token(token: Optional[str]) -> bool:
+    return bool(settings.admin_token and token and hmac.compare_digest(token, settings.admin_token))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Allow the request only with the configured admin token (the API is off without one)."""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Admin API is disabled")
+    if not valid_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.post("/maintenance", response_model=MaintenanceResult)
+async def maintain_database(full_check: bool = Query(False)):
+    """
+    Run database maintenance now (optimize, analyze, vacuum, integrity check).
+    """
+    report = await run_in_threadpool(run_maintenance, full_check)
+    return report.to_dict()
+
+
+@router.post("/backup", response_model=BackupResult)
+async def backup(pages_per_step: int = Query(256, ge=1, le=65536)):
+    """
+    Take an online backup of the SQLite database into the backup directory.
+    """
+    try:
+        report = await run_in_threadpool(backup_database, None, pages_per_step)
+    except MaintenanceUnavailable as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BackupFailed as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return report.to_dict()
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """
+    Profiles written by request, job and continuous profiling, newest first.
+    """
+    if not settings.profiles_dir.exists():
+        return []
+    files = sorted(settings.profiles_dir.iterdir(), key=lambda path: path.stat().st_mtime, reverse=True)
+    return [{"name": path.name, "size_bytes": path.stat().st_size} for path in files if path.is_file()]
+
+
+@router.get("/profiles/hot")
+async def hot_functions():
+    """
+    Hottest functions from continuous profiling since its last report.
+    """
+    report = continuous_profiler.report()
+    if report is None:
+        raise HTTPException(status_code=404, detail="Continuous profiling is off (PROFILING_CONTINUOUS_HZ)")
+    return {"current": report, "previous": continuous_profiler.last_report}
+
+
+@router.get("/profiles/{name}")
+async def download_profile(name: str):
+    """
+    Download one profile (speedscope JSON, folded stacks or hot-function report).
+    """
+    path = settings.profiles_dir / name
+    if "/" in name or name.startswith(".") or not path.is_file():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=name)
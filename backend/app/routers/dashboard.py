@@ -1,9 +1,11 @@
 """Dashboard analytics API endpoints."""
 
-from datetime import date, datetime
+from datetime import date, timedelta
+from typing import Optional
 from dateutil.relativedelta import relativedelta
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func, extract
 
@@ -15,42 +17,56 @@ from ..schemas import (
     CategorySpending,
     MonthlySpending,
     CategoryResponse,
+    VendorSpending,
+    DailySpending,
+    WeekdaySpending,
+    SpendingHeatmap,
+    RollingSpendingPoint,
+    RollingSpending,
+    CategoryMonthMatrix,
+    SpendingAnomaly,
 )
+from ..services import response_cache
+from ..services.money import USD_EXPONENT, from_minor
 
 router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
 
 
 @router.get("/summary", response_model=DashboardSummary)
-async def get_dashboard_summary(db: Session = Depends(get_db)):
+async def get_dashboard_summary(request: Request, db: Session = Depends(get_db)):
     """
     Get dashboard summary with current month spending and category breakdown.
     """
+    cached = response_cache.lookup(request, db, "summary")
+    if cached.response is not None:
+        return cached.response
+    
     today = get_eastern_date()
     current_month_start = today.replace(day=1)
     previous_month_start = (current_month_start - relativedelta(months=1))
     previous_month_end = current_month_start - relativedelta(days=1)
     
-    # Current month totals
+    # Current month totals (summed exactly in integer cents)
     current_month_result = db.query(
-        func.coalesce(func.sum(Receipt.amount_usd), 0).label("total"),
+        func.coalesce(func.sum(Receipt.amount_usd_minor), 0).label("total"),
         func.count(Receipt.id).label("count"),
     ).filter(
         Receipt.transaction_date >= current_month_start,
         Receipt.transaction_date <= today,
     ).first()
     
-    current_month_total = float(current_month_result.total or 0)
+    current_month_total = from_minor(int(current_month_result.total or 0), USD_EXPONENT)
     current_month_count = current_month_result.count or 0
     
     # Previous month totals
     previous_month_result = db.query(
-        func.coalesce(func.sum(Receipt.amount_usd), 0).label("total"),
+        func.coalesce(func.sum(Receipt.amount_usd_minor), 0).label("total"),
     ).filter(
         Receipt.transaction_date >= previous_month_start,
         Receipt.transaction_date <= previous_month_end,
     ).first()
     
-    previous_month_total = float(previous_month_result.total or 0)
+    previous_month_total = from_minor(int(previous_month_result.total or 0), USD_EXPONENT)
     
     # Month-over-month change
     if previous_month_total > 0:
@@ -64,7 +80,7 @@ async def get_dashboard_summary(db: Session = Depends(get_db)):
         Category.name,
         Category.icon,
         Category.color,
-        func.coalesce(func.sum(Receipt.amount_usd), 0).label("total"),
+        func.coalesce(func.sum(Receipt.amount_usd_minor), 0).label("total"),
         func.count(Receipt.id).label("count"),
     ).outerjoin(
         Receipt,
@@ -79,30 +95,37 @@ async def get_dashboard_summary(db: Session = Depends(get_db)):
             category_name=cat.name,
             icon=cat.icon,
             color=cat.color,
-            total=float(cat.total or 0),
+            total=from_minor(int(cat.total or 0), USD_EXPONENT),
             count=cat.count or 0,
         )
         for cat in category_data
         if cat.total > 0  # Only include categories with spending
     ]
     
-    return DashboardSummary(
+    summary = DashboardSummary(
         current_month_total=current_month_total,
         current_month_count=current_month_count,
         previous_month_total=previous_month_total,
         month_over_month_change=round(mom_change, 1),
         category_breakdown=category_breakdown,
     )
+    # Already validated on construction; skip response_model re-validation
+    return cached.store(ORJSONResponse(summary.model_dump()))
 
 
 @router.get("/trends", response_model=SpendingTrends)
 async def get_spending_trends(
+    request: Request,
     months: int = 12,
     db: Session = Depends(get_db),
 ):
     """
     Get spending trends for the last N months.
     """
+    cached = response_cache.lookup(request, db, "trends")
+    if cached.response is not None:
+        return cached.response
+    
     today = get_eastern_date()
     start_date = (today.replace(day=1) - relativedelta(months=months - 1))
     
@@ -110,7 +133,7 @@ async def get_spending_trends(
     monthly_data = db.query(
         extract("year", Receipt.transaction_date).label("year"),
         extract("month", Receipt.transaction_date).label("month"),
-        func.coalesce(func.sum(Receipt.amount_usd), 0).label("total"),
+        func.coalesce(func.sum(Receipt.amount_usd_minor), 0).label("total"),
         func.count(Receipt.id).label("count"),
     ).filter(
         Receipt.transaction_date >= start_date,
@@ -129,7 +152,7 @@ async def get_spending_trends(
     end = today.replace(day=1)
     
     monthly_dict = {
-        (int(m.year), int(m.month)): (float(m.total), m.count)
+        (int(m.year), int(m.month)): (from_minor(int(m.total), USD_EXPONENT), m.count)
         for m in monthly_data
     }
     
@@ -144,13 +167,149 @@ async def get_spending_trends(
         ))
         current = current + relativedelta(months=1)
     
-    return SpendingTrends(monthly_data=result)
+    return cached.store(ORJSONResponse(SpendingTrends(monthly_data=result).model_dump()))
+
+
+def resolve_range(start_date: Optional[date], end_date: Optional[date], default_days: int):
+    """Default to the last `default_days` days ending today."""
+    end = end_date or get_eastern_date()
+    start = start_date or end - timedelta(days=default_days - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    return start, end
+
+
+# The snapshot endpoints below are plain functions, which FastAPI runs on its
+# threadpool: the first snapshot load reads the whole receipts table, and the
+# NumPy work would otherwise hold up the event loop too.
+
+
+@router.get("/vendors", response_model=list[VendorSpending])
+def get_vendor_spending(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = Query(20, ge=1, le=500),
+):
+    """
+    Get the vendors with the highest total spending in a date range.
+    """
+    # NumPy is imported on first use of the analytics endpoints
+    from ..services.analytics import get_snapshot
+    
+    vendors = get_snapshot().vendor_totals(start_date, end_date, limit)
+    return ORJSONResponse([VendorSpending(**v).model_dump() for v in vendors])
+
+
+@router.get("/heatmap", response_model=SpendingHeatmap)
+def get_spending_heatmap(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+):
+    """
+    Get daily spending for a calendar heatmap (default: the last year) plus
+    totals by weekday.
+    """
+    from ..services.analytics import cents_to_usd, get_snapshot
+    
+    start, end = resolve_range(start_date, end_date, 365)
+    snapshot = get_snapshot()
+    totals, counts = snapshot.daily_totals(start, end)
+    weekday_totals, weekday_counts = snapshot.weekday_totals(start, end)
+    
+    heatmap = SpendingHeatmap(
+        days=[
+            DailySpending(day=start + timedelta(days=i), total=cents_to_usd(totals[i]), count=int(counts[i]))
+            for i in range(len(totals))
+        ],
+        weekdays=[
+            WeekdaySpending(weekday=i, total=cents_to_usd(weekday_totals[i]), count=int(weekday_counts[i]))
+            for i in range(7)
+        ],
+    )
+    return ORJSONResponse(heatmap.model_dump())
+
+
+@router.get("/rolling", response_model=RollingSpending)
+def get_rolling_spending(
+    days: int = Query(90, ge=1, le=3660),
+    window: int = Query(7, ge=1, le=365),
+):
+    """
+    Get daily spending for the last N days with a trailing moving average.
+    """
+    from ..services.analytics import cents_to_usd, get_snapshot, rolling_average
+    
+    # Start early enough that the first reported day has a full window
+    end = get_eastern_date()
+    start = end - timedelta(days=days - 1)
+    totals, _ = get_snapshot().daily_totals(start - timedelta(days=window - 1), end)
+    averages = rolling_average(totals, window)
+    
+    offset = window - 1
+    rolling = RollingSpending(
+        window_days=window,
+        points=[
+            RollingSpendingPoint(
+                day=start + timedelta(days=i),
+                total=cents_to_usd(totals[offset + i]),
+                average=round(cents_to_usd(averages[offset + i]), 2),
+            )
+            for i in range(days)
+        ],
+    )
+    return ORJSONResponse(rolling.model_dump())
+
+
+@router.get("/category-matrix", response_model=CategoryMonthMatrix)
+def get_category_matrix(
+    months: int = Query(12, ge=1, le=120),
+    db: Session = Depends(get_db),
+):
+    """
+    Get monthly spending per category for the last N months.
+    """
+    from ..services.analytics import NO_CATEGORY, cents_to_usd, get_snapshot
+    
+    today = get_eastern_date()
+    start = today.replace(day=1) - relativedelta(months=months - 1)
+    category_ids, labels, matrix = get_snapshot().category_matrix(start, today)
+    names = dict(db.query(Category.id, Category.name).all())
+    
+    result = CategoryMonthMatrix(
+        months=[f"{year:04d}-{month:02d}" for year, month in labels],
+        category_ids=[None if c == NO_CATEGORY else c for c in category_ids],
+        category_names=[names.get(c, "Uncategorized") for c in category_ids],
+        totals=[[cents_to_usd(cell) for cell in row] for row in matrix],
+    )
+    return ORJSONResponse(result.model_dump())
+
+
+@router.get("/anomalies", response_model=list[SpendingAnomaly])
+def get_spending_anomalies(
+    days: int = Query(90, ge=1, le=3660),
+    threshold: float = Query(3.5, gt=0, description="Robust z-score above which a receipt is flagged"),
+    min_samples: int = Query(10, ge=3, description="Categories with fewer receipts are skipped"),
+):
+    """
+    Flag receipts in the last N days that are unusually large for their category.
+    """
+    from ..services.analytics import get_snapshot
+    
+    end = get_eastern_date()
+    anomalies = get_snapshot().anomalies(end - timedelta(days=days - 1), end, threshold, min_samples)
+    return ORJSONResponse([SpendingAnomaly(**a).model_dump() for a in anomalies])
 
 
 @router.get("/categories", response_model=list[CategoryResponse])
-async def get_categories(db: Session = Depends(get_db)):
+async def get_categories(request: Request, db: Session = Depends(get_db)):
     """
     Get all categories.
     """
+    cached = response_cache.lookup(request, db, "categories")
+    if cached.response is not None:
+        return cached.response
+    
     categories = db.query(Category).order_by(Category.name).all()
-    return categories
+    return cached.store(ORJSONResponse([
+        CategoryResponse.model_validate(category).model_dump() for category in categories
+    ]))
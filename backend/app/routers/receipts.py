@@ -1,33 +1,64 @@
 """Receipt CRUD API endpoints."""
 
-import os
-import uuid
-import shutil
-from datetime import date, datetime
+import io
+import logging
+import mimetypes
+import json
+import asyncio
+from datetime import date
 from pathlib import Path
-from typing import Optional
-from zoneinfo import ZoneInfo
+from typing import Literal, Optional
 
-from PIL import Image, ExifTags
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Header, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, case
 
-from ..database import get_db, SessionLocal
+from ..database import get_db
 from ..config import get_settings
-from ..models import Receipt, Category, get_eastern_date
+from ..models import Receipt, ReceiptFile, ReceiptTombstone, get_eastern_date
 from ..schemas import (
     ReceiptResponse,
     ReceiptUpdate,
     ReceiptCreate,
     ReceiptListResponse,
     UploadResponse,
-    CategoryResponse,
+    ImportSummary,
+    LaneAdmission,
+    QueueStatus,
+    ReceiptChanges,
 )
-from ..services.worker import receipt_queue
+from .admin import valid_admin_token
+from ..services.admission import check_admission, drain_rate
+from ..services.audio import AUDIO_EXTENSIONS, SNIFF_BYTES, sniff_audio_mime
+from ..services.events import broker, publish_receipt, publish_receipt_deleted
+from ..services.fx_backfill import convert_later, immediate_usd
+from ..services.export import (
+    MEDIA_TYPES,
+    check_format,
+    export_filename,
+    export_receipts,
+)
+from ..services.job_queue import LANES
+from ..services.metrics import UPLOADS_REJECTED
+from ..services import response_cache, storage
+from ..services.storage import store_upload
+from ..services.search import receipt_search_filter
+from ..services.serialization import receipt_row_to_dict, receipt_rows_query
+from ..services.sync import InvalidSyncToken, get_changes, prune_tombstones
+from ..services.tracing import tracer
+from ..services.worker import enqueue_receipt, receipt_queue
 
 router = APIRouter(prefix="/api/receipts", tags=["receipts"])
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Processing lanes clients may request (see services/job_queue.LANES)
+Lane = Literal["interactive", "bulk", "background"]
+
+# Seconds between keepalive comments on idle event streams
+EVENT_KEEPALIVE_SECONDS = 15
 
 
 def ensure_receipts_dir():
@@ -35,6 +66,28 @@ def ensure_receipts_dir():
     settings.receipts_dir.mkdir(parents=True, exist_ok=True)
 
 
+def admit(lane: str) -> None:
+    """Refuse with 429 and Retry-After if the backlog ahead of the lane is over its limits."""
+    admission = check_admission(lane, receipt_queue.status(), drain_rate.per_second())
+    if not admission.accepting:
+        UPLOADS_REJECTED.labels(lane=lane, reason=admission.reason).inc()
+        raise HTTPException(
+            status_code=429,
+            detail=f"Processing queue is busy ({admission.backlog} receipts waiting); retry in {admission.retry_after_seconds}s",
+            headers={"Retry-After": str(admission.retry_after_seconds)},
+        )
+
+
+def load_receipt(db: Session, receipt_id: str) -> Optional[Receipt]:
+    """Load a receipt together with its category in a single query."""
+    return (
+        db.query(Receipt)
+        .options(joinedload(Receipt.category))
+        .filter(Receipt.id == receipt_id)
+        .first()
+    )
+
+
 @router.post("", response_model=ReceiptResponse)
 async def create_receipt_manual(
     receipt_data: ReceiptCreate,
@@ -43,32 +96,30 @@ async def create_receipt_manual(
     """
     Create a receipt manually without an image.
     """
-    from ..services.currency import convert_to_usd
-    
-    # Calculate USD amount if currency is provided
-    amount_usd = None
-    if receipt_data.amount:
-        amount_usd = await convert_to_usd(
-            receipt_data.amount,
-            receipt_data.currency or "USD",
-            receipt_data.transaction_date or get_eastern_date()
-        )
+    # Non-USD amounts are converted by the FX backfill job after the response
+    amount_usd = immediate_usd(receipt_data.amount, receipt_data.currency)
     
     # Create receipt record
     receipt = Receipt(
         image_path="manual_entry",
         status="completed",
         vendor=receipt_data.vendor,
+        currency=receipt_data.currency,
         amount=receipt_data.amount,
         amount_usd=amount_usd,
-        currency=receipt_data.currency,
         transaction_date=receipt_data.transaction_date or get_eastern_date(),
         category_id=receipt_data.category_id
     )
     
     db.add(receipt)
-    db.commit()
-    db.refresh(receipt)
+    with tracer.start_as_current_span("db.commit"):
+        db.flush()
+        receipt_id = receipt.id  # Read before the commit expires it
+        db.commit()
+    if amount_usd is None:
+        convert_later()
+    receipt = load_receipt(db, receipt_id)
+    publish_receipt(receipt, "receipt.created")
     
     return receipt
 
@@ -76,6 +127,7 @@ async def create_receipt_manual(
 @router.post("/upload", response_model=UploadResponse)
 async def upload_receipt(
     file: UploadFile = File(...),
+    lane: Lane = Query("interactive", description="Processing lane; offline syncs should use 'bulk'"),
     db: Session = Depends(get_db),
 ):
     """
@@ -88,23 +140,14 @@ async def upload_receipt(
             status_code=400,
             detail=f"Invalid file type. Allowed: {', '.join(allowed_types)}",
         )
+    admit(lane)
     
     ensure_receipts_dir()
     
-    # Generate path based on YYYY/MM/DD
-    today = get_eastern_date()
-    date_path = settings.receipts_dir / f"{today.year}/{today.month:02d}/{today.day:02d}"
-    date_path.mkdir(parents=True, exist_ok=True)
-    
-    # Generate unique filename
-    ext = Path(file.filename).suffix or ".jpg"
-    unique_name = f"{uuid.uuid4()}{ext}"
-    file_path = date_path / unique_name
-    
-    # Save uploaded file
+    # Save into the content-addressed store, capturing metadata in the same pass
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        with tracer.start_as_current_span("receipt.save_file"):
+            file_path, metadata = store_upload(file.file, Path(file.filename).suffix or ".jpg")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
     
@@ -114,15 +157,20 @@ async def upload_receipt(
         status="processing",
         vendor="Processing...",
         amount=0.0,
-        currency="USD"
+        currency="USD",
+        file=metadata.to_model(),
     )
     
     db.add(receipt)
-    db.commit()
-    db.refresh(receipt)
+    with tracer.start_as_current_span("db.commit"):
+        db.flush()
+        receipt_id = receipt.id  # Read before the commit expires it
+        db.commit()
+    receipt = load_receipt(db, receipt_id)
     
     # Queue background task
-    receipt_queue.put((receipt.id, str(file_path)))
+    enqueue_receipt(receipt.id, str(file_path), lane)
+    publish_receipt(receipt, "receipt.created")
     
     return UploadResponse(
         receipt=receipt,
@@ -134,44 +182,30 @@ async def upload_receipt(
 @router.post("/upload-audio", response_model=UploadResponse)
 async def upload_audio_receipt(
     file: UploadFile = File(...),
+    lane: Lane = Query("interactive", description="Processing lane; offline syncs should use 'bulk'"),
     db: Session = Depends(get_db),
 ):
     """
     Upload a receipt audio note and start background processing.
     """
-    # Validate file type
-    allowed_types = {"audio/webm", "audio/wav", "audio/mpeg", "audio/mp4", "audio/x-m4a"}
-    if file.content_type not in allowed_types:
+    # Validate file type from its contents; browsers report varying content types
+    header = await file.read(SNIFF_BYTES)
+    await file.seek(0)
+    mime_type = sniff_audio_mime(header)
+    if not mime_type:
         raise HTTPException(
             status_code=400,
-            detail=f"Invalid file type. Allowed: {', '.join(allowed_types)}",
+            detail=f"Unrecognised audio format. Allowed: {', '.join(AUDIO_EXTENSIONS)}",
         )
+    admit(lane)
     
     ensure_receipts_dir()
     
-    # Generate path based on YYYY/MM/DD
-    today = get_eastern_date()
-    date_path = settings.receipts_dir / f"{today.year}/{today.month:02d}/{today.day:02d}"
-    date_path.mkdir(parents=True, exist_ok=True)
-    
-    # Generate unique filename
-    # Identify extension from content type if filename doesn't have it or as fallback
-    ext_map = {
-        "audio/webm": ".webm",
-        "audio/wav": ".wav", 
-        "audio/mpeg": ".mp3",
-        "audio/mp4": ".m4a",
-        "audio/x-m4a": ".m4a"
-    }
-    ext = Path(file.filename).suffix or ext_map.get(file.content_type, ".webm")
-    
-    unique_name = f"{uuid.uuid4()}{ext}"
-    file_path = date_path / unique_name
-    
-    # Save uploaded file
+    # Save into the content-addressed store; the extension follows the
+    # detected container, not the client's file name
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        with tracer.start_as_current_span("receipt.save_file"):
+            file_path, metadata = store_upload(file.file, AUDIO_EXTENSIONS[mime_type])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
     
@@ -186,15 +220,20 @@ async def upload_audio_receipt(
         status="processing",
         vendor="Processing Audio...",
         amount=0.0,
-        currency="USD"
+        currency="USD",
+        file=metadata.to_model(),
     )
     
     db.add(receipt)
-    db.commit()
-    db.refresh(receipt)
+    with tracer.start_as_current_span("db.commit"):
+        db.flush()
+        receipt_id = receipt.id  # Read before the commit expires it
+        db.commit()
+    receipt = load_receipt(db, receipt_id)
     
     # Queue background task
-    receipt_queue.put((receipt.id, str(file_path)))
+    enqueue_receipt(receipt.id, str(file_path), lane)
+    publish_receipt(receipt, "receipt.created")
     
     return UploadResponse(
         receipt=receipt,
@@ -203,8 +242,44 @@ async def upload_audio_receipt(
     )
 
 
+@router.post("/import", response_model=ImportSummary)
+async def import_receipts_file(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "ofx"]] = Query(None, description="Defaults to the file extension"),
+    currency: str = Query("USD", min_length=3, max_length=3, description="Currency for rows that don't name one"),
+):
+    """
+    Bulk import receipts from a CSV export or an OFX/QFX bank statement.
+
+    CSV needs date, vendor (or description/payee) and amount columns;
+    currency, category and memo are optional. OFX credits are skipped, as
+    are rows an earlier import of the same statement already created.
+    Progress is published on the event stream as `import.progress`.
+    """
+    from ..services.importer import detect_format, import_receipts
+    
+    fmt = format or detect_format(file.filename)
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", errors="replace", newline="")
+
+    def report(result):
+        progress = {key: value for key, value in result.to_dict().items() if key != "errors"}
+        broker.publish({"type": "import.progress", "data": {"filename": file.filename, **progress}})
+
+    try:
+        result = await run_in_threadpool(import_receipts, stream, fmt, currency, report)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        stream.detach()
+    if result.unconverted:
+        convert_later()
+    
+    return ORJSONResponse(result.to_dict())
+
+
 @router.get("", response_model=ReceiptListResponse)
 async def list_receipts(
+    request: Request,
     page: int = Query(1, ge=1),
     per_page: int = Query(20, ge=1, le=100),
     category_id: Optional[int] = None,
@@ -216,31 +291,35 @@ async def list_receipts(
     """
     List all receipts with pagination and filtering.
     """
-    query = db.query(Receipt)
+    cached = response_cache.lookup(request, db, "receipts")
+    if cached.response is not None:
+        return cached.response
+    
+    filters = []
     
     # Apply filters
     if category_id:
-        query = query.filter(Receipt.category_id == category_id)
+        filters.append(Receipt.category_id == category_id)
     if start_date:
-        query = query.filter(Receipt.transaction_date >= start_date)
+        filters.append(Receipt.transaction_date >= start_date)
     if end_date:
-        query = query.filter(Receipt.transaction_date <= end_date)
+        filters.append(Receipt.transaction_date <= end_date)
     
-    # Apply search query
+    # Apply search query (index-backed where the engine supports it)
     if q:
-        search_filter = (
-            Receipt.vendor.ilike(f"%{q}%") | 
-            Receipt.raw_ocr_text.ilike(f"%{q}%")
-        )
-        query = query.filter(search_filter)
+        filters.append(receipt_search_filter(q))
     
     # Get total count
-    total = query.count()
+    total = db.query(func.count(Receipt.id)).filter(*filters).scalar()
     
     # Apply pagination with custom sorting
-    # Sort processing receipts first, then by date and creation time
-    receipts = (
-        query.order_by(
+    # Sort processing receipts first, then by date and creation time.
+    # Only the needed columns are selected (category joined in), and rows go
+    # straight to dicts so the page isn't validated twice on the way out.
+    rows = (
+        receipt_rows_query(db)
+        .filter(*filters)
+        .order_by(
             # Processing receipts first (0), then others (1)
             case((Receipt.status == "processing", 0), else_=1),
             Receipt.transaction_date.desc(),
@@ -253,12 +332,114 @@ async def list_receipts(
     
     pages = (total + per_page - 1) // per_page  # Ceiling division
     
-    return ReceiptListResponse(
-        items=receipts,
-        total=total,
-        page=page,
-        per_page=per_page,
-        pages=pages,
+    return cached.store(ORJSONResponse({
+        "items": [receipt_row_to_dict(row) for row in rows],
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "pages": pages,
+    }))
+
+
+@router.get("/changes", response_model=ReceiptChanges)
+async def list_receipt_changes(
+    since: Optional[str] = Query(None, description="Sync token from the previous response"),
+    limit: int = Query(500, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """
+    Get receipts created, updated or deleted since a sync token.
+
+    Omit `since` for the initial full pull. Keep calling with `next_token`
+    while `has_more` is true. If `reset` is true the token had expired and
+    the client should rebuild its local copy from this response.
+    """
+    try:
+        changes = get_changes(db, since, limit)
+    except InvalidSyncToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ORJSONResponse(changes)
+
+
+@router.get("/queue", response_model=QueueStatus)
+async def get_queue_status():
+    """
+    Get queued and running receipt counts per processing lane, and whether
+    each lane currently accepts uploads (with the Retry-After it would get).
+    """
+    lanes = receipt_queue.status()
+    rate = drain_rate.per_second()
+    admission = {lane: check_admission(lane, lanes, rate) for lane in LANES}
+    return QueueStatus(
+        workers=settings.worker_concurrency,
+        lanes=lanes,
+        drain_rate_per_minute=round(rate * 60, 2),
+        admission={
+            lane: LaneAdmission(
+                accepting=a.accepting,
+                backlog=a.backlog,
+                estimated_wait_seconds=a.estimated_wait_seconds,
+                retry_after_seconds=a.retry_after_seconds,
+            )
+            for lane, a in admission.items()
+        },
+    )
+
+
+@router.get("/export")
+async def export_receipts_file(
+    format: Literal["csv", "jsonl", "parquet"] = "csv",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    category_id: Optional[int] = None,
+    include_images: bool = Query(False, description="Zip the export together with receipt images"),
+):
+    """
+    Download receipts as CSV, JSONL or Parquet, optionally zipped with images.
+
+    The file is streamed from a database cursor, so exports of any size use
+    constant memory.
+    """
+    try:
+        check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = export_filename(format, include_images)
+    return StreamingResponse(
+        export_receipts(format, start_date, end_date, category_id, include_images),
+        media_type=MEDIA_TYPES["zip" if include_images else format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/events")
+async def receipt_events(request: Request):
+    """
+    Stream receipt changes as Server-Sent Events.
+
+    Emits `receipt.created`, `receipt.updated` and `receipt.deleted` events
+    whose data is the receipt payload (or `{"id": ...}` for deletions).
+    """
+    queue = broker.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+        finally:
+            broker.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -267,7 +448,7 @@ async def get_receipt(receipt_id: str, db: Session = Depends(get_db)):
     """
     Get a single receipt by ID.
     """
-    receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
+    receipt = load_receipt(db, receipt_id)
     if not receipt:
         raise HTTPException(status_code=404, detail="Receipt not found")
     return receipt
@@ -282,9 +463,7 @@ async def update_receipt(
     """
     Update receipt data (manual override).
     """
-    from ..services.currency import convert_to_usd
-    
-    receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
+    receipt = load_receipt(db, receipt_id)
     if not receipt:
         raise HTTPException(status_code=404, detail="Receipt not found")
     
@@ -293,17 +472,50 @@ async def update_receipt(
     for field, value in update_dict.items():
         setattr(receipt, field, value)
     
-    # Recalculate USD amount if amount or currency changed
+    # Recalculate USD amount if amount or currency changed (in the background
+    # unless no rate is needed)
     if 'amount' in update_dict or 'currency' in update_dict:
-        if receipt.amount:
-            receipt.amount_usd = await convert_to_usd(
-                receipt.amount,
-                receipt.currency or "USD",
-                receipt.transaction_date
-            )
+        receipt.amount_usd = immediate_usd(receipt.amount, receipt.currency)
+    
+    needs_conversion = receipt.amount_usd_minor is None  # Read before the commit expires it
+    with tracer.start_as_current_span("db.commit"):
+        db.commit()
+    if needs_conversion:
+        convert_later()
+    receipt = load_receipt(db, receipt_id)
+    publish_receipt(receipt)
+    return receipt
+
+
+@router.post("/{receipt_id}/reprocess", response_model=ReceiptResponse)
+async def reprocess_receipt(
+    receipt_id: str,
+    lane: Lane = Query("background"),
+    profile: bool = Query(False),
+    x_admin_token: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Re-run extraction for an existing receipt image or audio note.
+    
+    With profile=true (and the admin token) the extraction is profiled.
+    """
+    if profile and not valid_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Profiling needs a valid X-Admin-Token")
+    receipt = load_receipt(db, receipt_id)
+    if not receipt:
+        raise HTTPException(status_code=404, detail="Receipt not found")
+    if receipt.image_path == "manual_entry" or not storage.exists(receipt.image_path):
+        raise HTTPException(status_code=400, detail="Receipt has no file to re-extract")
+    admit(lane)
+    
+    receipt.status = "processing"
+    with tracer.start_as_current_span("db.commit"):
+        db.commit()
+    receipt = load_receipt(db, receipt_id)
     
-    db.commit()
-    db.refresh(receipt)
+    enqueue_receipt(receipt.id, receipt.image_path, lane, profile=profile)
+    publish_receipt(receipt)
     return receipt
 
 
@@ -316,30 +528,70 @@ async def delete_receipt(receipt_id: str, db: Session = Depends(get_db)):
     if not receipt:
         raise HTTPException(status_code=404, detail="Receipt not found")
     
-    # Delete image file
-    if receipt.image_path:
-        image_path = Path(receipt.image_path)
-        image_path.unlink(missing_ok=True)
-    
+    image_path = receipt.image_path
     db.delete(receipt)
-    db.commit()
+    db.add(ReceiptTombstone(receipt_id=receipt_id))  # Receipt ids are never reused
+    prune_tombstones(db)
+    with tracer.start_as_current_span("db.commit"):
+        db.commit()
+    publish_receipt_deleted(receipt_id)
+    
+    # Only now that the row is gone: delete the stored file unless another
+    # receipt has the same content (storage GC catches anything missed here)
+    try:
+        storage.release_file(db, receipt_id, image_path)
+    except OSError as e:
+        logger.warning(f"Could not delete file of receipt {receipt_id}: {e}")
     
     return {"message": "Receipt deleted successfully"}
 
 
 @router.get("/image/{receipt_id}")
-async def get_receipt_image(receipt_id: str, db: Session = Depends(get_db)):
+async def get_receipt_image(
+    receipt_id: str,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
     """
     Get receipt image file.
     """
     from fastapi.responses import FileResponse
     
-    receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
-    if not receipt:
+    row = (
+        db.query(Receipt.image_path, ReceiptFile.mime_type, ReceiptFile.sha256)
+        .outerjoin(ReceiptFile, ReceiptFile.receipt_id == Receipt.id)
+        .filter(Receipt.id == receipt_id)
+        .first()
+    )
+    if not row:
         raise HTTPException(status_code=404, detail="Receipt not found")
     
-    image_path = Path(receipt.image_path)
-    if not image_path.exists():
+    found = storage.locate(row.image_path)
+    if not found:
         raise HTTPException(status_code=404, detail="Image file not found")
-    
-    return FileResponse(image_path)
+    path, gzipped = found
+    media_type = row.mime_type or mimetypes.guess_type(row.image_path)[0]
+    
+    headers = {}
+    if row.sha256 is not None:
+        # Files are never rewritten, so the content hash is a strong validator
+        etag = f'"{row.sha256}"'
+        if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers={"ETag": etag})
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    
+    if not gzipped:
+        return FileResponse(path, media_type=media_type, headers=headers)
+    
+    # Cold tier: let the client decompress if it can, otherwise do it here
+    headers["Vary"] = "Accept-Encoding"
+    if "gzip" in (accept_encoding or ""):
+        return FileResponse(path, media_type=media_type, headers={**headers, "Content-Encoding": "gzip"})
+    
+    def decompressed():
+        with storage.open_blob(row.image_path) as f:
+            while chunk := f.read(64 * 1024):
+                yield chunk
+    
+    return StreamingResponse(decompressed(), media_type=media_type, headers=headers)
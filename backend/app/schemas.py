@@ -1,7 +1,7 @@
 """Pydantic schemas for request/response validation."""
 
 from datetime import date, datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic import BaseModel, Field
 
 
@@ -76,6 +76,15 @@ class ReceiptListResponse(BaseModel):
     pages: int
 
 
+class ReceiptChanges(BaseModel):
+    """Receipts changed since a sync token, for offline replicas."""
+    items: List[ReceiptResponse]
+    deleted: List[str]
+    next_token: str
+    has_more: bool
+    reset: bool = False  # Token expired; client should discard its replica first
+
+
 # ============ Upload Response ============
 
 class UploadResponse(BaseModel):
@@ -85,6 +94,51 @@ class UploadResponse(BaseModel):
     message: str
 
 
+# ============ Import Schemas ============
+
+class ImportRowError(BaseModel):
+    """A row that could not be imported."""
+    row: int
+    error: str
+
+
+class ImportSummary(BaseModel):
+    """Outcome of a bulk CSV/OFX import."""
+    imported: int
+    skipped: int
+    duplicates: int
+    failed: int
+    unconverted: int
+    errors: List[ImportRowError]
+    duration_seconds: float
+
+
+# ============ Queue Schemas ============
+
+class LaneStatus(BaseModel):
+    """Depth and activity of a single processing lane."""
+    queued: int
+    running: int
+    max_running: int
+    oldest_age_seconds: float
+
+
+class LaneAdmission(BaseModel):
+    """Whether a lane accepts uploads right now, and how long its backlog needs."""
+    accepting: bool
+    backlog: int  # Jobs queued in this lane and the lanes served before it
+    estimated_wait_seconds: Optional[float] = None  # None until a drain rate is measured
+    retry_after_seconds: int = 0
+
+
+class QueueStatus(BaseModel):
+    """Processing queue status across all lanes."""
+    workers: int
+    lanes: Dict[str, LaneStatus]
+    drain_rate_per_minute: float = 0.0
+    admission: Dict[str, LaneAdmission] = {}
+
+
 # ============ Dashboard Schemas ============
 
 class CategorySpending(BaseModel):
@@ -117,3 +171,86 @@ class DashboardSummary(BaseModel):
 class SpendingTrends(BaseModel):
     """Historical spending trends."""
     monthly_data: List[MonthlySpending]
+
+
+# ============ Analytics Schemas ============
+
+class VendorSpending(BaseModel):
+    """Total spending at one vendor."""
+    vendor: str
+    total: float
+    count: int
+
+
+class DailySpending(BaseModel):
+    """Spending on one calendar day."""
+    day: date
+    total: float
+    count: int
+
+
+class WeekdaySpending(BaseModel):
+    """Spending on one day of the week (0 = Monday)."""
+    weekday: int
+    total: float
+    count: int
+
+
+class SpendingHeatmap(BaseModel):
+    """Calendar heatmap plus weekday totals for a date range."""
+    days: List[DailySpending]
+    weekdays: List[WeekdaySpending]
+
+
+class RollingSpendingPoint(BaseModel):
+    """Daily spending with its trailing average."""
+    day: date
+    total: float
+    average: float
+
+
+class RollingSpending(BaseModel):
+    """Daily spending with a trailing moving average."""
+    window_days: int
+    points: List[RollingSpendingPoint]
+
+
+class CategoryMonthMatrix(BaseModel):
+    """Monthly spending per category: totals[month][category]."""
+    months: List[str]  # "YYYY-MM"
+    category_ids: List[Optional[int]]  # None for uncategorized receipts
+    category_names: List[str]
+    totals: List[List[float]]
+
+
+class SpendingAnomaly(BaseModel):
+    """A receipt unusually large for its category."""
+    id: str
+    vendor: str
+    transaction_date: date
+    amount_usd: float
+    category_id: Optional[int] = None
+    typical_amount_usd: float
+    score: float
+
+
+# ============ Admin Schemas ============
+
+class MaintenanceResult(BaseModel):
+    """Outcome of a database maintenance run."""
+    steps: Dict[str, float]  # Step name -> seconds
+    freed_pages: int
+    fts_merge_steps: int
+    integrity: List[str]
+    yielded_seconds: float
+    healthy: bool
+
+
+class BackupResult(BaseModel):
+    """A completed online backup."""
+    path: str
+    size_bytes: int
+    pages: int
+    duration_seconds: float
+    restarts: int
+    vacuumed: bool
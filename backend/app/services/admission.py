@@ -0,0 +1,112 @@
+"""
+Admission control for uploads, based on the processing backlog.
+
+An upload is refused (the router answers 429) when the work queued ahead of
+it passes settings.admission_max_queue_depth jobs, or its oldest job has
+waited longer than settings.admission_max_queue_age_seconds. Lanes are
+served in priority order, so "ahead" means the upload's own lane plus the
+lanes above it: interactive captures are still admitted while a bulk sync
+is backed up.
+
+Retry-After comes from the measured drain rate: receipts the workers (in
+any process) finished during the last admission_drain_window_seconds,
+counted from Receipt.processed_at.
+"""
+import math
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import func
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import Receipt, get_eastern_time
+from .job_queue import LANES
+
+settings = get_settings()
+
+RETRY_AFTER_MIN_SECONDS = 5
+RETRY_AFTER_MAX_SECONDS = 3600
+# Used when nothing finished within the window, so there is no rate to go by
+RETRY_AFTER_UNKNOWN_SECONDS = 60
+
+# Uploads arrive in bursts; don't count completions for every one of them
+DRAIN_RATE_CACHE_SECONDS = 5.0
+
+
+class DrainRateMeter:
+    """Receipts processed per second over the drain window, cached briefly."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rate = 0.0
+        self._measured_at = 0.0
+
+    def per_second(self) -> float:
+        with self._lock:
+            if time.monotonic() - self._measured_at < DRAIN_RATE_CACHE_SECONDS:
+                return self._rate
+        window = settings.admission_drain_window_seconds
+        db = SessionLocal()
+        try:
+            finished = db.query(func.count(Receipt.id)).filter(
+                Receipt.processed_at >= get_eastern_time() - timedelta(seconds=window)
+            ).scalar() or 0
+        finally:
+            db.close()
+        with self._lock:
+            self._rate = finished / window
+            self._measured_at = time.monotonic()
+            return self._rate
+
+
+drain_rate = DrainRateMeter()
+
+
+@dataclass
+class Admission:
+    """Admission decision for one lane."""
+    lane: str
+    accepting: bool
+    backlog: int
+    oldest_age_seconds: float
+    estimated_wait_seconds: Optional[float]
+    retry_after_seconds: int = 0
+    reason: Optional[str] = None  # "depth" or "age" when refused
+
+
+def clamp_retry_after(seconds: Optional[float]) -> int:
+    if seconds is None:
+        return RETRY_AFTER_UNKNOWN_SECONDS
+    return min(RETRY_AFTER_MAX_SECONDS, max(RETRY_AFTER_MIN_SECONDS, math.ceil(seconds)))
+
+
+def check_admission(lane: str, lanes: Dict[str, dict], rate: float) -> Admission:
+    """
+    Decide whether a job for `lane` may be queued.
+
+    `lanes` is the queue's status() and `rate` the drain rate in jobs per
+    second (drain_rate.per_second()).
+    """
+    ahead = LANES[: LANES.index(lane) + 1]
+    backlog = sum(lanes[name]["queued"] for name in ahead)
+    oldest = max(lanes[name]["oldest_age_seconds"] for name in ahead)
+    wait = backlog / rate if rate else None
+    admission = Admission(lane, True, backlog, oldest, round(wait, 1) if wait is not None else None)
+
+    max_depth = settings.admission_max_queue_depth
+    max_age = settings.admission_max_queue_age_seconds
+    if max_depth and backlog >= max_depth:
+        # Until enough jobs finish to bring the backlog under the limit
+        admission.reason = "depth"
+        excess = backlog - max_depth + 1
+        admission.retry_after_seconds = clamp_retry_after(excess / rate if rate else None)
+    elif max_age and oldest >= max_age:
+        # Until the overdue jobs ahead are worked off
+        admission.reason = "age"
+        admission.retry_after_seconds = clamp_retry_after(wait)
+    admission.accepting = admission.reason is None
+    return admission
@@ -0,0 +1,371 @@
+"""
+Vectorized spending analytics over an in-memory columnar snapshot.
+
+The snapshot keeps one NumPy array per column (transaction day, category,
+vendor code, USD amount in cents) plus the receipt id, about 60 bytes per
+receipt. It is loaded once and then kept fresh incrementally from
+`updated_at` and the deletion tombstones, so dashboard questions become
+array group-bys (np.bincount) instead of a SQL scan each.
+
+Only the first load happens on a request. After that, a request that finds
+the snapshot due for a refresh starts one on a helper thread and answers
+from the current arrays; the database is read outside the lock the queries
+take, which is held only while the changes are applied.
+"""
+import logging
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import Receipt, ReceiptTombstone, get_eastern_time
+from .money import USD_EXPONENT
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+EPOCH = date(1970, 1, 1)
+
+# Changes committed slightly out of updated_at order are caught by
+# re-reading this much history on every refresh (re-applying is harmless)
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+LOAD_BATCH_SIZE = 50_000
+
+NO_CATEGORY = -1
+
+
+def day_number(value: date) -> int:
+    return (value - EPOCH).days
+
+
+def day_date(number: int) -> date:
+    return EPOCH + timedelta(days=int(number))
+
+
+def cents_to_usd(cents) -> float:
+    return float(cents) / 10 ** USD_EXPONENT
+
+
+class ReceiptSnapshot:
+    """
+    Columnar copy of the receipts table used by the analytics queries.
+
+    Rows are updated in place when a receipt changes and masked out when it
+    is deleted; deleted slots are compacted away once they make up a
+    quarter of the arrays.
+    """
+
+    COLUMNS = {
+        "ids": "S36",
+        "days": np.int32,
+        "categories": np.int32,
+        "vendors": np.int32,
+        "cents": np.int64,
+        "valid": np.bool_,
+    }
+
+    def __init__(self):
+        self.lock = threading.RLock()  # Held by queries and while applying changes
+        self._update_lock = threading.Lock()  # One load or refresh at a time
+        self.size = 0
+        self.arrays: Dict[str, np.ndarray] = {name: np.empty(0, dtype) for name, dtype in self.COLUMNS.items()}
+        self.vendor_names: List[str] = []
+        self._vendor_codes: Dict[str, int] = {}
+        self._watermark = None  # Latest updated_at / deleted_at seen
+        self._refreshed_at = 0.0
+        self._order: Optional[np.ndarray] = None  # argsort of ids[:_sorted_size]
+        self._sorted_size = 0
+        self.loaded = False
+
+    # ============ Maintenance ============
+
+    def due(self) -> bool:
+        return time.monotonic() - self._refreshed_at >= settings.analytics_refresh_seconds
+
+    def ensure_fresh(self) -> None:
+        """Load on first use, then refresh at most every analytics_refresh_seconds."""
+        with self._update_lock:
+            if not self.due():
+                return
+            started = time.perf_counter()
+            if not self.loaded:
+                with self.lock:
+                    self._load()
+                logger.info(f"Loaded analytics snapshot of {self.size} receipts in {time.perf_counter() - started:.2f}s")
+            else:
+                self._refresh()
+            self._refreshed_at = time.monotonic()
+
+    def refresh_in_background(self) -> None:
+        """Start ensure_fresh() on a helper thread if a refresh is due and none is running."""
+        if self.due() and not self._update_lock.locked():
+            threading.Thread(target=self.ensure_fresh, name="analytics-refresh", daemon=True).start()
+
+    def _columns(self):
+        return (
+            Receipt.id,
+            Receipt.transaction_date,
+            Receipt.created_at,
+            Receipt.category_id,
+            Receipt.vendor,
+            Receipt.amount_usd_minor,
+            Receipt.updated_at,
+        )
+
+    def _encode(self, rows) -> Dict[str, np.ndarray]:
+        """Convert result rows to column arrays."""
+        count = len(rows)
+        ids = np.array([row.id.encode() for row in rows], dtype="S36")
+        days = np.fromiter(
+            (day_number(row.transaction_date or row.created_at.date()) for row in rows), np.int32, count
+        )
+        categories = np.fromiter(
+            (NO_CATEGORY if row.category_id is None else row.category_id for row in rows), np.int32, count
+        )
+        vendors = np.fromiter((self._vendor_code(row.vendor) for row in rows), np.int32, count)
+        cents = np.fromiter((row.amount_usd_minor or 0 for row in rows), np.int64, count)
+        return {"ids": ids, "days": days, "categories": categories, "vendors": vendors, "cents": cents}
+
+    def _vendor_code(self, vendor: Optional[str]) -> int:
+        name = (vendor or "").strip() or "Unknown"
+        code = self._vendor_codes.get(name)
+        if code is None:
+            code = self._vendor_codes[name] = len(self.vendor_names)
+            self.vendor_names.append(name)
+        return code
+
+    def _load(self) -> None:
+        db = SessionLocal()
+        try:
+            self._watermark = get_eastern_time()
+            query = db.query(*self._columns()).execution_options(stream_results=True, yield_per=LOAD_BATCH_SIZE)
+            chunks = []
+            batch = []
+            for row in query:
+                batch.append(row)
+                if len(batch) >= LOAD_BATCH_SIZE:
+                    chunks.append(self._encode(batch))
+                    batch = []
+            if batch:
+                chunks.append(self._encode(batch))
+        finally:
+            db.close()
+
+        for name, dtype in self.COLUMNS.items():
+            if name == "valid":
+                continue
+            self.arrays[name] = np.concatenate([c[name] for c in chunks]) if chunks else np.empty(0, dtype)
+        self.size = len(self.arrays["ids"])
+        self.arrays["valid"] = np.ones(self.size, np.bool_)
+        self._order = None
+        self.loaded = True
+
+    def _refresh(self) -> None:
+        since = self._watermark - REFRESH_OVERLAP
+        db = SessionLocal()
+        try:
+            watermark = get_eastern_time()
+            changed = db.query(*self._columns()).filter(Receipt.updated_at >= since).all()
+            deleted = [
+                t.receipt_id for t in
+                db.query(ReceiptTombstone.receipt_id).filter(ReceiptTombstone.deleted_at >= since)
+            ]
+        finally:
+            db.close()
+
+        with self.lock:
+            if changed:
+                self._upsert(self._encode(changed))
+            if deleted:
+                positions = self._positions(np.array([i.encode() for i in deleted], dtype="S36"))
+                self.arrays["valid"][positions[positions >= 0]] = False
+            self._watermark = watermark
+
+            live = int(self.arrays["valid"][:self.size].sum())
+            if self.size and live < 0.75 * self.size:
+                self._compact()
+
+    def _positions(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Row position of each id, or -1 when absent.
+
+        Ids are looked up by binary search in a cached sort order; rows
+        appended since the last sort are checked separately until they make
+        up a tenth of the snapshot, then the order is rebuilt.
+        """
+        positions = np.full(len(ids), -1, np.int64)
+        if self._order is None or self.size - self._sorted_size > max(1024, self.size // 10):
+            self._sorted_size = self.size
+            self._order = np.argsort(self.arrays["ids"][:self.size], kind="stable")
+
+        if self._sorted_size:
+            sorted_ids = self.arrays["ids"][:self._sorted_size]
+            found = np.minimum(np.searchsorted(sorted_ids, ids, sorter=self._order), self._sorted_size - 1)
+            candidates = self._order[found]
+            hit = sorted_ids[candidates] == ids
+            positions[hit] = candidates[hit]
+
+        if self.size > self._sorted_size:
+            tail = {
+                key: self._sorted_size + offset
+                for offset, key in enumerate(self.arrays["ids"][self._sorted_size:self.size].tolist())
+            }
+            for i in np.nonzero(positions < 0)[0]:
+                positions[i] = tail.get(bytes(ids[i]), -1)
+        return positions
+
+    def _upsert(self, rows: Dict[str, np.ndarray]) -> None:
+        positions = self._positions(rows["ids"])
+        existing = positions >= 0
+        for name, values in rows.items():
+            self.arrays[name][positions[existing]] = values[existing]
+        self.arrays["valid"][positions[existing]] = True
+
+        new = ~existing
+        added = int(new.sum())
+        if not added:
+            return
+        self._reserve(self.size + added)
+        end = self.size + added
+        for name, values in rows.items():
+            self.arrays[name][self.size:end] = values[new]
+        self.arrays["valid"][self.size:end] = True
+        self.size = end
+
+    def _reserve(self, capacity: int) -> None:
+        """Grow the arrays geometrically so appends are amortized O(1)."""
+        current = len(self.arrays["ids"])
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, int(current * 1.5) + 1024)
+        for name, array in self.arrays.items():
+            grown = np.zeros(new_capacity, array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.arrays[name] = grown
+
+    def _compact(self) -> None:
+        keep = self.arrays["valid"][:self.size]
+        for name, array in self.arrays.items():
+            self.arrays[name] = array[:self.size][keep].copy()
+        self.size = len(self.arrays["ids"])
+        self._order = None
+
+    # ============ Queries ============
+
+    def _select(self, start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, np.ndarray]:
+        """Live rows with start <= day <= end. Caller holds the lock."""
+        mask = self.arrays["valid"][:self.size].copy()
+        days = self.arrays["days"][:self.size]
+        if start:
+            mask &= days >= day_number(start)
+        if end:
+            mask &= days <= day_number(end)
+        return {name: array[:self.size][mask] for name, array in self.arrays.items() if name != "valid"}
+
+    def vendor_totals(self, start: Optional[date], end: Optional[date], limit: int) -> List[dict]:
+        with self.lock:
+            rows = self._select(start, end)
+            size = len(self.vendor_names)
+            totals = np.bincount(rows["vendors"], weights=rows["cents"], minlength=size)
+            counts = np.bincount(rows["vendors"], minlength=size)
+            top = np.argsort(-totals, kind="stable")[:limit]
+            return [
+                {"vendor": self.vendor_names[code], "total": cents_to_usd(totals[code]), "count": int(counts[code])}
+                for code in top if counts[code]
+            ]
+
+    def daily_totals(self, start: date, end: date) -> Tuple[np.ndarray, np.ndarray]:
+        """(cents, counts) per calendar day from start to end inclusive."""
+        with self.lock:
+            rows = self._select(start, end)
+            offsets = rows["days"] - day_number(start)
+            length = (end - start).days + 1
+            totals = np.bincount(offsets, weights=rows["cents"], minlength=length)
+            counts = np.bincount(offsets, minlength=length)
+            return totals, counts
+
+    def weekday_totals(self, start: Optional[date], end: Optional[date]) -> Tuple[np.ndarray, np.ndarray]:
+        """(cents, counts) per weekday, Monday first."""
+        with self.lock:
+            rows = self._select(start, end)
+            # 1970-01-01 was a Thursday (weekday 3)
+            weekdays = (rows["days"] + 3) % 7
+            return np.bincount(weekdays, weights=rows["cents"], minlength=7), np.bincount(weekdays, minlength=7)
+
+    def category_matrix(self, start: date, end: date) -> Tuple[List[int], List[Tuple[int, int]], np.ndarray]:
+        """Category ids, (year, month) labels and a months x categories matrix of cents."""
+        with self.lock:
+            rows = self._select(start, end)
+            months = rows["days"].astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+            first = (start.year - 1970) * 12 + start.month - 1
+            last = (end.year - 1970) * 12 + end.month - 1
+            category_ids, category_index = np.unique(rows["categories"], return_inverse=True)
+            width = len(category_ids)
+            cells = (months - first) * width + category_index
+            matrix = np.bincount(cells, weights=rows["cents"], minlength=(last - first + 1) * width)
+            labels = [(1970 + m // 12, m % 12 + 1) for m in range(first, last + 1)]
+            return [int(c) for c in category_ids], labels, matrix.reshape(last - first + 1, width)
+
+    def anomalies(self, start: date, end: date, threshold: float, min_samples: int) -> List[dict]:
+        """
+        Receipts unusually large for their category.
+
+        Uses the robust z-score 0.6745 * (x - median) / MAD within each
+        category, which a few huge outliers cannot skew the way a mean and
+        standard deviation would.
+        """
+        with self.lock:
+            rows = self._select(start, end)
+            flagged = []
+            for category in np.unique(rows["categories"]):
+                in_category = rows["categories"] == category
+                cents = rows["cents"][in_category]
+                if len(cents) < min_samples:
+                    continue
+                median = np.median(cents)
+                mad = np.median(np.abs(cents - median))
+                if mad == 0:
+                    continue
+                scores = 0.6745 * (cents - median) / mad
+                hits = np.nonzero(scores > threshold)[0]
+                ids = rows["ids"][in_category]
+                days = rows["days"][in_category]
+                vendors = rows["vendors"][in_category]
+                for i in hits:
+                    flagged.append({
+                        "id": ids[i].decode(),
+                        "vendor": self.vendor_names[vendors[i]],
+                        "transaction_date": day_date(days[i]),
+                        "amount_usd": cents_to_usd(cents[i]),
+                        "category_id": None if category == NO_CATEGORY else int(category),
+                        "typical_amount_usd": cents_to_usd(median),
+                        "score": round(float(scores[i]), 2),
+                    })
+            flagged.sort(key=lambda item: item["score"], reverse=True)
+            return flagged
+
+
+# Process-wide snapshot shared by the dashboard endpoints
+snapshot = ReceiptSnapshot()
+
+
+def get_snapshot() -> ReceiptSnapshot:
+    """The shared snapshot, loaded on first use and refreshed off the request path after that."""
+    if snapshot.loaded:
+        snapshot.refresh_in_background()
+    else:
+        snapshot.ensure_fresh()
+    return snapshot
+
+
+def rolling_average(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over `window` values (shorter at the start of the series)."""
+    sums = np.cumsum(values, dtype=np.float64)
+    sums[window:] = sums[window:] - sums[:-window]
+    lengths = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / lengths
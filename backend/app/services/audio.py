@@ -0,0 +1,168 @@
+"""
+Audio note preprocessing before LLM extraction.
+
+Recordings are identified by their magic bytes rather than their file name,
+probed with ffprobe, and transcoded with ffmpeg to mono 16 kHz Opus (or
+FLAC) with leading and trailing silence trimmed and the duration capped.
+Speech needs nothing more, and the result is a fraction of the size of a
+browser's 48 kHz stereo WebM. Without ffmpeg the original file is sent
+with its detected mime type.
+"""
+import json
+import logging
+import shutil
+import subprocess
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from ..config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Enough of the file to recognise every supported container
+SNIFF_BYTES = 64
+
+# Longest a transcode may run before the original is sent instead
+FFMPEG_TIMEOUT_SECONDS = 120
+
+# Output container, extension and mime type per codec
+CODECS = {
+    "opus": (["-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-f", "ogg"], ".ogg", "audio/ogg"),
+    "flac": (["-c:a", "flac", "-f", "flac"], ".flac", "audio/flac"),
+}
+
+AUDIO_EXTENSIONS = {
+    "audio/wav": ".wav",
+    "audio/ogg": ".ogg",
+    "audio/webm": ".webm",
+    "audio/mpeg": ".mp3",
+    "audio/mp4": ".m4a",
+    "audio/flac": ".flac",
+    "audio/aac": ".aac",
+}
+
+
+@dataclass
+class PreparedAudio:
+    """Audio ready to send to the LLM."""
+    path: Path
+    mime_type: str
+    duration_seconds: Optional[float] = None
+    temporary: bool = False  # Delete after use
+
+    def cleanup(self) -> None:
+        if self.temporary:
+            self.path.unlink(missing_ok=True)
+
+
+def sniff_audio_mime(header: bytes) -> Optional[str]:
+    """Identify an audio container from its first bytes, or None if unknown."""
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "audio/wav"
+    if header[:4] == b"OggS":
+        return "audio/ogg"
+    if header[:4] == b"\x1a\x45\xdf\xa3":  # EBML (WebM/Matroska)
+        return "audio/webm"
+    if header[:4] == b"fLaC":
+        return "audio/flac"
+    if header[4:8] == b"ftyp":
+        return "audio/mp4"
+    if header[:3] == b"ID3":
+        return "audio/mpeg"
+    if len(header) >= 2 and header[0] == 0xFF:
+        if header[1] & 0xF6 == 0xF0:  # ADTS sync word, layer 0
+            return "audio/aac"
+        if header[1] & 0xE0 == 0xE0:  # MPEG audio frame sync
+            return "audio/mpeg"
+    return None
+
+
+def sniff_file_mime(path: Path) -> Optional[str]:
+    with open(path, "rb") as f:
+        return sniff_audio_mime(f.read(SNIFF_BYTES))
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which(settings.ffmpeg_path) is not None
+
+
+def probe_duration(path: Path) -> Optional[float]:
+    """Duration in seconds according to ffprobe, or None if it can't tell."""
+    if shutil.which(settings.ffprobe_path) is None:
+        return None
+    try:
+        result = subprocess.run(
+            [settings.ffprobe_path, "-v", "error", "-print_format", "json", "-show_format", str(path)],
+            capture_output=True, check=True, timeout=30,
+        )
+        return float(json.loads(result.stdout)["format"]["duration"])
+    except (subprocess.SubprocessError, KeyError, ValueError) as e:
+        logger.warning(f"ffprobe could not read {path}: {e}")
+        return None
+
+
+def silence_filter(threshold_db: float) -> str:
+    """Trim leading silence, then trailing silence by trimming the reversed stream."""
+    # Sound shorter than start_duration (a click) doesn't end the silence.
+    # ffmpeg 6.1+ trims that start_duration of sound along with the
+    # silence; start_silence keeps it
+    trim = (
+        f"silenceremove=start_periods=1:start_duration=0.2:start_silence=0.2"
+        f":start_threshold={threshold_db}dB"
+    )
+    return f"{trim},areverse,{trim},areverse"
+
+
+def prepare_audio(path: str, timeout: float = FFMPEG_TIMEOUT_SECONDS) -> PreparedAudio:
+    """
+    Transcode a recording for extraction, sending the original if ffmpeg
+    fails or takes longer than `timeout` seconds.
+
+    Raises:
+        ValueError: If the file is not a recognised audio container
+    """
+    source = Path(path)
+    mime_type = sniff_file_mime(source)
+    if not mime_type:
+        raise ValueError(f"Unrecognised audio format: {source.name}")
+
+    if not ffmpeg_available():
+        logger.warning("ffmpeg not found; sending audio without preprocessing")
+        return PreparedAudio(source, mime_type)
+
+    duration = probe_duration(source)
+    if duration and duration > settings.audio_max_duration_seconds:
+        logger.warning(
+            f"Audio {source.name} is {duration:.0f}s; only the first "
+            f"{settings.audio_max_duration_seconds:.0f}s will be processed"
+        )
+
+    codec_args, suffix, output_mime = CODECS.get(settings.audio_codec, CODECS["opus"])
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        output = Path(tmp.name)
+    command = [
+        settings.ffmpeg_path, "-v", "error", "-y",
+        "-t", str(settings.audio_max_duration_seconds), "-i", str(source),
+        "-vn", "-ac", "1", "-ar", "16000",
+        "-af", silence_filter(settings.audio_silence_threshold_db),
+        *codec_args, str(output),
+    ]
+    try:
+        subprocess.run(command, capture_output=True, check=True, timeout=timeout)
+    except subprocess.CalledProcessError as e:
+        output.unlink(missing_ok=True)
+        logger.warning(f"ffmpeg failed for {source.name}, sending original: {e.stderr.decode(errors='replace')[-500:]}")
+        return PreparedAudio(source, mime_type, duration)
+    except subprocess.TimeoutExpired:
+        output.unlink(missing_ok=True)
+        logger.warning(f"ffmpeg timed out for {source.name}, sending original")
+        return PreparedAudio(source, mime_type, duration)
+
+    logger.info(
+        f"Transcoded {source.name} ({source.stat().st_size} bytes, {mime_type}) "
+        f"to {output.stat().st_size} bytes {output_mime}"
+    )
+    return PreparedAudio(output, output_mime, min(duration or 0, settings.audio_max_duration_seconds) or None, temporary=True)
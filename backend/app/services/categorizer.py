@@ -1,9 +1,11 @@
 """Auto-categorization service based on vendor names."""
 
-from typing import Optional
+import re
+from typing import Dict, Iterable, Optional
 from sqlalchemy.orm import Session
 
-from ..models import Category
+from ..database import SessionLocal
+from ..models import Category, DEFAULT_CATEGORIES
 
 
 # Keyword mappings for auto-categorization
@@ -49,6 +51,23 @@ CATEGORY_KEYWORDS = {
 # List of valid categories for external use (e.g., LLM prompting)
 VALID_CATEGORIES = list(CATEGORY_KEYWORDS.keys())
 
+# One alternation per category, checked in CATEGORY_KEYWORDS order
+CATEGORY_PATTERNS = {
+    name: re.compile("|".join(re.escape(keyword) for keyword in keywords))
+    for name, keywords in CATEGORY_KEYWORDS.items()
+}
+
+
+def match_category_name(vendor_name: Optional[str]) -> Optional[str]:
+    """Name of the first category with a keyword contained in the vendor name."""
+    if not vendor_name:
+        return None
+    vendor_lower = vendor_name.lower()
+    for category_name, pattern in CATEGORY_PATTERNS.items():
+        if pattern.search(vendor_lower):
+            return category_name
+    return None
+
 
 def auto_categorize(vendor_name: str, db: Session) -> Optional[Category]:
     """
@@ -61,20 +80,7 @@ def auto_categorize(vendor_name: str, db: Session) -> Optional[Category]:
     Returns:
         Category object if matched, None otherwise
     """
-    if not vendor_name:
-        return None
-    
-    vendor_lower = vendor_name.lower()
-    
-    # Find matching category
-    matched_category_name = None
-    for category_name, keywords in CATEGORY_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword in vendor_lower:
-                matched_category_name = category_name
-                break
-        if matched_category_name:
-            break
+    matched_category_name = match_category_name(vendor_name)
     
     if matched_category_name:
         category = db.query(Category).filter(
@@ -83,3 +89,35 @@ def auto_categorize(vendor_name: str, db: Session) -> Optional[Category]:
         return category
     
     return None
+
+
+def categorize_vendors(vendor_names: Iterable[Optional[str]], db: Session) -> Dict[str, Optional[int]]:
+    """
+    Categorize many vendors at once.
+    
+    Each distinct vendor is matched once and category ids are looked up in a
+    single query, so a batch costs one round trip however large it is.
+    
+    Returns:
+        Mapping of vendor name to category id (None when unmatched)
+    """
+    category_ids = {name: category_id for category_id, name in db.query(Category.id, Category.name)}
+    return {
+        vendor: category_ids.get(match_category_name(vendor))
+        for vendor in set(vendor_names)
+        if vendor
+    }
+
+
+def seed_categories():
+    """Seed default categories if they don't exist."""
+    db = SessionLocal()
+    try:
+        existing = db.query(Category).count()
+        if existing == 0:
+            for cat_data in DEFAULT_CATEGORIES:
+                category = Category(**cat_data)
+                db.add(category)
+            db.commit()
+    finally:
+        db.close()
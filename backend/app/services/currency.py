@@ -1,16 +1,22 @@
 """
 Currency conversion service using Frankfurter API.
 """
+import asyncio
 import logging
-from datetime import date
-from typing import Optional, Dict
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional, Tuple
 
 import httpx
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from ..config import get_settings
+from .tracing import tracer
+
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
-FRANKFURTER_API_URL = "https://api.frankfurter.app"
+FRANKFURTER_API_URL = settings.fx_api_url
 
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
@@ -31,16 +37,20 @@ async def get_exchange_rate(from_currency: str, to_currency: str = "USD", date_o
         url = f"{FRANKFURTER_API_URL}/{date_str}"
         params = {"from": from_currency, "to": to_currency}
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, timeout=10.0)
-            response.raise_for_status()
-            data = response.json()
-            
-            if "rates" in data and to_currency in data["rates"]:
-                return float(data["rates"][to_currency])
-            
-            logger.error(f"Rate for {to_currency} not found in response: {data}")
-            return None
+        with tracer.start_as_current_span(
+            "fx.get_exchange_rate",
+            attributes={"fx.from": from_currency, "fx.to": to_currency, "fx.date": date_str},
+        ):
+            async with httpx.AsyncClient() as client:
+                response = await client.get(url, params=params, timeout=10.0)
+                response.raise_for_status()
+                data = response.json()
+                
+                if "rates" in data and to_currency in data["rates"]:
+                    return float(data["rates"][to_currency])
+                
+                logger.error(f"Rate for {to_currency} not found in response: {data}")
+                return None
 
     except httpx.HTTPStatusError as e:
         if e.response.status_code == 404:
@@ -71,3 +81,82 @@ async def convert_to_usd(amount: float, currency: str, date_obj: Optional[date]
     except Exception as e:
         logger.error(f"Failed to convert {amount} {currency} to USD: {e}")
         return None
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+async def get_exchange_rate_series(
+    from_currency: str, start: date, end: date, to_currency: str = "USD"
+) -> Dict[date, float]:
+    """
+    Get daily rates for a date range in one request.
+
+    Frankfurter only publishes rates for business days; weekends and
+    holidays take the previous published rate (the same rate the single-date
+    endpoint returns), and dates before the first published rate take that
+    first rate. Dates after today use the latest rate.
+    """
+    today = date.today()
+    end = min(end, today)
+    start = min(start, end)
+    url = f"{FRANKFURTER_API_URL}/{start.isoformat()}..{end.isoformat()}"
+    params = {"from": from_currency, "to": to_currency}
+
+    with tracer.start_as_current_span(
+        "fx.get_exchange_rate_series",
+        attributes={"fx.from": from_currency, "fx.to": to_currency, "fx.start": start.isoformat(), "fx.end": end.isoformat()},
+    ):
+        async with httpx.AsyncClient() as client:
+            response = await client.get(url, params=params, timeout=30.0)
+            if response.status_code == 404:
+                logger.warning(f"Currency {from_currency} not supported by Frankfurter API.")
+                return {}
+            response.raise_for_status()
+            data = response.json()
+
+    published = {
+        date.fromisoformat(day): float(rates[to_currency])
+        for day, rates in data.get("rates", {}).items()
+        if to_currency in rates
+    }
+    if not published:
+        return {}
+
+    series = {}
+    rate = published[min(published)]
+    day = start
+    while day <= end:
+        rate = published.get(day, rate)
+        series[day] = rate
+        day += timedelta(days=1)
+    return series
+
+
+async def get_usd_rates(pairs: Iterable[Tuple[str, date]]) -> Dict[Tuple[str, date], Optional[float]]:
+    """
+    Resolve USD rates for many (currency, date) pairs with one request per currency.
+
+    Pairs whose rate cannot be fetched map to None.
+    """
+    dates_by_currency = defaultdict(set)
+    for currency, day in pairs:
+        dates_by_currency[currency].add(day)
+
+    async def fetch(currency: str, days: set) -> Dict[date, float]:
+        if currency == "USD":
+            return {day: 1.0 for day in days}
+        try:
+            return await get_exchange_rate_series(currency, min(days), max(days))
+        except Exception as e:
+            logger.error(f"Failed to fetch {currency} rates for {min(days)}..{max(days)}: {e}")
+            return {}
+
+    currencies = list(dates_by_currency)
+    results = await asyncio.gather(*(fetch(c, dates_by_currency[c]) for c in currencies))
+
+    rates = {}
+    today = date.today()
+    for currency, series in zip(currencies, results):
+        latest = series[max(series)] if series else None
+        for day in dates_by_currency[currency]:
+            rates[(currency, day)] = series.get(day, latest if day > today else None)
+    return rates
@@ -0,0 +1,85 @@
+"""
+Deadlines for worker jobs and the calls they make.
+
+A job gets settings.job_deadline_seconds in total, and each stage that
+waits on something outside the process (the LLM, ffmpeg, the FX provider)
+gets the smaller of its own limit and whatever is left of the job's.
+Blocking SDK calls are run on a helper thread by call_with_timeout(): when
+the limit passes the caller stops waiting and gets DeadlineExceeded, and
+the abandoned call's result is discarded whenever it arrives. Python can't
+interrupt a thread blocked on a socket, but the worker is free again at the
+deadline instead of whenever (if ever) the provider answers, and the LLM
+client's own HTTP timeout (llm.get_client) ends the abandoned call later.
+"""
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+from .metrics import DEADLINES_EXCEEDED
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """A stage or job ran past its deadline."""
+
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"{stage} exceeded its {seconds:.0f}s deadline")
+        self.stage = stage
+        self.seconds = seconds
+
+
+class JobDeadline:
+    """The time budget of one job, shared by its stages."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def check(self, stage: str) -> None:
+        """Raise DeadlineExceeded if the job is already out of time before `stage`."""
+        if self.remaining() <= 0:
+            DEADLINES_EXCEEDED.labels(stage="job").inc()
+            raise DeadlineExceeded(f"job (before {stage})", self.seconds)
+
+    def budget(self, stage: str, stage_seconds: float) -> float:
+        """Seconds `stage` may take: its own limit, capped by what's left of the job."""
+        self.check(stage)
+        return min(stage_seconds, self.remaining()) if stage_seconds > 0 else self.remaining()
+
+
+def call_with_timeout(stage: str, timeout: Optional[float], fn: Callable[[], T]) -> T:
+    """
+    Run a blocking call, giving up on it after `timeout` seconds.
+
+    The call runs on a daemon thread so a hung connection can't keep the
+    process alive at shutdown. Exceptions raised by the call are re-raised
+    in the caller. No timeout runs the call inline.
+    """
+    if timeout is None:
+        return fn()
+    if timeout <= 0:
+        DEADLINES_EXCEEDED.labels(stage=stage).inc()
+        raise DeadlineExceeded(stage, 0)
+
+    outcome = {}
+    done = threading.Event()
+
+    def run():
+        try:
+            outcome["result"] = fn()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=run, name=f"deadline-{stage}", daemon=True).start()
+    if not done.wait(timeout):
+        DEADLINES_EXCEEDED.labels(stage=stage).inc()
+        raise DeadlineExceeded(stage, timeout)
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
@@ -0,0 +1,146 @@
+"""
+Pub/sub for receipt change notifications.
+
+The worker thread and request handlers publish events; Server-Sent Events
+subscribers (one asyncio queue per connection) receive them on the event
+loop that created the subscription.
+
+Changes committed by other processes (standalone workers, other uvicorn
+workers, the CLI) are picked up by the relay: while this process has
+subscribers it checks the data version every
+settings.event_relay_interval_seconds and, when it moved, publishes the
+receipts changed and deleted since its last check. Receipts this process
+published itself arrive twice; clients apply events idempotently.
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+
+from ..config import get_settings
+from ..database import SessionLocal, current_data_version
+from ..schemas import ReceiptResponse
+from . import scheduler
+from .metrics import EVENT_SUBSCRIBERS
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Events buffered per subscriber before the oldest are dropped
+SUBSCRIBER_BUFFER = 100
+
+
+class ReceiptEventBroker:
+    """Fan-out of receipt events to any number of async subscribers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        """Register a subscriber on the running event loop."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+            EVENT_SUBSCRIBERS.set(len(self._subscribers))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._subscribers = {(loop, q) for loop, q in self._subscribers if q is not queue}
+            EVENT_SUBSCRIBERS.set(len(self._subscribers))
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Deliver an event to every subscriber. Safe to call from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                # Loop already closed; the subscriber is going away
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: Dict[str, Any]) -> None:
+        """Enqueue without blocking, dropping the oldest event for slow clients."""
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+broker = ReceiptEventBroker()
+
+
+def publish_receipt(receipt, event_type: str = "receipt.updated") -> None:
+    """Publish a receipt's current state. Never raises into the caller."""
+    try:
+        payload = ReceiptResponse.model_validate(receipt).model_dump(mode="json")
+        broker.publish({"type": event_type, "data": payload})
+    except Exception as e:
+        logger.warning(f"Failed to publish {event_type} for receipt {receipt.id}: {e}")
+
+
+def publish_receipt_deleted(receipt_id: str) -> None:
+    """Publish a deletion so clients can drop the receipt locally."""
+    broker.publish({"type": "receipt.deleted", "data": {"id": receipt_id}})
+
+
+class DatabaseEventRelay:
+    """Publishes receipt changes committed by any process, found through the data version."""
+
+    # Receipts read per delta query
+    BATCH_SIZE = 200
+
+    def __init__(self, broker: ReceiptEventBroker):
+        self.broker = broker
+        self.token: Optional[str] = None  # Sync position of the last change relayed
+        self.version: Optional[int] = None
+
+    def poll(self) -> int:
+        """Publish changes made since the last poll; returns the number of events."""
+        from .sync import current_token, decode_token, get_changes
+
+        if not self.broker.subscriber_count:
+            # Nobody listening: start from scratch when someone subscribes
+            self.token = self.version = None
+            return 0
+
+        published = 0
+        db = SessionLocal()
+        try:
+            version = current_data_version(db)
+            if self.token is None:
+                self.token, self.version = current_token(db), version
+                return 0
+            while version != self.version:
+                since = decode_token(self.token)
+                changes = get_changes(db, self.token, self.BATCH_SIZE)
+                for item in changes["items"]:
+                    created = since is None or item["created_at"] > since.issued_at
+                    self.broker.publish({
+                        "type": "receipt.created" if created else "receipt.updated",
+                        "data": ReceiptResponse.model_validate(item).model_dump(mode="json"),
+                    })
+                for receipt_id in changes["deleted"]:
+                    self.broker.publish({"type": "receipt.deleted", "data": {"id": receipt_id}})
+                published += len(changes["items"]) + len(changes["deleted"])
+                self.token = changes["next_token"] or self.token
+                if not changes["has_more"]:
+                    self.version = version
+        finally:
+            db.close()
+        return published
+
+
+relay = DatabaseEventRelay(broker)
+
+
+def start_relay() -> None:
+    """Relay changes committed by other processes to this process's subscribers."""
+    scheduler.schedule("event-relay", settings.event_relay_interval_seconds, relay.poll)
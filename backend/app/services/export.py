@@ -0,0 +1,265 @@
+"""
+Streaming receipt export to CSV, JSONL and Parquet, optionally zipped with images.
+
+Rows are read through a server-side cursor in batches and encoded batch by
+batch, so memory stays flat however many receipts are exported. Every
+format is produced as an iterator of byte chunks that can feed an HTTP
+response or a file.
+"""
+import csv
+import io
+import shutil
+import time
+import zipfile
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import orjson
+
+from ..database import SessionLocal
+from ..models import Receipt
+from . import storage
+from .money import USD_EXPONENT, from_minor
+from .serialization import receipt_rows_query
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+
+EXPORT_FIELDS = (
+    "id",
+    "transaction_date",
+    "vendor",
+    "amount",
+    "currency",
+    "amount_usd",
+    "category",
+    "status",
+    "raw_ocr_text",
+    "image_path",
+    "created_at",
+    "updated_at",
+)
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "zip": "application/zip",
+}
+
+# Rows fetched per round trip (and per Parquet row group)
+BATCH_SIZE = 5000
+
+
+class ChunkSink:
+    """
+    Write-only file object that hands written bytes back through drain().
+
+    zipfile and pyarrow write into it as if it were a (non-seekable) file,
+    and the export generators yield whatever has accumulated.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def receipt_filters(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    category_id: Optional[int] = None,
+) -> list:
+    filters = []
+    if start_date:
+        filters.append(Receipt.transaction_date >= start_date)
+    if end_date:
+        filters.append(Receipt.transaction_date <= end_date)
+    if category_id:
+        filters.append(Receipt.category_id == category_id)
+    return filters
+
+
+def image_archive_name(receipt_id: str, image_path: str) -> str:
+    return f"images/{receipt_id}{Path(image_path).suffix}"
+
+
+def iter_export_batches(filters: list, relative_images: bool = False) -> Iterator[List[Dict[str, Any]]]:
+    """Yield export rows in batches of BATCH_SIZE using a streaming cursor."""
+    db = SessionLocal()
+    try:
+        query = (
+            receipt_rows_query(db)
+            .filter(*filters)
+            .order_by(Receipt.transaction_date, Receipt.created_at, Receipt.id)
+            .execution_options(stream_results=True, yield_per=BATCH_SIZE)
+        )
+        batch = []
+        for row in query:
+            batch.append({
+                "id": row.id,
+                "transaction_date": row.transaction_date,
+                "vendor": row.vendor,
+                "amount": from_minor(row.amount_minor, row.currency_exponent),
+                "currency": row.currency,
+                "amount_usd": from_minor(row.amount_usd_minor, USD_EXPONENT),
+                "category": row.category_name,
+                "status": row.status,
+                "raw_ocr_text": row.raw_ocr_text,
+                "image_path": image_archive_name(row.id, row.image_path) if relative_images else row.image_path,
+                "created_at": row.created_at,
+                "updated_at": row.updated_at,
+            })
+            if len(batch) >= BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        db.close()
+
+
+def encode_csv(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_jsonl(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    for batch in batches:
+        yield b"".join(orjson.dumps(row) + b"\n" for row in batch)
+
+
+def parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.string()),
+        ("transaction_date", pa.date32()),
+        ("vendor", pa.string()),
+        ("amount", pa.float64()),
+        ("currency", pa.string()),
+        ("amount_usd", pa.float64()),
+        ("category", pa.string()),
+        ("status", pa.string()),
+        ("raw_ocr_text", pa.string()),
+        ("image_path", pa.string()),
+        ("created_at", pa.timestamp("us")),
+        ("updated_at", pa.timestamp("us")),
+    ])
+
+
+def encode_parquet(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    """Write each batch as a row group and yield the bytes as they are produced."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = ChunkSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd") as writer:
+        for batch in batches:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+ENCODERS = {"csv": encode_csv, "jsonl": encode_jsonl, "parquet": encode_parquet}
+
+
+def check_format(fmt: str) -> None:
+    """
+    Raises:
+        ValueError: If the format is unknown
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Expected one of: {', '.join(EXPORT_FORMATS)}")
+
+
+def export_filename(fmt: str, include_images: bool = False) -> str:
+    return f"receipts.{'zip' if include_images else fmt}"
+
+
+def export_receipts(
+    fmt: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    category_id: Optional[int] = None,
+    include_images: bool = False,
+) -> Iterator[bytes]:
+    """
+    Stream matching receipts in `fmt`, or a zip of that file plus images.
+
+    Call check_format() first; errors raised once streaming has started
+    cannot be reported to an HTTP client.
+    """
+    filters = receipt_filters(start_date, end_date, category_id)
+    encode = ENCODERS[fmt]
+
+    if not include_images:
+        yield from encode(iter_export_batches(filters))
+        return
+
+    yield from _zip_export(fmt, encode, filters)
+
+
+def _zip_export(fmt: str, encode, filters: list) -> Iterator[bytes]:
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(f"receipts.{fmt}", mode="w", force_zip64=True) as entry:
+            for chunk in encode(iter_export_batches(filters, relative_images=True)):
+                entry.write(chunk)
+                yield sink.drain()
+
+        # Second pass for the files; images and audio are already compressed
+        db = SessionLocal()
+        try:
+            paths = (
+                db.query(Receipt.id, Receipt.image_path)
+                .filter(*filters)
+                .order_by(Receipt.transaction_date, Receipt.created_at, Receipt.id)
+                .execution_options(stream_results=True, yield_per=BATCH_SIZE)
+            )
+            for receipt_id, image_path in paths:
+                found = image_path and storage.locate(image_path)
+                if not found:
+                    continue
+                arcname = image_archive_name(receipt_id, image_path)
+                if found[1]:
+                    # Cold-tier blob: store it decompressed
+                    entry_info = zipfile.ZipInfo(arcname, date_time=time.localtime(found[0].stat().st_mtime)[:6])
+                    entry_info.compress_type = zipfile.ZIP_STORED
+                    with storage.open_blob(image_path) as src, archive.open(entry_info, mode="w", force_zip64=True) as entry:
+                        shutil.copyfileobj(src, entry)
+                else:
+                    archive.write(found[0], arcname=arcname, compress_type=zipfile.ZIP_STORED)
+                yield sink.drain()
+        finally:
+            db.close()
+    yield sink.drain()
@@ -0,0 +1,134 @@
+"""
+Ingest-time metadata for uploaded receipt files.
+
+Uploads are written to disk in one streaming pass that also hashes them,
+counts their size and keeps the first few hundred KB. Container headers
+(image dimensions, EXIF orientation and capture time, audio format) are
+parsed from that prefix only, so pixels are never decoded. The result is
+stored in the receipt_files table, which the worker and the image endpoint
+read instead of reopening the file.
+"""
+import hashlib
+import io
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from ..models import ReceiptFile
+from .audio import sniff_audio_mime
+
+logger = logging.getLogger(__name__)
+
+# JPEG EXIF (APP1) is capped at 64 KB; leave room for other APPn segments
+HEADER_BYTES = 256 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+EXIF_DATETIME_FORMAT = "%Y:%m:%d %H:%M:%S"
+
+
+@dataclass
+class FileMetadata:
+    """What is known about a file without decoding it."""
+    mime_type: str
+    size_bytes: int
+    sha256: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    orientation: Optional[int] = None
+    captured_at: Optional[datetime] = None
+
+    def to_model(self) -> ReceiptFile:
+        """Row for receipt_files; attach it with `receipt.file = ...`."""
+        return ReceiptFile(
+            mime_type=self.mime_type,
+            size_bytes=self.size_bytes,
+            sha256=self.sha256,
+            width=self.width,
+            height=self.height,
+            orientation=self.orientation,
+            captured_at=self.captured_at,
+        )
+
+
+def sniff_image_mime(header: bytes) -> Optional[str]:
+    """Identify an image container from its first bytes, or None if unknown."""
+    if header[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if header[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[4:8] == b"ftyp" and header[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return None
+
+
+def parse_exif_datetime(value) -> Optional[datetime]:
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.strptime(value.strip("\x00 "), EXIF_DATETIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def read_image_header(header: bytes, metadata: FileMetadata) -> None:
+    """Fill in dimensions and EXIF fields; Image.open only parses headers."""
+    from PIL import ExifTags, Image
+    
+    try:
+        with Image.open(io.BytesIO(header)) as img:
+            metadata.width, metadata.height = img.size
+            exif = img.getexif()
+            metadata.orientation = exif.get(ExifTags.Base.Orientation)
+            metadata.captured_at = (
+                parse_exif_datetime(exif.get_ifd(ExifTags.IFD.Exif).get(ExifTags.Base.DateTimeOriginal))
+                or parse_exif_datetime(exif.get(ExifTags.Base.DateTime))
+            )
+    except Exception as e:
+        # Unsupported format, or headers larger than HEADER_BYTES
+        logger.debug(f"Could not parse {metadata.mime_type} header: {e}")
+
+
+def describe(header: bytes, size_bytes: int, sha256: str) -> FileMetadata:
+    """Build the metadata of a file from its leading bytes, size and hash."""
+    image_mime = sniff_image_mime(header)
+    metadata = FileMetadata(
+        mime_type=image_mime or sniff_audio_mime(header) or "application/octet-stream",
+        size_bytes=size_bytes,
+        sha256=sha256,
+    )
+    if image_mime:
+        read_image_header(header, metadata)
+    return metadata
+
+
+def save_upload(source: BinaryIO, destination: Path) -> FileMetadata:
+    """Copy an upload to disk, hashing it and keeping its header on the way."""
+    digest = hashlib.sha256()
+    header = bytearray()
+    size = 0
+    with open(destination, "wb") as out:
+        while chunk := source.read(CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+            if len(header) < HEADER_BYTES:
+                header += chunk[:HEADER_BYTES - len(header)]
+            out.write(chunk)
+    return describe(bytes(header), size, digest.hexdigest())
+
+
+def read_file_metadata(path: Path) -> FileMetadata:
+    """Metadata for a file already on disk (receipts uploaded before this table)."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        header = f.read(HEADER_BYTES)
+        digest.update(header)
+        size += len(header)
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+    return describe(header, size, digest.hexdigest())
@@ -0,0 +1,185 @@
+"""
+Background conversion of receipt amounts to USD.
+
+Request handlers and the worker don't call the FX provider: a receipt whose
+USD amount needs a rate is saved with amount_usd NULL and the backfill job
+is triggered. The job (also run every settings.fx_backfill_interval_seconds
+to retry anything the provider couldn't answer) collects every receipt
+missing a USD amount, fetches the rates for all their (currency, date)
+pairs with one time-series request per currency, and writes the results
+with a single batched UPDATE. Rows edited in the meantime are left for the
+next run, as are batches whose rates don't arrive within
+settings.fx_timeout_seconds (the lookups are cancelled).
+"""
+import asyncio
+import logging
+from dataclasses import asdict, dataclass
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import bindparam, func
+from sqlalchemy.orm import joinedload
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import Receipt, get_eastern_date, get_eastern_time
+from . import scheduler
+from .events import publish_receipt
+from .metrics import DEADLINES_EXCEEDED, FX_BACKFILL_RECEIPTS
+from .money import USD_EXPONENT, to_minor
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "fx-backfill"
+
+# Receipts per rate lookup and UPDATE
+BATCH_SIZE = 2000
+
+# Beyond this many conversions per run, clients pick changes up through
+# delta sync rather than one event each
+MAX_PUBLISHED_EVENTS = 100
+
+
+@dataclass
+class BackfillReport:
+    """Outcome of one backfill run."""
+    candidates: int = 0
+    converted: int = 0
+    unresolved: int = 0  # No rate available yet, or edited meanwhile; retried next run
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def immediate_usd(amount: Optional[float], currency: Optional[str]) -> Optional[float]:
+    """USD amount when no rate is needed (USD or zero amounts), else None to convert later."""
+    if not amount:
+        return 0.0
+    if (currency or "USD") == "USD":
+        return amount
+    return None
+
+
+def convert_later() -> None:
+    """Ask the backfill job to resolve missing USD amounts now (if it runs in this process)."""
+    scheduler.trigger(JOB_NAME)
+
+
+def _update_statement(include_zero: bool):
+    """UPDATE by id that only applies while the amount and currency are still the ones converted."""
+    table = Receipt.__table__
+    unconverted = table.c.amount_usd_minor.is_(None)
+    if include_zero:
+        unconverted = unconverted | (table.c.amount_usd_minor == 0)
+    return (
+        table.update()
+        .where(
+            table.c.id == bindparam("b_id"),
+            table.c.amount_minor == bindparam("b_amount_minor"),
+            func.coalesce(table.c.currency, "USD") == bindparam("b_currency"),
+            unconverted,
+        )
+        .values(amount_usd_minor=bindparam("b_usd_minor"), updated_at=bindparam("b_now"))
+    )
+
+
+def backfill_usd_amounts(include_zero: bool = False, batch_size: int = BATCH_SIZE) -> BackfillReport:
+    """
+    Convert every receipt missing a USD amount.
+
+    With include_zero, receipts with a non-zero amount but a zero USD
+    amount (what failed conversions used to store) are converted as well.
+    """
+    from .currency import get_usd_rates
+
+    report = BackfillReport()
+    converted_ids = []
+    statement = _update_statement(include_zero)
+    missing = Receipt.amount_usd_minor.is_(None)
+    if include_zero:
+        missing = missing | (Receipt.amount_usd_minor == 0)
+
+    db = SessionLocal()
+    try:
+        last_id = ""
+        while True:
+            rows = (
+                db.query(
+                    Receipt.id, Receipt.amount_minor, Receipt.currency_exponent,
+                    Receipt.currency, Receipt.transaction_date,
+                )
+                .filter(
+                    missing,
+                    Receipt.amount_minor.isnot(None),
+                    Receipt.amount_minor != 0,
+                    Receipt.status != "processing",
+                    Receipt.id > last_id,
+                )
+                .order_by(Receipt.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            last_id = rows[-1].id
+            report.candidates += len(rows)
+
+            today = get_eastern_date()
+            pairs = {(row.currency or "USD", row.transaction_date or today) for row in rows}
+            try:
+                rates = asyncio.run(asyncio.wait_for(get_usd_rates(pairs), settings.fx_timeout_seconds))
+            except asyncio.TimeoutError:
+                DEADLINES_EXCEEDED.labels(stage="fx").inc()
+                logger.warning(f"FX rate lookup for {len(pairs)} currency/date pairs timed out after {settings.fx_timeout_seconds:.0f}s")
+                rates = {}
+
+            now = get_eastern_time()
+            params = []
+            for row in rows:
+                currency = row.currency or "USD"
+                rate = rates.get((currency, row.transaction_date or today))
+                if rate is None:
+                    report.unresolved += 1
+                    continue
+                amount = Decimal(row.amount_minor).scaleb(-row.currency_exponent)
+                params.append({
+                    "b_id": row.id,
+                    "b_amount_minor": row.amount_minor,
+                    "b_currency": currency,
+                    "b_usd_minor": to_minor(amount * Decimal(str(rate)), USD_EXPONENT),
+                    "b_now": now,
+                })
+            if params:
+                converted = db.execute(statement, params).rowcount
+                db.commit()
+                # Rows edited since they were read no longer match and are left for the next run
+                report.converted += converted
+                report.unresolved += len(params) - converted
+                converted_ids.extend(param["b_id"] for param in params)
+
+        if 0 < len(converted_ids) <= MAX_PUBLISHED_EVENTS:
+            receipts = (
+                db.query(Receipt)
+                .options(joinedload(Receipt.category))
+                .filter(Receipt.id.in_(converted_ids))
+                .all()
+            )
+            for receipt in receipts:
+                publish_receipt(receipt)
+    finally:
+        db.close()
+
+    FX_BACKFILL_RECEIPTS.labels(outcome="converted").inc(report.converted)
+    FX_BACKFILL_RECEIPTS.labels(outcome="unresolved").inc(report.unresolved)
+    if report.candidates:
+        logger.info(
+            f"FX backfill converted {report.converted} of {report.candidates} receipts "
+            f"({report.unresolved} without a rate yet)"
+        )
+    return report
+
+
+def start() -> None:
+    """Run the backfill periodically and whenever convert_later() is called."""
+    scheduler.schedule(JOB_NAME, settings.fx_backfill_interval_seconds, backfill_usd_amounts)
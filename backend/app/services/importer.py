@@ -0,0 +1,375 @@
+"""
+Bulk import of receipts from CSV exports and OFX bank statements.
+
+Files are parsed as a stream and handled in batches: the batch's exchange
+rates are fetched with one time-series request per currency, vendors are
+categorized in one pass, and rows are inserted with a single executemany
+and committed together. Rows that fail to parse are reported with their row
+number and skipped; the rest of the file still imports.
+
+Importing the same statement twice doesn't duplicate receipts: each row is
+stored with an import key and rows whose key already exists are skipped.
+OFX transactions are keyed by their bank-assigned FITID. CSV rows have no
+id, so their key is the row's content plus the number of identical rows
+before it in the file; two identical purchases on one day both import.
+
+Rows imported without a USD amount (the rate lookup failed) are left to the
+FX backfill; callers trigger it when ImportResult.unconverted is non-zero.
+"""
+import asyncio
+import csv
+import hashlib
+import logging
+import re
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from dateutil import parser as date_parser
+from sqlalchemy import insert
+
+from ..database import SessionLocal
+from ..models import Category, Receipt, get_eastern_time
+from .categorizer import categorize_vendors
+from .currency import get_usd_rates
+from .metrics import RECEIPTS_IMPORTED
+from .money import USD_EXPONENT, currency_exponent, to_minor
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("csv", "ofx")
+
+# Rows per transaction (and per FX/categorization round)
+IMPORT_BATCH_SIZE = 5000
+
+# Per-row errors returned to the caller; later ones are only counted
+MAX_REPORTED_ERRORS = 500
+
+# Accepted CSV headers (case-insensitive), in order of preference
+CSV_COLUMNS = {
+    "date": ("transaction_date", "date", "transaction date", "posted date", "posting date"),
+    "vendor": ("vendor", "merchant", "payee", "description", "name"),
+    "amount": ("amount", "total", "debit"),
+    "currency": ("currency",),
+    "category": ("category",),
+    "memo": ("memo", "notes", "note"),
+}
+
+OFX_TOKEN = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+ParsedRow = Tuple[int, Dict[str, str]]
+
+
+@dataclass
+class ImportResult:
+    """Running totals for an import; also the final summary."""
+    imported: int = 0
+    skipped: int = 0
+    duplicates: int = 0  # Rows an earlier import already created
+    failed: int = 0
+    unconverted: int = 0  # Imported without a USD amount; left to the FX backfill
+    errors: List[dict] = field(default_factory=list)
+    duration_seconds: float = 0.0
+
+    def add_error(self, row: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": error})
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def detect_format(filename: Optional[str]) -> str:
+    """Guess the import format from a file name (OFX/QFX, otherwise CSV)."""
+    if filename and filename.lower().endswith((".ofx", ".qfx")):
+        return "ofx"
+    return "csv"
+
+
+# ============ Parsing ============
+
+def parse_csv(stream: TextIO) -> Iterator[ParsedRow]:
+    """Yield (row number, fields) for each CSV data row, mapping known headers."""
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if not header:
+        return
+    header = [column.strip().lower() for column in header]
+
+    columns = {}
+    for key, aliases in CSV_COLUMNS.items():
+        for alias in aliases:
+            if alias in header:
+                columns[key] = header.index(alias)
+                break
+    missing = {"date", "vendor", "amount"} - set(columns)
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(sorted(missing))}")
+
+    for row_number, values in enumerate(reader, start=2):
+        if not any(values):
+            continue
+        yield row_number, {
+            key: values[index].strip() if index < len(values) else ""
+            for key, index in columns.items()
+        }
+
+
+def _ofx_tokens(stream: TextIO, chunk_size: int = 65536) -> Iterator[Tuple[bool, str, str]]:
+    """Yield (is_closing, TAG, value) for OFX 1.x (SGML) and 2.x (XML) markup."""
+    buffer = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        buffer += chunk
+        # Keep a trailing partial tag for the next chunk
+        cut = len(buffer) if not chunk else buffer.rfind("<")
+        if cut > 0:
+            for match in OFX_TOKEN.finditer(buffer, 0, cut):
+                yield match.group(1) == "/", match.group(2).upper(), match.group(3).strip()
+            buffer = buffer[cut:]
+        if not chunk:
+            return
+
+
+def parse_ofx(stream: TextIO) -> Iterator[ParsedRow]:
+    """
+    Yield (transaction number, fields) for each <STMTTRN> in an OFX statement.
+
+    Only debits are expenses, so credits are yielded with a `skip` marker.
+    """
+    currency = ""
+    transaction: Optional[Dict[str, str]] = None
+    number = 0
+
+    for closing, tag, value in _ofx_tokens(stream):
+        if tag == "CURDEF" and not closing:
+            currency = value
+        elif tag == "STMTTRN":
+            # SGML statements may leave <STMTTRN> unclosed
+            if transaction is not None:
+                yield number, _ofx_fields(transaction, currency)
+                transaction = None
+            if not closing:
+                number += 1
+                transaction = {}
+        elif tag == "BANKTRANLIST" and closing and transaction is not None:
+            yield number, _ofx_fields(transaction, currency)
+            transaction = None
+        elif transaction is not None and not closing and value:
+            transaction.setdefault(tag, value)
+
+    if transaction is not None:
+        yield number, _ofx_fields(transaction, currency)
+
+
+def _ofx_fields(transaction: Dict[str, str], default_currency: str) -> Dict[str, str]:
+    amount = transaction.get("TRNAMT", "")
+    return {
+        "date": transaction.get("DTPOSTED", "")[:8],
+        "vendor": transaction.get("NAME") or transaction.get("PAYEE") or transaction.get("MEMO", ""),
+        "amount": amount.lstrip("-"),
+        "currency": transaction.get("CURSYM") or default_currency,
+        "memo": transaction.get("MEMO", ""),
+        "fitid": transaction.get("FITID", ""),
+        "skip": "credit" if amount and not amount.startswith("-") else "",
+    }
+
+
+PARSERS = {"csv": parse_csv, "ofx": parse_ofx}
+
+
+# ============ Normalization ============
+
+def parse_amount(value: str) -> Decimal:
+    """Parse '1,234.50', '$12.00', '(12.00)' or '-12' as a positive amount."""
+    cleaned = re.sub(r"[^\d.\-]", "", value)
+    try:
+        return abs(Decimal(cleaned))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount '{value}'")
+
+
+def parse_date(value: str) -> date:
+    if not value:
+        raise ValueError("Missing date")
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        pass
+    try:
+        if re.fullmatch(r"\d{8}", value):
+            return datetime.strptime(value, "%Y%m%d").date()
+        return date_parser.parse(value).date()
+    except (ValueError, OverflowError):
+        raise ValueError(f"Invalid date '{value}'")
+
+
+def normalize_row(fields: Dict[str, str], default_currency: str) -> dict:
+    """
+    Turn parsed fields into receipt column values.
+
+    Raises:
+        ValueError: If a required field is missing or malformed
+    """
+    vendor = fields.get("vendor", "")[:255]
+    if not vendor:
+        raise ValueError("Missing vendor")
+    currency = (fields.get("currency") or default_currency).upper()
+    if not re.fullmatch(r"[A-Z]{3}", currency):
+        raise ValueError(f"Invalid currency '{currency}'")
+    return {
+        "vendor": vendor,
+        "amount": parse_amount(fields.get("amount", "")),
+        "currency": currency,
+        "transaction_date": parse_date(fields.get("date", "")),
+        "category": fields.get("category", ""),
+        "raw_ocr_text": fields.get("memo") or None,
+        "fitid": fields.get("fitid", ""),
+    }
+
+
+# ============ Import ============
+
+class ReceiptImporter:
+    """Normalizes, enriches and inserts parsed rows batch by batch."""
+
+    def __init__(self, default_currency: str = "USD", progress: Optional[Callable[[ImportResult], None]] = None):
+        self.default_currency = default_currency.upper()
+        self.progress = progress
+        self.result = ImportResult()
+        self._rates: Dict[Tuple[str, date], Optional[float]] = {}
+        self._occurrences: Dict[str, int] = {}  # Identical CSV rows seen so far, by content
+
+    def run(self, rows: Iterator[ParsedRow], fmt: str) -> ImportResult:
+        start = time.perf_counter()
+        db = SessionLocal()
+        try:
+            category_ids = {name.lower(): category_id for category_id, name in db.query(Category.id, Category.name)}
+            batch: List[Tuple[int, dict]] = []
+            for row_number, fields in rows:
+                if fields.get("skip"):
+                    self.result.skipped += 1
+                    continue
+                try:
+                    row = normalize_row(fields, self.default_currency)
+                    row["import_key"] = self._import_key(row)
+                    batch.append((row_number, row))
+                except ValueError as e:
+                    self.result.add_error(row_number, str(e))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    self._flush(db, batch, category_ids, fmt, start)
+                    batch = []
+            self._flush(db, batch, category_ids, fmt, start)
+        finally:
+            db.close()
+
+        self.result.duration_seconds = round(time.perf_counter() - start, 3)
+        RECEIPTS_IMPORTED.labels(format=fmt, outcome="failed").inc(self.result.failed)
+        RECEIPTS_IMPORTED.labels(format=fmt, outcome="skipped").inc(self.result.skipped)
+        RECEIPTS_IMPORTED.labels(format=fmt, outcome="duplicate").inc(self.result.duplicates)
+        logger.info(
+            f"Imported {self.result.imported} receipts from {fmt} in {self.result.duration_seconds}s "
+            f"({self.result.skipped} skipped, {self.result.duplicates} duplicates, {self.result.failed} failed)"
+        )
+        return self.result
+
+    def _import_key(self, row: dict) -> str:
+        """Key identifying the statement row across imports (see module docstring)."""
+        content = f"{row['transaction_date']}|{row['amount']}|{row['currency']}"
+        if row["fitid"]:
+            content = f"ofx|{row['fitid']}|{content}"
+        else:
+            content = f"csv|{content}|{row['vendor']}|{row['raw_ocr_text'] or ''}"
+            occurrence = self._occurrences[content] = self._occurrences.get(content, 0) + 1
+            content = f"{content}|{occurrence}"
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _flush(self, db, batch: List[Tuple[int, dict]], category_ids: Dict[str, int], fmt: str, start: float) -> None:
+        # Rows earlier imports (or earlier rows of this one) already created
+        keys = {row["import_key"] for _, row in batch}
+        seen = {key for (key,) in db.query(Receipt.import_key).filter(Receipt.import_key.in_(keys))} if keys else set()
+        unique = []
+        for row_number, row in batch:
+            if row["import_key"] in seen:
+                self.result.duplicates += 1
+            else:
+                seen.add(row["import_key"])
+                unique.append((row_number, row))
+        batch = unique
+        if not batch:
+            return
+
+        # Exchange rates for the batch, one time-series request per currency
+        missing = {
+            (row["currency"], row["transaction_date"]) for _, row in batch
+            if row["currency"] != "USD" and (row["currency"], row["transaction_date"]) not in self._rates
+        }
+        if missing:
+            self._rates.update(asyncio.run(get_usd_rates(missing)))
+
+        # Explicit categories win; the rest go through the keyword categorizer
+        vendor_categories = categorize_vendors(
+            (row["vendor"] for _, row in batch if row["category"].lower() not in category_ids), db
+        )
+
+        now = get_eastern_time()
+        values = []
+        for _, row in batch:
+            rate = 1.0 if row["currency"] == "USD" else self._rates.get((row["currency"], row["transaction_date"]))
+            exponent = currency_exponent(row["currency"])
+            values.append({
+                "id": str(uuid.uuid4()),
+                "vendor": row["vendor"],
+                "amount_minor": to_minor(row["amount"], exponent),
+                "amount_usd_minor": to_minor(row["amount"] * Decimal(str(rate)), USD_EXPONENT) if rate is not None else None,
+                "currency": row["currency"],
+                "currency_exponent": exponent,
+                "transaction_date": row["transaction_date"],
+                "category_id": category_ids.get(row["category"].lower()) or vendor_categories.get(row["vendor"]),
+                "image_path": "manual_entry",
+                "raw_ocr_text": row["raw_ocr_text"],
+                "import_key": row["import_key"],
+                "status": "completed",
+                "created_at": now,
+                "updated_at": now,
+            })
+
+        try:
+            db.execute(insert(Receipt), values)
+            db.commit()
+            self.result.imported += len(values)
+            self.result.unconverted += sum(1 for value in values if value["amount_usd_minor"] is None)
+            RECEIPTS_IMPORTED.labels(format=fmt, outcome="success").inc(len(values))
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to insert import batch of {len(values)} rows: {e}")
+            for row_number, _ in batch:
+                self.result.add_error(row_number, f"Database error: {e.__class__.__name__}")
+
+        if self.progress:
+            self.result.duration_seconds = round(time.perf_counter() - start, 3)
+            self.progress(self.result)
+
+
+def import_receipts(
+    stream: TextIO,
+    fmt: str,
+    default_currency: str = "USD",
+    progress: Optional[Callable[[ImportResult], None]] = None,
+) -> ImportResult:
+    """
+    Import every row of a CSV or OFX stream.
+
+    Blocking; run it in a thread from async code.
+
+    Raises:
+        ValueError: If the format is unknown or the CSV header is unusable
+    """
+    if fmt not in PARSERS:
+        raise ValueError(f"Unknown import format '{fmt}'. Expected one of: {', '.join(IMPORT_FORMATS)}")
+    rows = PARSERS[fmt](stream)
+    return ReceiptImporter(default_currency, progress).run(rows, fmt)
@@ -0,0 +1,367 @@
+"""
+Prioritised processing queue with lanes for interactive, bulk and background work.
+
+Two backends share one interface (put/get/task_done/retry/close plus status):
+LaneQueue keeps jobs in process memory, and DatabaseJobQueue stores them in
+the processing_jobs table so the API and standalone workers in other
+processes or on other machines share one queue.
+"""
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import and_, case, func, or_, update
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import ProcessingJob
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Lanes in priority order
+LANES = ("interactive", "bulk", "background")
+DEFAULT_LANE = "interactive"
+
+
+@dataclass
+class ReceiptJob:
+    """A receipt waiting to be processed by the worker."""
+    receipt_id: str
+    file_path: str
+    lane: str = DEFAULT_LANE
+    enqueued_at: float = field(default_factory=time.time)
+    trace_context: Dict[str, str] = field(default_factory=dict)
+    job_id: Optional[int] = None  # Row id when stored in the database
+    profile: bool = False  # Sample the job's stacks (see services/profiling.py)
+    attempts: int = 0  # Earlier runs that ran out of time
+
+
+def lane_caps(concurrency: int, weights: Dict[str, float]) -> Dict[str, int]:
+    """Per-lane concurrency limits; the top lane may use every worker."""
+    total = sum(weights.get(lane, 0) for lane in LANES) or 1
+    caps = {
+        lane: max(1, math.ceil(concurrency * weights.get(lane, 0) / total))
+        for lane in LANES
+    }
+    caps[LANES[0]] = concurrency
+    return caps
+
+
+class LaneQueue:
+    """
+    Thread-safe queue that serves lanes by priority.
+
+    - Lanes are served in LANES order, so interactive captures overtake a
+      bulk offline sync.
+    - Every lane except the top one is capped at its weighted share of the
+      worker threads, so lower lanes can never occupy every worker.
+    - A job that has waited longer than the starvation threshold is served
+      next regardless of lane priority.
+    """
+
+    def __init__(self, concurrency: int, weights: Dict[str, float], starvation_seconds: float):
+        self._cond = threading.Condition()
+        self._lanes: Dict[str, Deque[ReceiptJob]] = {lane: deque() for lane in LANES}
+        self._running: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._closed = False
+        self.starvation_seconds = starvation_seconds
+        self.caps = lane_caps(concurrency, weights)
+
+    def put(self, job: ReceiptJob) -> None:
+        if job.lane not in self._lanes:
+            raise ValueError(f"Unknown lane '{job.lane}'. Expected one of: {', '.join(LANES)}")
+        with self._cond:
+            self._lanes[job.lane].append(job)
+            self._cond.notify_all()
+
+    def get(self) -> Optional[ReceiptJob]:
+        """Block until a job is eligible to run. Returns None once closed."""
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                lane = self._select_lane()
+                if lane:
+                    self._running[lane] += 1
+                    return self._lanes[lane].popleft()
+                self._cond.wait()
+
+    def task_done(self, job: ReceiptJob) -> None:
+        with self._cond:
+            self._running[job.lane] -= 1
+            self._cond.notify_all()
+
+    def retry(self, job: ReceiptJob, delay: float) -> None:
+        """Finish the job's current run and queue it again after `delay` seconds."""
+        self.task_done(job)
+        timer = threading.Timer(delay, self.put, [job])
+        timer.daemon = True
+        timer.start()
+
+    def close(self) -> None:
+        """Wake all workers and make get() return None."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _select_lane(self) -> Optional[str]:
+        """Pick the lane to serve next. Caller holds the lock."""
+        eligible = [
+            lane for lane in LANES
+            if self._lanes[lane] and self._running[lane] < self.caps[lane]
+        ]
+        if not eligible:
+            return None
+
+        # Starvation protection: the oldest overdue job wins
+        now = time.time()
+        starved = [
+            lane for lane in eligible
+            if now - self._lanes[lane][0].enqueued_at >= self.starvation_seconds
+        ]
+        if starved:
+            return min(starved, key=lambda lane: self._lanes[lane][0].enqueued_at)
+
+        return eligible[0]
+
+    def qsize(self) -> int:
+        with self._cond:
+            return sum(len(jobs) for jobs in self._lanes.values())
+
+    def lane_depth(self, lane: str) -> int:
+        with self._cond:
+            return len(self._lanes[lane])
+
+    def oldest_age(self, lane: Optional[str] = None) -> float:
+        """Age in seconds of the oldest waiting job, optionally within one lane."""
+        with self._cond:
+            lanes = [lane] if lane else LANES
+            heads = [self._lanes[name][0].enqueued_at for name in lanes if self._lanes[name]]
+        return time.time() - min(heads) if heads else 0.0
+
+    def status(self) -> Dict[str, dict]:
+        """Per-lane queued/running counts and oldest wait."""
+        now = time.time()
+        with self._cond:
+            return {
+                lane: {
+                    "queued": len(self._lanes[lane]),
+                    "running": self._running[lane],
+                    "max_running": self.caps[lane],
+                    "oldest_age_seconds": round(now - self._lanes[lane][0].enqueued_at, 1)
+                    if self._lanes[lane] else 0.0,
+                }
+                for lane in LANES
+            }
+
+
+class DatabaseJobQueue:
+    """
+    LaneQueue semantics on top of the processing_jobs table.
+
+    Workers claim a job with a conditional UPDATE, so concurrent workers in
+    any number of processes never run the same job twice. Lane caps apply
+    per process. Jobs claimed by a worker that stopped without finishing
+    them are offered again after queue_claim_timeout_seconds. Retried jobs
+    keep their row and wait until available_at.
+    """
+
+    def __init__(self, concurrency: int, weights: Dict[str, float], starvation_seconds: float):
+        self.starvation_seconds = starvation_seconds
+        self.caps = lane_caps(concurrency, weights)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._running: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+
+    def put(self, job: ReceiptJob) -> None:
+        if job.lane not in LANES:
+            raise ValueError(f"Unknown lane '{job.lane}'. Expected one of: {', '.join(LANES)}")
+        db = SessionLocal()
+        try:
+            row = ProcessingJob(
+                receipt_id=job.receipt_id,
+                file_path=job.file_path,
+                lane=job.lane,
+                trace_context=json.dumps(job.trace_context),
+                enqueued_at=job.enqueued_at,
+                profile=job.profile,
+            )
+            db.add(row)
+            db.flush()
+            job.job_id = row.id
+            db.commit()
+        finally:
+            db.close()
+        # Wake local workers now rather than at their next poll
+        self._wakeup.set()
+
+    def get(self) -> Optional[ReceiptJob]:
+        """Block until a job is claimed. Returns None once closed."""
+        while not self._closed:
+            job = self._claim()
+            if job:
+                return job
+            self._wakeup.wait(settings.queue_poll_interval_seconds)
+            self._wakeup.clear()
+        return None
+
+    def task_done(self, job: ReceiptJob) -> None:
+        with self._lock:
+            self._running[job.lane] -= 1
+        db = SessionLocal()
+        try:
+            db.query(ProcessingJob).filter(ProcessingJob.id == job.job_id).delete()
+            db.commit()
+        finally:
+            db.close()
+        self._wakeup.set()
+
+    def retry(self, job: ReceiptJob, delay: float) -> None:
+        """Release the job's claim and make it claimable again after `delay` seconds."""
+        with self._lock:
+            self._running[job.lane] -= 1
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(ProcessingJob)
+                .where(ProcessingJob.id == job.job_id)
+                .values(claimed_at=None, claimed_by=None, attempts=job.attempts, available_at=time.time() + delay)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def close(self) -> None:
+        self._closed = True
+        self._wakeup.set()
+
+    def _claimable(self, now: float):
+        """Filter for jobs that are due and that nobody holds (or whose holder timed out)."""
+        return and_(
+            or_(ProcessingJob.available_at.is_(None), ProcessingJob.available_at <= now),
+            or_(
+                ProcessingJob.claimed_at.is_(None),
+                ProcessingJob.claimed_at < now - settings.queue_claim_timeout_seconds,
+            ),
+        )
+
+    def _held(self, now: float):
+        """Filter for jobs a live worker is running."""
+        return and_(
+            ProcessingJob.claimed_at.isnot(None),
+            ProcessingJob.claimed_at >= now - settings.queue_claim_timeout_seconds,
+        )
+
+    def _claim(self) -> Optional[ReceiptJob]:
+        with self._lock:
+            lanes = [lane for lane in LANES if self._running[lane] < self.caps[lane]]
+        if not lanes:
+            return None
+
+        now = time.time()
+        starved = ProcessingJob.enqueued_at <= now - self.starvation_seconds
+        lane_rank = case({lane: rank for rank, lane in enumerate(LANES)}, value=ProcessingJob.lane)
+
+        db = SessionLocal()
+        try:
+            # Overdue jobs first (oldest wins), then by lane priority and age
+            candidates = (
+                db.query(ProcessingJob)
+                .filter(self._claimable(now), ProcessingJob.lane.in_(lanes))
+                .order_by(case((starved, 0), else_=1), case((starved, 0), else_=lane_rank), ProcessingJob.enqueued_at)
+                .limit(5)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            for row in candidates:
+                claimed = db.execute(
+                    update(ProcessingJob)
+                    .where(ProcessingJob.id == row.id, self._claimable(now))
+                    .values(claimed_at=now, claimed_by=self.worker_id)
+                ).rowcount
+                if claimed:
+                    db.commit()
+                    with self._lock:
+                        self._running[row.lane] += 1
+                    return ReceiptJob(
+                        receipt_id=row.receipt_id,
+                        file_path=row.file_path,
+                        lane=row.lane,
+                        enqueued_at=row.enqueued_at,
+                        trace_context=json.loads(row.trace_context or "{}"),
+                        job_id=row.id,
+                        profile=bool(row.profile),
+                        attempts=row.attempts or 0,
+                    )
+            db.rollback()
+            return None
+        finally:
+            db.close()
+
+    def _counts(self) -> List:
+        """(lane, queued, running, oldest_enqueued_at) per lane with jobs; retries waiting out their backoff are neither."""
+        now = time.time()
+        queued = self._claimable(now)
+        held = self._held(now)
+        db = SessionLocal()
+        try:
+            return (
+                db.query(
+                    ProcessingJob.lane,
+                    func.sum(case((queued, 1), else_=0)),
+                    func.sum(case((held, 1), else_=0)),
+                    func.min(case((queued, ProcessingJob.enqueued_at), else_=None)),
+                )
+                .group_by(ProcessingJob.lane)
+                .all()
+            )
+        finally:
+            db.close()
+
+    def qsize(self) -> int:
+        return sum(queued or 0 for _, queued, _, _ in self._counts())
+
+    def lane_depth(self, lane: str) -> int:
+        return sum(queued or 0 for name, queued, _, _ in self._counts() if name == lane)
+
+    def oldest_age(self, lane: Optional[str] = None) -> float:
+        heads = [oldest for name, _, _, oldest in self._counts() if oldest and (lane is None or name == lane)]
+        return time.time() - min(heads) if heads else 0.0
+
+    def status(self) -> Dict[str, dict]:
+        now = time.time()
+        counts = {name: (queued, running, oldest) for name, queued, running, oldest in self._counts()}
+        result = {}
+        for lane in LANES:
+            queued, running, oldest = counts.get(lane, (0, 0, None))
+            result[lane] = {
+                "queued": queued or 0,
+                "running": running or 0,
+                "max_running": self.caps[lane],
+                "oldest_age_seconds": round(now - oldest, 1) if oldest else 0.0,
+            }
+        return result
+
+
+def create_queue():
+    """Build the queue backend selected by settings.queue_backend."""
+    kwargs = dict(
+        concurrency=settings.worker_concurrency,
+        weights=settings.lane_weights,
+        starvation_seconds=settings.lane_starvation_seconds,
+    )
+    if settings.queue_backend == "database":
+        return DatabaseJobQueue(**kwargs)
+    if settings.queue_backend != "memory":
+        logger.warning(f"Unknown queue backend '{settings.queue_backend}', using in-memory queue")
+    return LaneQueue(**kwargs)
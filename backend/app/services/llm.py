@@ -2,27 +2,151 @@
 
 import json
 import logging
+import threading
+import time
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from pathlib import Path
 
-from PIL import Image
-from google import genai
-from google.genai import types
-
 from ..config import get_settings
-from .categorizer import VALID_CATEGORIES
+from .audio import sniff_file_mime
+from .metrics import LLM_REQUESTS, record_llm_usage
+from .prompts import AUDIO_PROMPT, IMAGE_PROMPT, PromptTemplate
+from .tracing import tracer
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
-# Initialize LLM Client
+# How long to wait for an uploaded file to become usable
+FILE_PROCESSING_TIMEOUT_SECONDS = 30
+
+# GenAI client, created on first use: importing google.genai is slow and
+# most processes (CLI, API replicas without workers) never call the LLM
 client = None
-if settings.google_api_key:
-    client = genai.Client(api_key=settings.google_api_key)
-else:
+_client_lock = threading.Lock()
+
+# Context caches holding prompt instructions: (model, prompt key) -> (cache name, renew at)
+_instruction_caches: Dict[Tuple[str, str], Tuple[str, float]] = {}
+# Models that refused to create a cache, and when to try them again
+_cache_retry_at: Dict[str, float] = {}
+_cache_lock = threading.Lock()
+# For estimating prompt sizes against the provider's minimum cache size
+CHARS_PER_TOKEN = 4
+
+if not settings.google_api_key:
     logger.warning("GOOGLE_API_KEY not found in settings. Gemini features will be disabled.")
 
+
+def get_client():
+    """Return the GenAI client, building it on the first call (None without an API key)."""
+    global client
+    if client is None and settings.google_api_key:
+        with _client_lock:
+            if client is None:
+                from google import genai
+                # A real socket timeout, so a call the worker stopped waiting
+                # for (see deadlines.call_with_timeout) also ends on its own
+                client = genai.Client(
+                    api_key=settings.google_api_key,
+                    http_options={"timeout": settings.llm_timeout_seconds or None},
+                )
+    return client
+
+
+def accepts_system_instruction(model: str) -> bool:
+    """Gemma models reject system instructions (and so context caches)."""
+    return "gemma" not in model.lower()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters each) without asking the provider."""
+    return len(text) // CHARS_PER_TOKEN
+
+
+def cached_instructions(client, model: str, prompt: PromptTemplate) -> Optional[str]:
+    """
+    Name of a context cache holding the prompt's instructions, creating it if needed.
+
+    Returns None when caching is disabled, the instructions are shorter than
+    the provider's minimum cache size, or the model refuses it (some models
+    don't support it); a refusal is remembered for one TTL so it isn't
+    retried every call. The cache is created outside the lock, so a slow
+    provider doesn't hold up calls for other models and prompts.
+    """
+    from google.genai import types
+    
+    ttl = settings.llm_prompt_cache_ttl_seconds
+    if not ttl or estimate_tokens(prompt.instructions) < settings.llm_prompt_cache_min_tokens:
+        return None
+    
+    key = (model, prompt.key)
+    with _cache_lock:
+        if time.monotonic() < _cache_retry_at.get(model, 0.0):
+            return None
+        entry = _instruction_caches.get(key)
+        if entry and time.monotonic() < entry[1]:
+            return entry[0]
+    
+    try:
+        cache = client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=prompt.instructions,
+                display_name=f"vyaya-{prompt.name}-v{prompt.version}",
+                ttl=f"{ttl}s",
+            ),
+        )
+    except Exception as e:
+        logger.info(f"Not caching {prompt.key} instructions for {model}: {e}")
+        with _cache_lock:
+            _cache_retry_at[model] = time.monotonic() + ttl
+        return None
+    
+    with _cache_lock:
+        # Another call may have created one meanwhile; keep the first
+        entry = _instruction_caches.get(key)
+        if not (entry and time.monotonic() < entry[1]):
+            # Renew before the provider expires it rather than racing the TTL
+            _instruction_caches[key] = (cache.name, time.monotonic() + ttl - min(60, ttl / 2))
+            logger.info(f"Cached {prompt.key} instructions for {model} as {cache.name}")
+            return cache.name
+    
+    try:
+        client.caches.delete(name=cache.name)
+    except Exception as e:
+        logger.debug(f"Could not delete duplicate cache {cache.name}: {e}")
+    return entry[0]
+
+
+def forget_cached_instructions(model: str, prompt: PromptTemplate) -> None:
+    """Drop a cache that failed in use (e.g. expired early) so the next call recreates it."""
+    with _cache_lock:
+        _instruction_caches.pop((model, prompt.key), None)
+
+
+def build_request(client, model: str, prompt: PromptTemplate, part, **values):
+    """
+    Contents and config for one extraction call.
+    
+    The instructions go in the system instruction, by reference to a
+    context cache when one is available, so only the short per-request
+    text and the media travel with each call.
+    """
+    from google.genai import types
+    
+    options = {"temperature": 0.1, "max_output_tokens": 1024}
+    request = prompt.render(**values)
+    if not accepts_system_instruction(model):
+        return [prompt.instructions, request, part], types.GenerateContentConfig(**options)
+    
+    cache_name = cached_instructions(client, model, prompt)
+    if cache_name:
+        options["cached_content"] = cache_name
+    else:
+        options["system_instruction"] = prompt.instructions
+    return [request, part], types.GenerateContentConfig(**options)
+
+
 def extract_json_from_response(text: str) -> Optional[Dict[str, Any]]:
     """Clean markdown code blocks and parse JSON."""
     try:
@@ -41,10 +165,16 @@ def extract_json_from_response(text: str) -> Optional[Dict[str, Any]]:
         logger.error(f"Failed to parse JSON from LLM response: {text}")
         return None
 
-async def process_receipt_image(image_path: str) -> dict:
+async def process_receipt_image(image_path: str, mime_type: Optional[str] = None) -> dict:
     """
     Process a receipt image using Google Gemini API.
+    
+    With a known mime type (from the stored file metadata) the file's bytes
+    are sent as they are; otherwise the image is opened with PIL.
     """
+    from google.genai import types
+    
+    client = get_client()
     if not client:
         return {
             "vendor": None,
@@ -59,32 +189,15 @@ async def process_receipt_image(image_path: str) -> dict:
         raise FileNotFoundError(f"Image not found: {image_path}")
 
     try:
-        # Load image for Gemini
-        img = Image.open(image_path)
-        
-        categories_str = ", ".join(VALID_CATEGORIES)
+        # Send the encoded file as-is rather than decoding and re-encoding it
+        if mime_type and mime_type.startswith("image/"):
+            with open(image_path, "rb") as f:
+                img = types.Part.from_bytes(data=f.read(), mime_type=mime_type)
+        else:
+            from PIL import Image
+            img = Image.open(image_path)
         
-        prompt = f"""
-Act as an advanced OCR and data extraction assistant. Analyze the provided receipt image and extract specific data points into a structured JSON format.
-
-### Extraction Instructions:
-1. **Vendor**: Identify the official name of the store or service provider.
-2. **Date**: Extract the transaction date. Normalize to "YYYY-MM-DD".
-3. **Amount**: Locate the final "Total" or "Amount Due". Exclude sub-totals.
-4. **Currency**: Extract the 3-letter ISO 4217 currency code (e.g., USD, EUR, GBP, INR). Convert symbols if necessary (e.g., "$" -> "USD", "€" -> "EUR", "₹" -> "INR").
-5. **Category**: Assign the most relevant category from this list: [{categories_str}].
-
-### Output Schema (Strict JSON):
-{{
-    "vendor": "string or null",
-    "date": "string or null",
-    "amount": number or null,
-    "currency": "string or null",
-    "category": "string or null"
-}}
-
-Respond ONLY with valid JSON matching this schema. Do not include any other text.
-"""        
+        contents, config = build_request(client, settings.llm_model, IMAGE_PROMPT, img)
         
         logger.info(f"Calling LLM API with model {settings.llm_model}")
         
@@ -93,14 +206,20 @@ Respond ONLY with valid JSON matching this schema. Do not include any other text
         # google-genai client.models.generate_content is synchronous by default.
         # However, we are in an async function.
         
-        response = client.models.generate_content(
-            model=settings.llm_model,
-            contents=[prompt, img],
-            config=types.GenerateContentConfig(
-                temperature=0.1,
-                max_output_tokens=1024, # Increased for potentially longer reasoning
-            )
-        )
+        try:
+            with tracer.start_as_current_span("llm.generate_content", attributes={"llm.model": settings.llm_model}):
+                response = client.models.generate_content(
+                    model=settings.llm_model,
+                    contents=contents,
+                    config=config,
+                )
+        except Exception:
+            LLM_REQUESTS.labels(model=settings.llm_model, outcome="error").inc()
+            if config.cached_content:
+                forget_cached_instructions(settings.llm_model, IMAGE_PROMPT)
+            raise
+        LLM_REQUESTS.labels(model=settings.llm_model, outcome="success").inc()
+        record_llm_usage(settings.llm_model, response)
         
         content = response.text
         logger.info(f"LLM Response: {content}")
@@ -122,7 +241,8 @@ Respond ONLY with valid JSON matching this schema. Do not include any other text
             "currency": parsed_data.get("currency", "USD"),
             "category": parsed_data.get("category"),
             "raw_text": content, # Store full LLM response as raw text
-            "confidence": 1.0 
+            "confidence": 1.0,
+            "prompt_version": IMAGE_PROMPT.key,
         }
 
     except Exception as e:
@@ -131,10 +251,27 @@ Respond ONLY with valid JSON matching this schema. Do not include any other text
             "confidence": 0.0,
         }
 
-async def process_receipt_audio(audio_path: str) -> dict:
+def upload_audio_file(client, audio_path: str, mime_type: str):
+    """Upload a recording through the Files API and wait until it can be used."""
+    with tracer.start_as_current_span("llm.upload_file", attributes={"llm.mime_type": mime_type}):
+        uploaded = client.files.upload(path=audio_path, config={"mime_type": mime_type})
+        deadline = time.monotonic() + FILE_PROCESSING_TIMEOUT_SECONDS
+        while getattr(uploaded, "state", None) == "PROCESSING" and time.monotonic() < deadline:
+            time.sleep(0.5)
+            uploaded = client.files.get(name=uploaded.name)
+    return uploaded
+
+
+async def process_receipt_audio(audio_path: str, mime_type: Optional[str] = None) -> dict:
     """
     Process a receipt audio recording using Google GenAI (brand: Gemini/Gemma).
+    
+    Recordings up to llm_inline_audio_max_bytes are sent inline; larger ones
+    are uploaded through the Files API and referenced by URI.
     """
+    from google.genai import types
+    
+    client = get_client()
     if not client:
         return {
             "vendor": None,
@@ -148,54 +285,39 @@ async def process_receipt_audio(audio_path: str) -> dict:
     if not Path(audio_path).exists():
         raise FileNotFoundError(f"Audio file not found: {audio_path}")
 
+    uploaded = None
     try:
-        # Load audio file
-        with open(audio_path, "rb") as f:
-            audio_bytes = f.read()
-
-        # Determine mime type based on extension
-        ext = Path(audio_path).suffix.lower()
-        mime_type = "audio/wav" if ext == ".wav" else "audio/webm"
-        
-        categories_str = ", ".join(VALID_CATEGORIES)
-        
-        prompt = f"""
-Act as an advanced receipt data extraction assistant. Listen to the audio recording where a user describes a purchase and extract specific data points into a structured JSON format.
-
-### Extraction Instructions:
-1. **Vendor**: Identify the store or service provider mentioned.
-2. **Date**: Extract the transaction date if mentioned (e.g., "yesterday", "last friday", "on January 12th"). Convert relative dates to absolute YYYY-MM-DD based on today's date: {datetime.now().strftime("%Y-%m-%d")}.
-3. **Amount**: Extract the total amount spent.
-4. **Currency**: Extract the currency if mentioned, otherwise default to USD.
-5. **Category**: Assign the most relevant category from this list: [{categories_str}].
-
-### Output Schema (Strict JSON):
-{{
-    "vendor": "string or null",
-    "date": "string or null",
-    "amount": number or null,
-    "currency": "string or null",
-    "category": "string or null"
-}}
-
-Respond ONLY with valid JSON matching this schema. Do not include any other text.
-"""        
+        # Trust the file's contents over its extension
+        mime_type = mime_type or sniff_file_mime(Path(audio_path)) or "audio/webm"
+        
+        if Path(audio_path).stat().st_size > settings.llm_inline_audio_max_bytes:
+            uploaded = upload_audio_file(client, audio_path, mime_type)
+            audio_part = types.Part.from_uri(file_uri=uploaded.uri, mime_type=mime_type)
+        else:
+            with open(audio_path, "rb") as f:
+                audio_part = types.Part.from_bytes(data=f.read(), mime_type=mime_type)
         
         # Use Gemini Flash Latest as stable fallback
         audio_model = "models/gemini-flash-latest"
+        contents, config = build_request(
+            client, audio_model, AUDIO_PROMPT, audio_part, today=datetime.now().strftime("%Y-%m-%d")
+        )
         logger.info(f"Calling LLM API with model {audio_model} for audio processing")
         
-        response = client.models.generate_content(
-            model=audio_model,
-            contents=[
-                prompt,
-                types.Part.from_bytes(data=audio_bytes, mime_type=mime_type)
-            ],
-            config=types.GenerateContentConfig(
-                temperature=0.1,
-                max_output_tokens=1024,
-            )
-        )
+        try:
+            with tracer.start_as_current_span("llm.generate_content", attributes={"llm.model": audio_model}):
+                response = client.models.generate_content(
+                    model=audio_model,
+                    contents=contents,
+                    config=config,
+                )
+        except Exception:
+            LLM_REQUESTS.labels(model=audio_model, outcome="error").inc()
+            if config.cached_content:
+                forget_cached_instructions(audio_model, AUDIO_PROMPT)
+            raise
+        LLM_REQUESTS.labels(model=audio_model, outcome="success").inc()
+        record_llm_usage(audio_model, response)
         
         content = response.text
         logger.info(f"LLM Audio Response: {content}")
@@ -217,7 +339,8 @@ Respond ONLY with valid JSON matching this schema. Do not include any other text
             "currency": parsed_data.get("currency", "USD"),
             "category": parsed_data.get("category"),
             "raw_text": content,
-            "confidence": 1.0 
+            "confidence": 1.0,
+            "prompt_version": AUDIO_PROMPT.key,
         }
 
     except Exception as e:
@@ -230,3 +353,9 @@ Respond ONLY with valid JSON matching this schema. Do not include any other text
             "raw_text": f"Error: {str(e)}",
             "confidence": 0.0,
         }
+    finally:
+        if uploaded is not None:
+            try:
+                client.files.delete(name=uploaded.name)
+            except Exception as e:
+                logger.warning(f"Failed to delete uploaded audio {uploaded.name}: {e}")
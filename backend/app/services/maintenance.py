@@ -0,0 +1,336 @@
+"""
+Online database maintenance and backups.
+
+Maintenance keeps a long-running SQLite file healthy: PRAGMA optimize and a
+bounded ANALYZE refresh the planner's statistics, incremental vacuum
+returns free pages to the filesystem, the FTS index is merged and the file
+is integrity-checked. Every step is short, and before each one the task
+waits (up to MAINTENANCE_MAX_WAIT_SECONDS) until no API request is in
+flight, so it runs in the gaps between foreground traffic. On PostgreSQL
+autovacuum does the rest and only ANALYZE runs.
+
+Backups use SQLite's online backup API, copying a few pages per step with
+a pause in between. In WAL mode readers never block writers, so requests
+and workers keep writing while a backup runs. A write from another
+connection makes the copy start over, though; after BACKUP_MAX_RESTARTS
+restarts the backup is finished with VACUUM INTO, which copies one
+consistent snapshot in a single pass. Backups are written next to their
+destination and renamed into place once they pass a quick_check.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from ..config import get_settings
+from ..database import IS_SQLITE, engine
+from ..models import get_eastern_time
+from .metrics import DB_MAINTENANCE_RUNS
+from .search import FTS_TABLE
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# A step starts once no request has been in flight for this long...
+FOREGROUND_IDLE_SECONDS = 0.5
+# ...or after this long regardless, so a busy server still gets maintained
+MAINTENANCE_MAX_WAIT_SECONDS = 30.0
+
+ANALYSIS_LIMIT = 1000  # Rows sampled per index by ANALYZE
+VACUUM_PAGES_PER_STEP = 256
+FTS_MERGE_PAGES_PER_STEP = 200
+FTS_MAX_MERGE_STEPS = 100
+
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_PAUSE_SECONDS = 0.01
+BACKUP_MAX_RESTARTS = 3  # Then VACUUM INTO, which concurrent writes can't restart
+BACKUP_TIMEOUT_SECONDS = 600.0
+
+# Not foreground activity: event streams stay open indefinitely, and admin
+# requests are the ones running maintenance
+UNTRACKED_PATHS = ("/api/receipts/events", "/api/admin/")
+
+
+class MaintenanceUnavailable(Exception):
+    """The configured database doesn't support the requested operation."""
+
+
+class BackupFailed(RuntimeError):
+    """A backup timed out or its copy failed the integrity check."""
+
+
+class ForegroundActivity:
+    """Counts API requests in flight so background maintenance can stay out of their way."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._last_finished = 0.0
+
+    @contextmanager
+    def track(self, path: str):
+        if path.startswith(UNTRACKED_PATHS):
+            yield
+            return
+        with self._condition:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._last_finished = time.monotonic()
+                self._condition.notify_all()
+
+    def wait_idle(self, max_wait: float = MAINTENANCE_MAX_WAIT_SECONDS) -> float:
+        """Block until the API has been idle briefly (or max_wait passes); returns seconds waited."""
+        start = time.monotonic()
+        deadline = start + max_wait
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if self._in_flight == 0:
+                    idle_for = now - self._last_finished
+                    if idle_for >= FOREGROUND_IDLE_SECONDS:
+                        break
+                    self._condition.wait(min(FOREGROUND_IDLE_SECONDS - idle_for, deadline - now))
+                else:
+                    self._condition.wait(deadline - now)
+        return time.monotonic() - start
+
+
+foreground = ForegroundActivity()
+
+
+@dataclass
+class MaintenanceReport:
+    """What a maintenance run did, with each step's duration."""
+    steps: Dict[str, float] = field(default_factory=dict)  # step -> seconds
+    freed_pages: int = 0
+    fts_merge_steps: int = 0
+    integrity: List[str] = field(default_factory=list)  # ["ok"] when healthy
+    yielded_seconds: float = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.integrity in ([], ["ok"])
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "healthy": self.healthy}
+
+
+@dataclass
+class BackupReport:
+    path: str
+    size_bytes: int
+    pages: int
+    duration_seconds: float
+    restarts: int = 0  # Times the paged copy started over because of a concurrent write
+    vacuumed: bool = False  # Finished with VACUUM INTO after too many restarts
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _sqlite_path() -> Path:
+    database = engine.url.database
+    if not database or database == ":memory:":
+        raise MaintenanceUnavailable("Backups need a file-backed SQLite database")
+    return Path(database)
+
+
+def run_maintenance(full_check: bool = False) -> MaintenanceReport:
+    """
+    Run every maintenance step, yielding to API traffic before each one.
+
+    full_check runs integrity_check instead of the faster quick_check
+    (which skips verifying that indexes match their tables).
+    """
+    report = MaintenanceReport()
+    outcome = "error"
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            def step(name: str, run) -> None:
+                report.yielded_seconds += foreground.wait_idle()
+                start = time.perf_counter()
+                run()
+                report.steps[name] = round(report.steps.get(name, 0.0) + time.perf_counter() - start, 3)
+
+            if not IS_SQLITE:
+                step("analyze", lambda: conn.execute(text("ANALYZE")))
+                outcome = "success"
+                return report
+
+            step("optimize", lambda: conn.execute(text("PRAGMA optimize")))
+            conn.execute(text(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}"))
+            step("analyze", lambda: conn.execute(text("ANALYZE")))
+
+            # Only databases in incremental auto-vacuum mode can shrink online
+            if conn.execute(text("PRAGMA auto_vacuum")).scalar() == 2:
+                while True:
+                    free = conn.execute(text("PRAGMA freelist_count")).scalar()
+                    if not free:
+                        break
+                    pages = min(free, VACUUM_PAGES_PER_STEP)
+                    # execute() would step the pragma once (one page); a script runs it to completion
+                    step("incremental_vacuum", lambda: conn.connection.driver_connection.executescript(
+                        f"PRAGMA incremental_vacuum({pages});"
+                    ))
+                    remaining = conn.execute(text("PRAGMA freelist_count")).scalar()
+                    if remaining >= free:
+                        break  # Nothing more can be released right now
+                    report.freed_pages += free - remaining
+            else:
+                logger.info(
+                    "Database is not in incremental auto-vacuum mode; run "
+                    "`python -m app.cli maintenance --enable-incremental-vacuum` once while the app is stopped"
+                )
+
+            fts = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+            ).first()
+            if fts:
+                # Each merge step does a bounded amount of work; it changes
+                # fewer than two rows once the index is fully merged
+                for _ in range(FTS_MAX_MERGE_STEPS):
+                    before = conn.execute(text("SELECT total_changes()")).scalar()
+                    step("fts_merge", lambda: conn.execute(text(
+                        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('merge', {FTS_MERGE_PAGES_PER_STEP})"
+                    )))
+                    report.fts_merge_steps += 1
+                    if conn.execute(text("SELECT total_changes()")).scalar() - before < 2:
+                        break
+
+            check = "integrity_check" if full_check else "quick_check"
+            step(check, lambda: report.integrity.extend(row[0] for row in conn.execute(text(f"PRAGMA {check}"))))
+            outcome = "success" if report.healthy else "corrupt"
+    finally:
+        DB_MAINTENANCE_RUNS.labels(task="maintenance", outcome=outcome).inc()
+
+    if report.healthy:
+        logger.info(f"Database maintenance done: {report.to_dict()}")
+    else:
+        logger.error(f"Database integrity check failed: {report.integrity[:20]}")
+    return report
+
+
+def enable_incremental_vacuum() -> None:
+    """
+    Switch an existing SQLite database to incremental auto-vacuum.
+
+    Needs a full VACUUM, which rewrites the file and locks it for the
+    duration: run it while the app is stopped.
+    """
+    if not IS_SQLITE:
+        raise MaintenanceUnavailable("Incremental vacuum is SQLite-only")
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        conn.execute(text("VACUUM"))
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def default_backup_path() -> Path:
+    backup_dir = settings.backup_dir or settings.data_dir / "backups"
+    return backup_dir / f"vyaya-{get_eastern_time():%Y%m%d-%H%M%S}.db"
+
+
+def prune_backups(directory: Path, keep: int) -> None:
+    """Delete all but the newest `keep` backups in the directory."""
+    if keep <= 0:
+        return
+    backups = sorted(directory.glob("vyaya-*.db"), key=lambda path: path.stat().st_mtime, reverse=True)
+    for old in backups[keep:]:
+        old.unlink(missing_ok=True)
+
+
+def backup_database(
+    destination: Optional[Path] = None,
+    pages_per_step: int = BACKUP_PAGES_PER_STEP,
+    pause_seconds: float = BACKUP_STEP_PAUSE_SECONDS,
+) -> BackupReport:
+    """
+    Copy the live SQLite database with the online backup API.
+
+    Raises:
+        MaintenanceUnavailable: If the database isn't a SQLite file
+        BackupFailed: If the copy takes longer than BACKUP_TIMEOUT_SECONDS
+            or fails its integrity check
+    """
+    if not IS_SQLITE:
+        raise MaintenanceUnavailable("Online backups are SQLite-only; use pg_dump for PostgreSQL")
+
+    source_path = _sqlite_path()
+    rotate = destination is None  # Only prune the default backup directory
+    destination = Path(destination) if destination else default_backup_path()
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    partial = destination.with_name(destination.name + ".partial")
+    partial.unlink(missing_ok=True)
+
+    start = time.perf_counter()
+    deadline = time.monotonic() + BACKUP_TIMEOUT_SECONDS
+    pages = restarts = 0
+    last_remaining = None
+    vacuumed = False
+
+    def progress(status, remaining, total):
+        nonlocal pages, restarts, last_remaining
+        pages = total
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1  # Another connection wrote: the copy started over
+        last_remaining = remaining
+        if restarts > BACKUP_MAX_RESTARTS:
+            raise _TooManyRestarts()
+        if time.monotonic() > deadline:
+            raise BackupFailed(f"Backup did not finish within {BACKUP_TIMEOUT_SECONDS:.0f}s")
+        if remaining:
+            # backup() itself only sleeps when the database is busy
+            time.sleep(pause_seconds)
+
+    outcome = "error"
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(partial)
+    try:
+        try:
+            source.backup(target, pages=pages_per_step, progress=progress, sleep=pause_seconds)
+        except _TooManyRestarts:
+            logger.info(f"Backup restarted {restarts} times by concurrent writes; finishing with VACUUM INTO")
+            target.close()
+            partial.unlink(missing_ok=True)
+            source.execute("VACUUM INTO ?", (str(partial),))
+            target = sqlite3.connect(partial)
+            vacuumed = True
+        if target.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+            raise BackupFailed(f"Backup {partial} failed its integrity check")
+        target.close()
+        partial.replace(destination)
+        outcome = "success"
+    finally:
+        target.close()
+        source.close()
+        partial.unlink(missing_ok=True)
+        DB_MAINTENANCE_RUNS.labels(task="backup", outcome=outcome).inc()
+
+    if rotate:
+        prune_backups(destination.parent, settings.backup_keep)
+
+    report = BackupReport(
+        path=str(destination),
+        size_bytes=destination.stat().st_size,
+        pages=pages,
+        duration_seconds=round(time.perf_counter() - start, 3),
+        restarts=restarts,
+        vacuumed=vacuumed,
+    )
+    logger.info(f"Database backed up to {destination} ({report.size_bytes} bytes in {report.duration_seconds}s)")
+    return report
@@ -0,0 +1,192 @@
+"""
+Prometheus metrics for the HTTP API and the receipt processing pipeline.
+"""
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from ..config import get_settings
+
+settings = get_settings()
+
+# Buckets sized for the pipeline: EXIF parsing is milliseconds, LLM calls are
+# seconds, and queue waits can stretch into minutes during an offline sync.
+PIPELINE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+# ============ HTTP ============
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "vyaya_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ["method", "route", "status"],
+)
+
+HTTP_DB_STATEMENTS = Histogram(
+    "vyaya_http_db_statements",
+    "SQL statements executed per HTTP request, by route template.",
+    ["method", "route"],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    "vyaya_response_cache_requests_total",
+    "Cacheable GET requests by outcome: not_modified (304), hit, or miss.",
+    ["route", "outcome"],
+)
+
+EVENT_SUBSCRIBERS = Gauge(
+    "vyaya_event_subscribers",
+    "Open Server-Sent Events connections for receipt updates.",
+)
+
+# ============ Queue ============
+
+QUEUE_DEPTH = Gauge(
+    "vyaya_queue_depth",
+    "Number of receipts waiting in the processing queue.",
+    ["lane"],
+)
+
+QUEUE_OLDEST_AGE_SECONDS = Gauge(
+    "vyaya_queue_oldest_age_seconds",
+    "Age of the oldest receipt waiting in the processing queue.",
+    ["lane"],
+)
+
+QUEUE_WAIT_SECONDS = Histogram(
+    "vyaya_queue_wait_seconds",
+    "Time a receipt spent in the queue before the worker picked it up.",
+    ["lane"],
+    buckets=PIPELINE_BUCKETS,
+)
+
+UPLOADS_REJECTED = Counter(
+    "vyaya_uploads_rejected_total",
+    "Uploads refused with 429 by admission control, by lane and the limit hit.",
+    ["lane", "reason"],
+)
+
+# ============ Pipeline ============
+
+PIPELINE_STAGE_SECONDS = Histogram(
+    "vyaya_pipeline_stage_duration_seconds",
+    "Latency of each receipt processing stage.",
+    ["stage"],
+    buckets=PIPELINE_BUCKETS,
+)
+
+RECEIPTS_PROCESSED = Counter(
+    "vyaya_receipts_processed_total",
+    "Receipts processed by the worker, by media kind and outcome.",
+    ["kind", "outcome"],
+)
+
+DEADLINES_EXCEEDED = Counter(
+    "vyaya_deadlines_exceeded_total",
+    "Calls and jobs abandoned at their deadline, by stage.",
+    ["stage"],
+)
+
+JOB_RETRIES = Counter(
+    "vyaya_job_retries_total",
+    "Receipt jobs requeued with backoff after running out of time, by lane.",
+    ["lane"],
+)
+
+WORKER_RESTARTS = Counter(
+    "vyaya_worker_restarts_total",
+    "Worker threads replaced by the watchdog, by reason (stuck or died).",
+    ["reason"],
+)
+
+RECEIPTS_IMPORTED = Counter(
+    "vyaya_receipts_imported_total",
+    "Rows handled by bulk CSV/OFX import, by file format and outcome.",
+    ["format", "outcome"],
+)
+
+# ============ Storage ============
+
+STORAGE_GC_FILES = Counter(
+    "vyaya_storage_gc_files_total",
+    "Files removed or moved to the cold tier by storage garbage collection.",
+    ["action"],
+)
+
+STORAGE_GC_BYTES = Counter(
+    "vyaya_storage_gc_bytes_total",
+    "Bytes freed by storage garbage collection.",
+    ["action"],
+)
+
+DB_MAINTENANCE_RUNS = Counter(
+    "vyaya_db_maintenance_runs_total",
+    "Database maintenance and backup runs by outcome.",
+    ["task", "outcome"],
+)
+
+# ============ Currency ============
+
+FX_BACKFILL_RECEIPTS = Counter(
+    "vyaya_fx_backfill_receipts_total",
+    "Receipts whose USD amount the FX backfill job resolved, or could not resolve yet.",
+    ["outcome"],
+)
+
+# ============ LLM ============
+
+LLM_REQUESTS = Counter(
+    "vyaya_llm_requests_total",
+    "LLM extraction calls by model and outcome.",
+    ["model", "outcome"],
+)
+
+LLM_TOKENS = Counter(
+    "vyaya_llm_tokens_total",
+    "LLM tokens consumed: prompt and completion, plus the prompt tokens served from a context cache.",
+    ["model", "direction"],
+)
+
+LLM_COST_USD = Counter(
+    "vyaya_llm_cost_usd_total",
+    "Estimated LLM spend in USD based on the configured per-token prices.",
+    ["model"],
+)
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """Time a pipeline stage into PIPELINE_STAGE_SECONDS."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PIPELINE_STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def record_llm_usage(model: str, response) -> None:
+    """Record token counts and estimated cost from a generate_content response."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+    completion_tokens = getattr(usage, "candidates_token_count", None) or 0
+    # Included in prompt_token_count, but billed at the cached rate
+    cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+
+    LLM_TOKENS.labels(model=model, direction="prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(model=model, direction="completion").inc(completion_tokens)
+    LLM_TOKENS.labels(model=model, direction="cached").inc(cached_tokens)
+
+    cached_price = settings.llm_cached_input_cost_per_million
+    if cached_price is None:
+        cached_price = settings.llm_input_cost_per_million
+    cost = (
+        (prompt_tokens - cached_tokens) * settings.llm_input_cost_per_million
+        + cached_tokens * cached_price
+        + completion_tokens * settings.llm_output_cost_per_million
+    ) / 1_000_000
+    if cost:
+        LLM_COST_USD.labels(model=model).inc(cost)
@@ -0,0 +1,52 @@
+"""
+Money amounts as integer minor units.
+
+Amounts are stored as integers in the currency's minor unit (cents for USD,
+whole yen for JPY, fils for KWD) alongside the currency's exponent, so sums
+are exact. The API keeps exposing decimal amounts; these helpers convert at
+the edges.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Optional, Union
+
+# ISO 4217 currencies whose minor unit is not hundredths
+CURRENCY_EXPONENTS = {
+    "BIF": 0, "CLP": 0, "DJF": 0, "GNF": 0, "ISK": 0, "JPY": 0, "KMF": 0,
+    "KRW": 0, "PYG": 0, "RWF": 0, "UGX": 0, "UYI": 0, "VND": 0, "VUV": 0,
+    "XAF": 0, "XOF": 0, "XPF": 0,
+    "BHD": 3, "IQD": 3, "JOD": 3, "KWD": 3, "LYD": 3, "OMR": 3, "TND": 3,
+}
+DEFAULT_EXPONENT = 2
+
+# amount_usd is always stored in cents
+USD_EXPONENT = 2
+
+Number = Union[int, float, Decimal, str]
+
+
+def currency_exponent(currency: Optional[str]) -> int:
+    """Number of minor-unit digits for a currency code (2 when unknown)."""
+    return CURRENCY_EXPONENTS.get((currency or "").upper(), DEFAULT_EXPONENT)
+
+
+def to_minor(amount: Optional[Number], exponent: int = DEFAULT_EXPONENT) -> Optional[int]:
+    """Round a decimal amount half-up to integer minor units."""
+    if amount is None:
+        return None
+    # str() first so binary floats like 0.1 convert by their shortest repr
+    value = Decimal(str(amount)) if isinstance(amount, float) else Decimal(amount)
+    return int(value.scaleb(exponent).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor: Optional[int], exponent: int = DEFAULT_EXPONENT) -> Optional[float]:
+    """Decimal amount for API responses (the closest float to the exact value)."""
+    if minor is None:
+        return None
+    return minor / 10 ** exponent if exponent else float(minor)
+
+
+def rescale_minor(minor: Optional[int], from_exponent: int, to_exponent: int) -> Optional[int]:
+    """Re-express minor units for a currency with a different exponent."""
+    if minor is None or from_exponent == to_exponent:
+        return minor
+    return to_minor(Decimal(minor).scaleb(-from_exponent), to_exponent)
@@ -0,0 +1,298 @@
+"""
+Opt-in sampling profiler for API requests and worker jobs.
+
+A sampler thread reads the stacks of the profiled threads from
+sys._current_frames() every settings.profiling_interval_ms, so the profiled
+code runs unmodified and only pays for the sampling while it is on. Stacks
+are wall-clock: time spent waiting on the LLM, the database or a lock shows
+up where it is spent.
+
+- Requests: send X-Profile: 1 (or ?profile=1) together with a valid
+  X-Admin-Token. Every busy thread is sampled while the request runs: the
+  event loop runs async handlers, but plain def handlers, sync
+  dependencies and database sessions run on the threadpool. Other
+  requests handled at the same time show up as well.
+- Worker jobs: reprocess a receipt with ?profile=1 and the admin token, or
+  set profiling_job_sample_rate to profile a fraction of all jobs.
+- Continuous: profiling_continuous_hz > 0 samples every thread at that
+  rate, skipping idle ones, and writes an aggregated report of the hottest
+  functions every profiling_report_interval_seconds.
+
+Profiles are written to settings.profiles_dir as speedscope JSON (open at
+https://www.speedscope.app) and as folded stacks for flamegraph.pl or
+inferno.
+"""
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..config import get_settings
+from ..models import get_eastern_time
+from . import scheduler
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+Frame = Tuple[str, str, int]  # (function, file, first line)
+Stack = Tuple[Frame, ...]  # Outermost frame first
+
+MAX_STACK_DEPTH = 128
+
+# Stacks ending in these modules are threads parked on a queue, lock or
+# socket; continuous profiles leave them out
+IDLE_MODULES = ("threading.py", "queue.py", "selectors.py", "base_events.py", "scheduler.py")
+
+HOT_FUNCTIONS = 30
+
+
+def _stack(frame) -> Stack:
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def _is_idle(stack: Stack) -> bool:
+    return not stack or stack[-1][1].endswith(IDLE_MODULES)
+
+
+class StackSampler:
+    """Counts the stacks of some (or all) threads, sampled on a background thread."""
+
+    def __init__(self, interval: float, thread_ids: Optional[Iterable[int]] = None, skip_idle: bool = False):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.skip_idle = skip_idle
+        self.stacks: Counter = Counter()
+        self.started_at = time.time()
+        self.rounds = 0
+        self.stopped_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "StackSampler":
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped_at = time.time()
+        return self.stacks
+
+    def seconds_per_sample(self) -> float:
+        """
+        Wall time each sampling round stands for.
+        
+        Busy threads holding the GIL delay the sampler, so rounds come
+        further apart than the nominal interval; weighting by the measured
+        spacing keeps profile durations true.
+        """
+        with self._lock:
+            if not self.rounds:
+                return self.interval
+            elapsed = (self.stopped_at or time.time()) - self.started_at
+            return max(self.interval, elapsed / self.rounds)
+
+    def snapshot(self) -> Tuple[Counter, float]:
+        """The stacks sampled so far and when sampling (re)started."""
+        with self._lock:
+            return Counter(self.stacks), self.started_at
+
+    def take(self) -> Tuple[Counter, float, float]:
+        """Return the stacks sampled so far, their start time and seconds per sample, and start over."""
+        weight = self.seconds_per_sample()
+        with self._lock:
+            stacks, started_at = self.stacks, self.started_at
+            self.stacks, self.started_at, self.rounds = Counter(), time.time(), 0
+        return stacks, started_at, weight
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                self.rounds += 1
+                for thread_id, frame in frames.items():
+                    if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                        continue
+                    stack = _stack(frame)
+                    if self.skip_idle and _is_idle(stack):
+                        continue
+                    self.stacks[stack] += 1
+
+
+# ============ Output ============
+
+def _frame_name(frame: Frame) -> str:
+    function, filename, line = frame
+    return f"{function} ({Path(filename).name}:{line})"
+
+
+def speedscope_document(stacks: Counter, name: str, interval: float) -> dict:
+    """A speedscope "sampled" profile, weighted in seconds."""
+    frames: List[dict] = []
+    index: Dict[Frame, int] = {}
+    samples, weights = [], []
+    for stack, count in stacks.items():
+        ids = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            ids.append(index[frame])
+        samples.append(ids)
+        weights.append(count * interval)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "vyaya",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+
+
+def folded_stacks(stacks: Counter) -> str:
+    """Brendan Gregg's folded format: `outer;inner count` per line."""
+    return "".join(
+        ";".join(_frame_name(frame) for frame in stack) + f" {count}\n"
+        for stack, count in stacks.most_common()
+    )
+
+
+def hot_functions(stacks: Counter, interval: float, limit: int = HOT_FUNCTIONS) -> List[dict]:
+    """Functions by samples spent in them (self) and under them (total)."""
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        if not stack:
+            continue
+        own[stack[-1]] += count
+        for frame in set(stack):
+            total[frame] += count
+    samples = sum(stacks.values()) or 1
+    return [
+        {
+            "function": _frame_name(frame),
+            "self_seconds": round(own[frame] * interval, 3),
+            "total_seconds": round(total[frame] * interval, 3),
+            "self_share": round(own[frame] / samples, 4),
+        }
+        for frame, _ in own.most_common(limit)
+    ]
+
+
+def write_profile(stacks: Counter, label: str, interval: float) -> Path:
+    """Write speedscope JSON and folded stacks to the profiles directory; returns the JSON path."""
+    settings.profiles_dir.mkdir(parents=True, exist_ok=True)
+    safe_label = re.sub(r"[^A-Za-z0-9_.-]+", "-", label).strip("-")
+    stem = f"{get_eastern_time():%Y%m%d-%H%M%S}-{safe_label}"
+    path = settings.profiles_dir / f"{stem}.speedscope.json"
+    path.write_text(json.dumps(speedscope_document(stacks, label, interval)))
+    (settings.profiles_dir / f"{stem}.folded").write_text(folded_stacks(stacks))
+    return path
+
+
+# ============ Request and job profiles ============
+
+@dataclass
+class ProfileResult:
+    """Filled in once the profiled block exits."""
+    path: Optional[Path] = None
+    samples: int = 0
+
+
+@contextmanager
+def profile(label: str, thread_id: Optional[int] = None, all_threads: bool = False):
+    """
+    Sample the current thread (or thread_id) for the duration of the block.
+
+    all_threads samples every thread that isn't idle instead, for work
+    handed to other threads (such as the request threadpool).
+    """
+    interval = settings.profiling_interval_ms / 1000
+    if all_threads:
+        sampler = StackSampler(interval, skip_idle=True).start()
+    else:
+        sampler = StackSampler(interval, [thread_id or threading.get_ident()]).start()
+    result = ProfileResult()
+    try:
+        yield result
+    finally:
+        stacks = sampler.stop()
+        result.samples = sum(stacks.values())
+        try:
+            result.path = write_profile(stacks, label, sampler.seconds_per_sample())
+            logger.info(f"Profile of {label} ({result.samples} samples) written to {result.path}")
+        except OSError as e:
+            logger.error(f"Failed to write profile of {label}: {e}")
+
+
+# ============ Continuous profiling ============
+
+class ContinuousProfiler:
+    """Low-rate sampling of every thread, reported and reset periodically."""
+
+    def __init__(self):
+        self.sampler: Optional[StackSampler] = None
+        self.last_report: Optional[dict] = None
+
+    def start(self) -> None:
+        if settings.profiling_continuous_hz <= 0 or self.sampler is not None:
+            return
+        self.sampler = StackSampler(1 / settings.profiling_continuous_hz, skip_idle=True).start()
+        scheduler.schedule("profile-report", settings.profiling_report_interval_seconds, self.flush)
+        logger.info(f"Continuous profiling at {settings.profiling_continuous_hz} Hz")
+
+    def report(self) -> Optional[dict]:
+        """Hot functions sampled since the last flush (without resetting)."""
+        if self.sampler is None:
+            return None
+        stacks, started_at = self.sampler.snapshot()
+        return self._report(stacks, started_at, self.sampler.seconds_per_sample())
+
+    def flush(self) -> Optional[Path]:
+        """Write the profile sampled since the last flush, keep its report, and start over."""
+        if self.sampler is None:
+            return None
+        stacks, started_at, weight = self.sampler.take()
+        if not stacks:
+            return None
+        self.last_report = self._report(stacks, started_at, weight)
+        path = write_profile(stacks, "continuous", weight)
+        hot = path.with_name(path.name.replace(".speedscope.json", ".hot.json"))
+        hot.write_text(json.dumps(self.last_report, indent=2))
+        return path
+
+    def _report(self, stacks: Counter, started_at: float, weight: float) -> dict:
+        return {
+            "started_at": started_at,
+            "seconds": round(time.time() - started_at, 1),
+            "samples": sum(stacks.values()),
+            "hz": settings.profiling_continuous_hz,
+            "functions": hot_functions(stacks, weight),
+        }
+
+
+continuous = ContinuousProfiler()
@@ -0,0 +1,82 @@
+"""
+Versioned extraction prompts.
+
+Each template is split into a static instruction block, sent as the
+model's system instruction (and context-cached where the provider allows),
+and a short per-request part. Templates are built once at import. Bump a
+template's version whenever its wording changes: the version is stored on
+every receipt it extracts, so older extractions can be found and re-run
+(`python -m app.cli reextract`).
+"""
+from dataclasses import dataclass
+from typing import Dict
+
+from .categorizer import VALID_CATEGORIES
+
+OUTPUT_SCHEMA = """### Output Schema (Strict JSON):
+{
+    "vendor": "string or null",
+    "date": "string or null",
+    "amount": number or null,
+    "currency": "string or null",
+    "category": "string or null"
+}
+
+Respond ONLY with valid JSON matching this schema. Do not include any other text."""
+
+CATEGORY_LIST = ", ".join(VALID_CATEGORIES)
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """A prompt's fixed instructions and the per-request text that follows them."""
+    name: str
+    version: int
+    instructions: str
+    request: str  # str.format() template
+
+    @property
+    def key(self) -> str:
+        """Identifier stored on receipts, e.g. "image/2"."""
+        return f"{self.name}/{self.version}"
+
+    def render(self, **values) -> str:
+        return self.request.format(**values)
+
+
+IMAGE_PROMPT = PromptTemplate(
+    name="image",
+    version=2,
+    instructions=f"""Act as an advanced OCR and data extraction assistant. Analyze the provided receipt image and extract specific data points into a structured JSON format.
+
+### Extraction Instructions:
+1. **Vendor**: Identify the official name of the store or service provider.
+2. **Date**: Extract the transaction date. Normalize to "YYYY-MM-DD".
+3. **Amount**: Locate the final "Total" or "Amount Due". Exclude sub-totals.
+4. **Currency**: Extract the 3-letter ISO 4217 currency code (e.g., USD, EUR, GBP, INR). Convert symbols if necessary (e.g., "$" -> "USD", "€" -> "EUR", "₹" -> "INR").
+5. **Category**: Assign the most relevant category from this list: [{CATEGORY_LIST}].
+
+{OUTPUT_SCHEMA}""",
+    request="Extract the receipt data from this image.",
+)
+
+AUDIO_PROMPT = PromptTemplate(
+    name="audio",
+    version=2,
+    instructions=f"""Act as an advanced receipt data extraction assistant. Listen to the audio recording where a user describes a purchase and extract specific data points into a structured JSON format.
+
+### Extraction Instructions:
+1. **Vendor**: Identify the store or service provider mentioned.
+2. **Date**: Extract the transaction date if mentioned (e.g., "yesterday", "last friday", "on January 12th"). Convert relative dates to absolute YYYY-MM-DD based on today's date, which is given with the recording.
+3. **Amount**: Extract the total amount spent.
+4. **Currency**: Extract the currency if mentioned, otherwise default to USD.
+5. **Category**: Assign the most relevant category from this list: [{CATEGORY_LIST}].
+
+{OUTPUT_SCHEMA}""",
+    request="Today's date is {today}. Extract the purchase described in this recording.",
+)
+
+PROMPTS: Dict[str, PromptTemplate] = {prompt.name: prompt for prompt in (IMAGE_PROMPT, AUDIO_PROMPT)}
+
+# Versions that current extractions carry, e.g. {"image/2", "audio/2"}
+CURRENT_VERSIONS = frozenset(prompt.key for prompt in PROMPTS.values())
@@ -0,0 +1,117 @@
+"""
+Conditional GET and an in-process cache for read-mostly JSON endpoints.
+
+Every transaction that writes receipts, categories or tombstones bumps the
+data version (see database.py). A cacheable response is keyed by its path,
+query string, the data version and today's date (relative ranges such as
+"this month" move at midnight), and carries a weak ETag built from the same
+parts. A client revalidating with If-None-Match gets a 304 without the
+endpoint's queries running; otherwise a repeat request is served from the
+cache. Any write, from the API or the worker, changes the version and so
+retires every cached response at once.
+
+Entries are per process and bounded by settings.response_cache_entries
+(least recently used evicted first; 0 turns the cache off, while ETags and
+304s keep working).
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import Request, Response
+
+from ..config import get_settings
+from ..database import current_data_version
+from ..models import get_eastern_date
+from .metrics import RESPONSE_CACHE_REQUESTS
+
+settings = get_settings()
+
+# Clients may use a stored copy but must revalidate it first
+CACHE_CONTROL = "no-cache"
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    media_type: str
+
+
+class ResponseCache:
+    """LRU of rendered response bodies keyed by (path, query, data version, date)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+            return cached
+
+    def put(self, key: str, cached: CachedResponse) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = cached
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+cache = ResponseCache(settings.response_cache_entries)
+
+
+class CacheEntry:
+    """
+    One request's view of the cache.
+
+    `response` is set when the request can be answered without running the
+    endpoint (a 304 or a cached body); otherwise the endpoint builds its
+    response and passes it through store().
+    """
+
+    def __init__(self, key: str, etag: str, response: Optional[Response] = None):
+        self.key = key
+        self.etag = etag
+        self.response = response
+
+    def store(self, response: Response) -> Response:
+        if response.status_code == 200:
+            cache.put(self.key, CachedResponse(response.body, response.media_type))
+            response.headers["ETag"] = self.etag
+            response.headers["Cache-Control"] = CACHE_CONTROL
+        return response
+
+
+def lookup(request: Request, db, route: str) -> CacheEntry:
+    """Look the request up by the current data version; see CacheEntry."""
+    version = current_data_version(db)
+    today = f"{get_eastern_date():%Y%m%d}"
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    key = f"{request.url.path}?{query}#{version}@{today}"
+    digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+    etag = f'W/"{version}-{today}-{digest}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        RESPONSE_CACHE_REQUESTS.labels(route=route, outcome="not_modified").inc()
+        return CacheEntry(key, etag, Response(status_code=304, headers=headers))
+
+    cached = cache.get(key)
+    if cached is not None:
+        RESPONSE_CACHE_REQUESTS.labels(route=route, outcome="hit").inc()
+        return CacheEntry(key, etag, Response(cached.body, media_type=cached.media_type, headers=headers))
+
+    RESPONSE_CACHE_REQUESTS.labels(route=route, outcome="miss").inc()
+    return CacheEntry(key, etag)
@@ -0,0 +1,55 @@
+"""
+Periodic maintenance tasks run on background threads.
+
+Each task runs on its own daemon thread, first after one interval and then
+every interval after the previous run finishes, so a slow run never
+overlaps the next. trigger() runs a task early; triggers arriving during a
+run coalesce into one more run. Failures are logged and the task keeps its
+schedule.
+"""
+import logging
+import threading
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+_stop = threading.Event()
+_threads: List[threading.Thread] = []
+_wakeups: Dict[str, threading.Event] = {}
+
+
+def schedule(name: str, interval_seconds: float, task: Callable[[], object]) -> None:
+    """Run `task` every `interval_seconds` until stop() (no-op if the interval is 0)."""
+    if interval_seconds <= 0:
+        return
+    wake = _wakeups[name] = threading.Event()
+
+    def loop():
+        while True:
+            wake.wait(interval_seconds)
+            wake.clear()
+            if _stop.is_set():
+                return
+            try:
+                task()
+            except Exception as e:
+                logger.error(f"Scheduled task {name} failed: {e}", exc_info=True)
+
+    thread = threading.Thread(target=loop, name=f"scheduled-{name}", daemon=True)
+    thread.start()
+    _threads.append(thread)
+    logger.info(f"Scheduled {name} every {interval_seconds:.0f}s")
+
+
+def trigger(name: str) -> None:
+    """Run a scheduled task now rather than at its next interval (no-op if not scheduled here)."""
+    wake = _wakeups.get(name)
+    if wake is not None:
+        wake.set()
+
+
+def stop() -> None:
+    """Stop scheduling; a run already in progress finishes on its own."""
+    _stop.set()
+    for wake in _wakeups.values():
+        wake.set()
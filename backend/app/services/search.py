@@ -0,0 +1,93 @@
+"""
+Engine-specific indexes for receipt text search.
+
+The list endpoint's `q` filter is a case-insensitive substring match on
+vendor and OCR text. Unindexed, that is a full table scan, so:
+
+- SQLite: an FTS5 table with the trigram tokenizer, kept in sync with
+  triggers, answers substring queries of three or more characters.
+- PostgreSQL: pg_trgm GIN indexes let the planner use an index for ILIKE.
+"""
+import logging
+
+from sqlalchemy import literal_column, select, text
+
+from ..models import Receipt
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "receipts_fts"
+
+# Trigram FTS can only match queries of at least three characters
+FTS_MIN_QUERY_LENGTH = 3
+
+_SQLITE_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        vendor, raw_ocr_text, content='receipts', content_rowid='rowid', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON receipts BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, vendor, raw_ocr_text) VALUES (new.rowid, new.vendor, new.raw_ocr_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON receipts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, vendor, raw_ocr_text) VALUES ('delete', old.rowid, old.vendor, old.raw_ocr_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF vendor, raw_ocr_text ON receipts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, vendor, raw_ocr_text) VALUES ('delete', old.rowid, old.vendor, old.raw_ocr_text);
+        INSERT INTO {FTS_TABLE}(rowid, vendor, raw_ocr_text) VALUES (new.rowid, new.vendor, new.raw_ocr_text);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+_POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_receipts_vendor_trgm ON receipts USING gin (vendor gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_receipts_raw_ocr_text_trgm ON receipts USING gin (raw_ocr_text gin_trgm_ops)",
+]
+
+_fts_available = False
+
+
+def install_search_indexes(engine) -> None:
+    """Create the search structures for the engine's dialect if missing."""
+    global _fts_available
+
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": FTS_TABLE},
+            ).first()
+            if exists:
+                _fts_available = True
+                return
+            try:
+                for statement in _SQLITE_FTS_DDL:
+                    conn.execute(text(statement))
+                _fts_available = True
+                logger.info("Created trigram FTS index for receipt search")
+            except Exception as e:
+                # SQLite builds before 3.34 lack the trigram tokenizer
+                logger.warning(f"Receipt FTS index unavailable, search will scan: {e}")
+        return
+
+    if engine.dialect.name == "postgresql":
+        try:
+            with engine.begin() as conn:
+                for statement in _POSTGRES_DDL:
+                    conn.execute(text(statement))
+        except Exception as e:
+            logger.warning(f"Could not create pg_trgm search indexes (needs the pg_trgm extension): {e}")
+
+
+def receipt_search_filter(q: str):
+    """Filter clause matching receipts whose vendor or OCR text contains `q`."""
+    if _fts_available and len(q) >= FTS_MIN_QUERY_LENGTH:
+        phrase = '"' + q.replace('"', '""') + '"'
+        matches = (
+            select(literal_column("rowid"))
+            .select_from(text(FTS_TABLE))
+            .where(text(f"{FTS_TABLE} MATCH :fts_query").bindparams(fts_query=phrase))
+        )
+        return literal_column("receipts.rowid").in_(matches)
+
+    return Receipt.vendor.ilike(f"%{q}%") | Receipt.raw_ocr_text.ilike(f"%{q}%")
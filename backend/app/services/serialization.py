@@ -0,0 +1,68 @@
+"""
+Column-projected receipt serialization for hot read paths.
+
+Selecting plain columns and building dicts avoids ORM identity-map work and
+a second round of Pydantic validation; the output matches ReceiptResponse.
+"""
+from typing import Any, Dict
+
+from sqlalchemy.orm import Session
+
+from ..models import Category, Receipt
+from .money import USD_EXPONENT, from_minor
+
+RECEIPT_COLUMNS = (
+    Receipt.id,
+    Receipt.vendor,
+    Receipt.amount_minor,
+    Receipt.amount_usd_minor,
+    Receipt.currency,
+    Receipt.currency_exponent,
+    Receipt.transaction_date,
+    Receipt.category_id,
+    Receipt.image_path,
+    Receipt.raw_ocr_text,
+    Receipt.status,
+    Receipt.created_at,
+    Receipt.updated_at,
+)
+
+CATEGORY_COLUMNS = (
+    Category.name.label("category_name"),
+    Category.icon.label("category_icon"),
+    Category.color.label("category_color"),
+)
+
+
+def receipt_rows_query(db: Session):
+    """Query receipt columns with their category columns outer-joined in."""
+    return db.query(*RECEIPT_COLUMNS, *CATEGORY_COLUMNS).outerjoin(
+        Category, Receipt.category_id == Category.id
+    )
+
+
+def receipt_row_to_dict(row) -> Dict[str, Any]:
+    """Convert a receipt_rows_query() row into a ReceiptResponse-shaped dict."""
+    category = None
+    if row.category_id is not None and row.category_name is not None:
+        category = {
+            "id": row.category_id,
+            "name": row.category_name,
+            "icon": row.category_icon,
+            "color": row.category_color,
+        }
+    return {
+        "id": row.id,
+        "vendor": row.vendor,
+        "amount": from_minor(row.amount_minor, row.currency_exponent),
+        "amount_usd": from_minor(row.amount_usd_minor, USD_EXPONENT),
+        "currency": row.currency,
+        "transaction_date": row.transaction_date,
+        "category_id": row.category_id,
+        "image_path": row.image_path,
+        "raw_ocr_text": row.raw_ocr_text,
+        "status": row.status,
+        "created_at": row.created_at,
+        "updated_at": row.updated_at,
+        "category": category,
+    }
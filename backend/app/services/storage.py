@@ -0,0 +1,397 @@
+"""
+Content-addressed storage for receipt images and audio notes.
+
+Uploads are stored once per distinct content, at
+`receipts_dir/blobs/<first two hex digits>/<sha256><ext>`. Receipts with
+identical files point at the same blob, and a blob is only deleted when no
+receipt references it any more. Blobs never change after they are written,
+so backups and rsync only ever copy new files.
+
+Blobs untouched for `cold_storage_after_days` move to the cold tier
+(`cold_storage_dir`, receipts_dir/cold by default) under the same relative
+path, gzip-compressed when that saves space. Receipts keep their original
+path; readers go through locate()/open_blob()/local_copy(), which look in
+both tiers.
+
+collect_garbage() reconciles the disk against the receipts table: it
+removes blobs and legacy files no receipt references, temp files from
+failed uploads, and moves files from the legacy `YYYY/MM/DD/<uuid>` layout
+into the blob store.
+"""
+import gzip
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import Receipt
+from .file_metadata import FileMetadata, read_file_metadata, save_upload
+from .metrics import STORAGE_GC_BYTES, STORAGE_GC_FILES
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Files younger than this are never collected: their receipt may not be committed yet
+ORPHAN_GRACE_SECONDS = 3600
+
+# Keep the gzip copy only if it is at least this much smaller
+MIN_COLD_SAVING = 0.05
+
+# Refuse to collect if this share of referenced files is missing (wrong
+# receipts_dir or an unmounted volume would otherwise look like all orphans)
+MAX_MISSING_SHARE = 0.5
+
+FILE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/heic": ".heic",
+    "audio/wav": ".wav",
+    "audio/ogg": ".ogg",
+    "audio/webm": ".webm",
+    "audio/mpeg": ".mp3",
+    "audio/mp4": ".m4a",
+    "audio/flac": ".flac",
+    "audio/aac": ".aac",
+}
+
+# Legacy uploads live under receipts_dir/YYYY/MM/DD
+LEGACY_DIR_PATTERN = re.compile(r"^\d{4}$")
+
+ADOPT_BATCH_SIZE = 500
+
+
+def blobs_dir() -> Path:
+    return settings.receipts_dir / "blobs"
+
+
+def tmp_dir() -> Path:
+    return settings.receipts_dir / "tmp"
+
+
+def cold_dir() -> Path:
+    return settings.cold_storage_dir or settings.receipts_dir / "cold"
+
+
+def blob_path(sha256: str, ext: str) -> Path:
+    return blobs_dir() / sha256[:2] / f"{sha256}{ext}"
+
+
+def cold_paths(path: Path) -> Optional[Tuple[Path, Path]]:
+    """(gzipped, uncompressed) cold-tier locations of a blob, or None if it isn't one."""
+    try:
+        relative = path.relative_to(blobs_dir())
+    except ValueError:
+        return None
+    plain = cold_dir() / relative
+    return plain.with_name(plain.name + ".gz"), plain
+
+
+def locate(path: str) -> Optional[Tuple[Path, bool]]:
+    """Where a receipt's file is actually stored, and whether it is gzipped."""
+    hot = Path(path)
+    if hot.is_file():
+        return hot, False
+    cold = cold_paths(hot)
+    if cold:
+        gzipped, plain = cold
+        if gzipped.is_file():
+            return gzipped, True
+        if plain.is_file():
+            return plain, False
+    return None
+
+
+def exists(path: str) -> bool:
+    return locate(path) is not None
+
+
+def open_blob(path: str) -> BinaryIO:
+    """Open a receipt's file for reading, decompressing cold blobs on the fly."""
+    found = locate(path)
+    if not found:
+        raise FileNotFoundError(f"Receipt file not found: {path}")
+    actual, gzipped = found
+    return gzip.open(actual, "rb") if gzipped else open(actual, "rb")
+
+
+@contextmanager
+def local_copy(path: str) -> Iterator[str]:
+    """A plain file path for tools that need one (PIL, ffmpeg); cold blobs are decompressed to a temp file."""
+    found = locate(path)
+    if not found or not found[1]:
+        yield str(found[0]) if found else path
+        return
+    with tempfile.NamedTemporaryFile(suffix=Path(path).suffix, delete=False) as tmp, gzip.open(found[0], "rb") as src:
+        shutil.copyfileobj(src, tmp)
+    try:
+        yield tmp.name
+    finally:
+        Path(tmp.name).unlink(missing_ok=True)
+
+
+def store_upload(source: BinaryIO, default_ext: str) -> Tuple[Path, FileMetadata]:
+    """
+    Write an upload into the blob store.
+
+    The upload is streamed to a temp file (hashing it on the way) and then
+    renamed to its content address; if that blob already exists the copy is
+    dropped and the existing blob is reused.
+    """
+    tmp_dir().mkdir(parents=True, exist_ok=True)
+    tmp = tmp_dir() / f"{uuid.uuid4()}.part"
+    try:
+        metadata = save_upload(source, tmp)
+        path = blob_path(metadata.sha256, FILE_EXTENSIONS.get(metadata.mime_type, default_ext))
+        found = locate(str(path))
+        if found:
+            # Restart the GC grace period until the new receipt is committed
+            try:
+                os.utime(found[0])
+            except FileNotFoundError:
+                found = None  # Deleted in the meantime: store this copy instead
+        if found:
+            tmp.unlink()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return path, metadata
+
+
+def remove_file(path: str) -> int:
+    """Delete a file from whichever tier holds it; returns the bytes freed."""
+    candidates = [Path(path), *(cold_paths(Path(path)) or ())]
+    freed = 0
+    for candidate in candidates:
+        try:
+            freed += candidate.stat().st_size
+            candidate.unlink()
+        except FileNotFoundError:
+            pass
+    return freed
+
+
+def release_file(db: Session, receipt_id: str, path: Optional[str]) -> bool:
+    """
+    Delete a receipt's file unless another receipt still references it.
+
+    Files touched within ORPHAN_GRACE_SECONDS are left to collect_garbage():
+    a concurrent upload of the same content may have just reused the blob
+    for a receipt that isn't committed yet.
+
+    Returns True if the file was deleted.
+    """
+    if not path or path == "manual_entry":
+        return False
+    found = locate(path)
+    if found and mtime(found[0]) >= time.time() - ORPHAN_GRACE_SECONDS:
+        return False
+    shared = (
+        db.query(Receipt.id)
+        .filter(Receipt.image_path == path, Receipt.id != receipt_id)
+        .first()
+    )
+    if shared:
+        return False
+    remove_file(path)
+    return True
+
+
+@dataclass
+class GcReport:
+    """Outcome of a storage garbage-collection run."""
+    files_scanned: int = 0
+    orphans_removed: int = 0
+    temp_files_removed: int = 0
+    bytes_freed: int = 0
+    legacy_files_adopted: int = 0
+    moved_to_cold: int = 0
+    cold_bytes_saved: int = 0
+    missing_files: int = 0
+    dry_run: bool = False
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def mtime(path: Path) -> float:
+    """Modification time, or +inf (never old enough to act on) if the file has gone."""
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return float("inf")
+
+
+def iter_files(root: Path) -> Iterator[Path]:
+    if root.is_dir():
+        for path in root.rglob("*"):
+            if path.is_file():
+                yield path
+
+
+def is_legacy_path(path: Path) -> bool:
+    try:
+        return bool(LEGACY_DIR_PATTERN.match(path.relative_to(settings.receipts_dir).parts[0]))
+    except (ValueError, IndexError):
+        return False
+
+
+def iter_legacy_files() -> Iterator[Path]:
+    if settings.receipts_dir.is_dir():
+        for year in settings.receipts_dir.iterdir():
+            if year.is_dir() and LEGACY_DIR_PATTERN.match(year.name):
+                yield from iter_files(year)
+
+
+def referenced_paths(db: Session) -> set:
+    rows = (
+        db.query(Receipt.image_path)
+        .filter(Receipt.image_path != "manual_entry")
+        .distinct()
+        .execution_options(stream_results=True, yield_per=5000)
+    )
+    return {os.path.realpath(path) for (path,) in rows if path}
+
+
+def adopt_legacy_files(db: Session, report: GcReport) -> None:
+    """Move receipts still in the YYYY/MM/DD layout into the blob store."""
+    blobs = str(blobs_dir())
+    candidates = (
+        db.query(Receipt)
+        .filter(
+            Receipt.image_path != "manual_entry",
+            ~Receipt.image_path.startswith(blobs, autoescape=True),
+            Receipt.status != "processing",  # A queued job still holds the old path
+        )
+        .order_by(Receipt.id)
+        .limit(ADOPT_BATCH_SIZE)
+    )
+    offset = 0
+    while True:
+        receipts = candidates.offset(offset).all()
+        if not receipts:
+            break
+        for receipt in receipts:
+            source = Path(receipt.image_path)
+            if receipt.image_path.startswith(blobs):
+                continue  # Moved along with an earlier receipt sharing its file
+            if not is_legacy_path(source) or not source.is_file():
+                offset += 1
+                continue
+            if report.dry_run:
+                report.legacy_files_adopted += 1
+                offset += 1
+                continue
+            if receipt.file is None:
+                receipt.file = read_file_metadata(source).to_model()
+            path = blob_path(receipt.file.sha256, FILE_EXTENSIONS.get(receipt.file.mime_type, source.suffix))
+            if exists(str(path)):
+                # Same content already stored: drop this copy unless others use it
+                release_file(db, receipt.id, receipt.image_path)
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(source, path)
+                db.query(Receipt).filter(Receipt.image_path == str(source)).update(
+                    {Receipt.image_path: str(path)}, synchronize_session="evaluate"
+                )
+            receipt.image_path = str(path)
+            report.legacy_files_adopted += 1
+        db.commit()
+
+
+def compress_to_cold(blob: Path) -> int:
+    """Move a blob to the cold tier; returns the bytes saved by compression."""
+    gzipped, plain = cold_paths(blob)
+    gzipped.parent.mkdir(parents=True, exist_ok=True)
+    partial = gzipped.with_name(gzipped.name + ".part")
+    with open(blob, "rb") as src, gzip.open(partial, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst)
+
+    original = blob.stat().st_size
+    compressed = partial.stat().st_size
+    if compressed <= original * (1 - MIN_COLD_SAVING):
+        os.replace(partial, gzipped)
+        blob.unlink()
+        return original - compressed
+    # Already-compressed formats (JPEG, Opus) barely shrink; store them as-is
+    partial.unlink()
+    shutil.move(blob, plain)
+    return 0
+
+
+def collect_garbage(dry_run: bool = False) -> GcReport:
+    """Reconcile stored files against the receipts table (see module docstring)."""
+    report = GcReport(dry_run=dry_run)
+    now = time.time()
+    cutoff = now - ORPHAN_GRACE_SECONDS
+
+    def remove(path: Path, counter: str) -> None:
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return  # Collected concurrently by another process
+        if not dry_run:
+            path.unlink(missing_ok=True)
+        setattr(report, counter, getattr(report, counter) + 1)
+        report.bytes_freed += size
+        STORAGE_GC_FILES.labels(action=counter).inc()
+        STORAGE_GC_BYTES.labels(action=counter).inc(size)
+
+    db = SessionLocal()
+    try:
+        adopt_legacy_files(db, report)
+        referenced = referenced_paths(db)
+    finally:
+        db.close()
+
+    report.missing_files = sum(1 for path in referenced if not exists(path))
+    if referenced and report.missing_files > len(referenced) * MAX_MISSING_SHARE:
+        logger.error(
+            f"{report.missing_files} of {len(referenced)} receipt files are missing; "
+            f"is RECEIPTS_DIR ({settings.receipts_dir}) right? Skipping garbage collection"
+        )
+        return report
+
+    # Temp files left by uploads that failed part-way
+    for path in iter_files(tmp_dir()):
+        if mtime(path) < cutoff:
+            remove(path, "temp_files_removed")
+
+    # Unreferenced blobs in either tier, and unreferenced legacy uploads
+    for path in [*iter_files(blobs_dir()), *iter_legacy_files()]:
+        report.files_scanned += 1
+        if os.path.realpath(path) not in referenced and mtime(path) < cutoff:
+            remove(path, "orphans_removed")
+    for path in iter_files(cold_dir()):
+        report.files_scanned += 1
+        relative = path.relative_to(cold_dir())
+        logical = blobs_dir() / relative.with_name(relative.name.removesuffix(".gz"))
+        if os.path.realpath(logical) not in referenced and mtime(path) < cutoff:
+            remove(path, "orphans_removed")
+
+    # Originals nobody has uploaded again for a while go to the cold tier
+    if settings.cold_storage_after_days > 0:
+        cold_cutoff = now - settings.cold_storage_after_days * 86400
+        for path in iter_files(blobs_dir()):
+            if mtime(path) < cold_cutoff:
+                report.moved_to_cold += 1
+                if not dry_run:
+                    report.cold_bytes_saved += compress_to_cold(path)
+                    STORAGE_GC_FILES.labels(action="moved_to_cold").inc()
+
+    logger.info(f"Storage GC: {report.to_dict()}")
+    return report
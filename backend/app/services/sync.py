@@ -0,0 +1,133 @@
+"""
+Delta sync for offline clients.
+
+A sync token marks a position in the (change_seq, id) ordering of receipts.
+change_seq is the data version of the transaction that last wrote the row
+(see database.py): versions are handed out in commit order, so unlike a
+wall-clock timestamp it never goes backwards (the US/Eastern clock repeats
+an hour every November) and a row can't become visible behind a position a
+client has already passed. Deletions are tombstones on the same sequence.
+
+Clients send back the token from their last pull and receive only receipts
+changed after it plus the ids of receipts deleted since then.
+"""
+import base64
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from ..config import get_settings
+from ..database import current_data_version
+from ..models import Receipt, ReceiptTombstone, get_eastern_time
+from .serialization import receipt_row_to_dict, receipt_rows_query
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class SyncPosition:
+    change_seq: int
+    receipt_id: str  # Last receipt returned at change_seq ("" once all of it was)
+    issued_at: datetime  # For expiring tokens older than the tombstone retention
+
+
+class InvalidSyncToken(ValueError):
+    """Raised when a client sends a token this server did not issue."""
+
+
+def encode_token(position: Optional[SyncPosition]) -> str:
+    if position is None:
+        return ""
+    raw = f"{position.change_seq}|{position.receipt_id}|{position.issued_at.isoformat()}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_token(token: Optional[str]) -> Optional[SyncPosition]:
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        fields = raw.split("|")
+        if len(fields) == 2:
+            # Issued when positions were timestamps: can't be placed, so treated as expired
+            datetime.fromisoformat(fields[0])
+            return SyncPosition(0, "", datetime.min)
+        change_seq, receipt_id, issued_at = fields
+        return SyncPosition(int(change_seq), receipt_id, datetime.fromisoformat(issued_at))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidSyncToken(f"Invalid sync token: {token}") from e
+
+
+def current_token(db: Session) -> str:
+    """Token for the latest change, so the next get_changes() returns only newer ones."""
+    return encode_token(SyncPosition(current_data_version(db), "", get_eastern_time()))
+
+
+def prune_tombstones(db: Session) -> int:
+    """Forget deletions older than the retention window. Caller commits."""
+    cutoff = get_eastern_time() - timedelta(days=settings.sync_tombstone_retention_days)
+    return db.query(ReceiptTombstone).filter(ReceiptTombstone.deleted_at < cutoff).delete()
+
+
+def get_changes(db: Session, token: Optional[str], limit: int) -> dict:
+    """
+    Receipts changed and deleted after `token`, at most `limit` receipts per call.
+
+    Raises:
+        InvalidSyncToken: If the token cannot be decoded
+    """
+    since = decode_token(token)
+    issued_at = get_eastern_time()
+
+    # Deletions older than the retention window are forgotten, so a client
+    # that has been away longer must rebuild its replica from scratch
+    reset = False
+    cutoff = issued_at - timedelta(days=settings.sync_tombstone_retention_days)
+    if since and since.issued_at < cutoff:
+        since, reset = None, True
+
+    # Every transaction up to this version has committed, so nothing can
+    # still appear at or below it; later changes wait for the next pull
+    upper = current_data_version(db)
+
+    query = receipt_rows_query(db).add_columns(Receipt.change_seq).filter(Receipt.change_seq <= upper)
+    if since and since.receipt_id:
+        query = query.filter(or_(
+            Receipt.change_seq > since.change_seq,
+            and_(Receipt.change_seq == since.change_seq, Receipt.id > since.receipt_id),
+        ))
+    elif since:
+        query = query.filter(Receipt.change_seq > since.change_seq)
+    rows = query.order_by(Receipt.change_seq, Receipt.id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        next_position = SyncPosition(rows[-1].change_seq, rows[-1].id, issued_at)
+    else:
+        next_position = SyncPosition(upper, "", issued_at)
+
+    deleted = []
+    if since:
+        # A page ending inside a sequence number returns the deletions made
+        # at that number with it; every later page starts past them
+        tombstones = (
+            db.query(ReceiptTombstone.receipt_id)
+            .filter(
+                ReceiptTombstone.change_seq > since.change_seq,
+                ReceiptTombstone.change_seq <= next_position.change_seq,
+            )
+            .order_by(ReceiptTombstone.change_seq, ReceiptTombstone.receipt_id)
+        )
+        deleted = [t.receipt_id for t in tombstones]
+
+    return {
+        "items": [receipt_row_to_dict(row) for row in rows],
+        "deleted": deleted,
+        "next_token": encode_token(next_position),
+        "has_more": has_more,
+        "reset": reset,
+    }
@@ -0,0 +1,67 @@
+"""
+OpenTelemetry tracing with offline-friendly exporters.
+
+Spans are written either to stdout or to a JSON-lines file, so traces can be
+inspected without a collector. Trace context is carried through the
+processing queue so an upload and its later processing share one trace.
+"""
+import logging
+from typing import Dict, Optional
+
+from opentelemetry import context, propagate, trace
+
+from ..config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Proxy tracer; starts recording once setup_tracing() installs a provider
+tracer = trace.get_tracer("vyaya")
+
+_configured = False
+
+
+def setup_tracing() -> None:
+    """Install the tracer provider and exporter selected in settings."""
+    global _configured
+    if _configured or settings.trace_exporter == "none":
+        return
+
+    # The SDK is only needed when tracing is on
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    if settings.trace_exporter == "console":
+        exporter = ConsoleSpanExporter()
+    elif settings.trace_exporter == "file":
+        settings.trace_file.parent.mkdir(parents=True, exist_ok=True)
+        exporter = ConsoleSpanExporter(
+            out=open(settings.trace_file, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    else:
+        logger.warning(f"Unknown trace exporter '{settings.trace_exporter}', tracing disabled")
+        return
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.app_name.lower()}),
+        sampler=ParentBased(TraceIdRatioBased(settings.trace_sample_ratio)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _configured = True
+    logger.info(f"Tracing enabled with {settings.trace_exporter} exporter")
+
+
+def inject_trace_context() -> Dict[str, str]:
+    """Serialize the current trace context so it can travel with a queued job."""
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier
+
+
+def extract_trace_context(carrier: Optional[Dict[str, str]]) -> context.Context:
+    """Rebuild a trace context from a carrier produced by inject_trace_context()."""
+    return propagate.extract(carrier or {})
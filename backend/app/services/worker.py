@@ -1,65 +1,200 @@
 """
-Background worker for sequential receipt processing.
+Background worker pool for receipt processing.
+
+Every job runs against a deadline (see services/deadlines.py). A job that
+runs out of time is requeued with exponential backoff until its last
+attempt, which saves the receipt for review as failed, so the time from
+upload to review is bounded by roughly job_max_attempts deadlines plus the
+backoff between them. A watchdog replaces worker threads that die or stay
+stuck on one job well past its deadline, and requeues their job. Each run
+numbers itself on the receipt (processing_attempt), and a run that finishes
+after a newer one started drops its result instead of overwriting it.
 """
 import asyncio
 import logging
-import queue
+import random
 import threading
 import time
-from datetime import datetime
-from zoneinfo import ZoneInfo
+from contextlib import ExitStack, contextmanager, nullcontext
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
-from PIL import Image, ExifTags
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, text
 
+from ..config import get_settings
 from ..database import SessionLocal
-from ..models import Receipt, Category, get_eastern_date
+from ..models import Receipt, Category, get_eastern_date, get_eastern_time
 from ..services.llm import process_receipt_image
+from ..services.audio import AUDIO_EXTENSIONS, FFMPEG_TIMEOUT_SECONDS, prepare_audio
 from ..services.categorizer import auto_categorize
-from ..services.currency import convert_to_usd
+from ..services.deadlines import DeadlineExceeded, JobDeadline, call_with_timeout
+from ..services.events import publish_receipt
+from ..services.file_metadata import read_file_metadata
+from ..services.fx_backfill import convert_later, immediate_usd
+from ..services.storage import local_copy
+from ..services.job_queue import DEFAULT_LANE, LANES, ReceiptJob, create_queue
+from ..services import scheduler
+from ..services.metrics import (
+    JOB_RETRIES,
+    QUEUE_DEPTH,
+    QUEUE_OLDEST_AGE_SECONDS,
+    QUEUE_WAIT_SECONDS,
+    RECEIPTS_PROCESSED,
+    WORKER_RESTARTS,
+    observe_stage,
+)
+from ..services.profiling import profile
+from ..services.tracing import tracer, inject_trace_context, extract_trace_context
 
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
-# Global processing queue
-# Tuples of (receipt_id, image_path_str)
-receipt_queue = queue.Queue()
+# A worker still on the same job this long after its deadline is stuck
+WATCHDOG_GRACE_SECONDS = 60.0
+
+# Global processing queue, shared by all worker threads (and, with the
+# database backend, by every API and worker process)
+receipt_queue = create_queue()
+
+for _lane in LANES:
+    QUEUE_DEPTH.labels(lane=_lane).set_function(lambda lane=_lane: receipt_queue.lane_depth(lane))
+    QUEUE_OLDEST_AGE_SECONDS.labels(lane=_lane).set_function(lambda lane=_lane: receipt_queue.oldest_age(lane))
+
+
+def enqueue_receipt(receipt_id: str, file_path: str, lane: str = DEFAULT_LANE, profile: bool = False) -> ReceiptJob:
+    """Queue a receipt for background processing, carrying the caller's trace context."""
+    job = ReceiptJob(
+        receipt_id=receipt_id,
+        file_path=file_path,
+        lane=lane,
+        trace_context=inject_trace_context(),
+        profile=profile,
+    )
+    receipt_queue.put(job)
+    return job
+
+
+@contextmanager
+def pipeline_stage(stage: str):
+    """Wrap a pipeline stage in both a trace span and a latency histogram."""
+    with tracer.start_as_current_span(f"pipeline.{stage}"), observe_stage(stage):
+        yield
+
+
+def assign_fallback_category(receipt: Receipt, db: Session) -> None:
+    if not receipt.category_id:
+        others_category = db.query(Category).filter(
+            func.lower(Category.name) == "others"
+        ).first()
+        if others_category:
+            receipt.category_id = others_category.id
 
-def process_receipt_task(receipt_id: str, file_path: str):
+
+def apply_failure(receipt: Receipt, db: Session, error: Exception) -> None:
+    """Fill in defaults so a receipt that couldn't be extracted can still be reviewed."""
+    receipt.vendor = receipt.vendor or "Unknown Vendor"
+    receipt.amount = receipt.amount if receipt.amount is not None else 0.0
+    receipt.currency = receipt.currency or "USD"
+    receipt.amount_usd = immediate_usd(receipt.amount, receipt.currency)
+    # Assign 'Others' category on failure
+    assign_fallback_category(receipt, db)
+    receipt.status = "review"  # Still allow review even on failure
+    receipt.raw_ocr_text = f"Processing failed: {str(error)}"
+
+
+# Attempt bookkeeping goes through text statements so it moves neither
+# updated_at nor the data version (see database.py): clients see no change
+_CLAIM_ATTEMPT = text(
+    "UPDATE receipts SET processing_attempt = COALESCE(processing_attempt, 0) + 1 "
+    "WHERE id = :id AND status = 'processing'"
+)
+_READ_ATTEMPT = text("SELECT processing_attempt FROM receipts WHERE id = :id")
+_LOCK_CURRENT_ATTEMPT = text(
+    "UPDATE receipts SET processing_attempt = processing_attempt "
+    "WHERE id = :id AND status = 'processing' AND processing_attempt = :attempt"
+)
+
+
+def claim_attempt(db: Session, receipt_id: str) -> Optional[int]:
+    """
+    Number this run of a receipt's job; None if the receipt isn't awaiting processing.
+
+    Every run takes the next number: a retry, a job the watchdog or a claim
+    timeout handed to another worker, a reprocess. A run that finishes late
+    can then tell that a newer one has superseded it.
+    """
+    if not db.execute(_CLAIM_ATTEMPT, {"id": receipt_id}).rowcount:
+        db.rollback()
+        return None
+    attempt = db.execute(_READ_ATTEMPT, {"id": receipt_id}).scalar()
+    db.commit()
+    return attempt
+
+
+def still_current(db: Session, receipt_id: str, attempt: int) -> bool:
+    """
+    Whether `attempt` may save its result: the receipt is still processing
+    and no later attempt has started. When it may, the row stays locked by
+    this transaction until it commits.
+    """
+    return bool(db.execute(_LOCK_CURRENT_ATTEMPT, {"id": receipt_id, "attempt": attempt}).rowcount)
+
+
+def process_receipt_task(
+    receipt_id: str,
+    file_path: str,
+    deadline: Optional[JobDeadline] = None,
+    final_attempt: bool = True,
+):
     """
     Process a single receipt. This runs inside the worker thread.
+
+    Raises:
+        DeadlineExceeded: If the job ran out of time and isn't on its final
+            attempt; the receipt is left untouched for the retry
     """
     logger.info(f"Starting processing for receipt {receipt_id}")
+    deadline = deadline or JobDeadline(settings.job_deadline_seconds)
     db = SessionLocal()
+    files = ExitStack()
     try:
+        attempt = claim_attempt(db, receipt_id)
+        if attempt is None:
+            logger.warning(f"Receipt {receipt_id} is gone or no longer processing; skipping its job")
+            return
+
         # Get receipt record
         receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
         if not receipt:
             logger.error(f"Receipt {receipt_id} not found immediately during processing")
             return
 
+        # Files in the cold tier are decompressed to a temp file for PIL/ffmpeg
+        file_path = files.enter_context(local_copy(receipt.image_path or file_path))
+
+        # File metadata is captured at upload; older receipts get it recorded now
+        file_info = receipt.file
+        if file_info is None:
+            try:
+                with pipeline_stage("file_metadata"):
+                    file_info = receipt.file = read_file_metadata(Path(file_path)).to_model()
+            except OSError as e:
+                logger.warning(f"Could not read file metadata for receipt {receipt_id}: {e}")
+        mime_type = file_info.mime_type if file_info else None
+        captured_at = file_info.captured_at if file_info else None
+
+        # Determine file type first
+        file_ext = Path(file_path).suffix.lower()
+        is_audio = (mime_type or "").startswith("audio/") or file_ext in AUDIO_EXTENSIONS.values()
+
         # Broad try/except to ensure we catch *anything* and update status
         try:
-            # Determine file type first
-            file_ext = Path(file_path).suffix.lower()
-            is_audio = file_ext in {".webm", ".wav", ".mp3", ".m4a", ".ogg"}
-
-            # 1. Metadata Extraction (Images only)
+            # 1. Capture date from the stored EXIF metadata (images only)
             extracted_date = None
-            if not is_audio:
-                try:
-                    with Image.open(file_path) as img:
-                        exif = img._getexif()
-                        if exif:
-                            for tag, value in exif.items():
-                                if tag in ExifTags.TAGS and ExifTags.TAGS[tag] == 'DateTimeOriginal':
-                                    # Format: YYYY:MM:DD HH:MM:SS
-                                    extracted_date = datetime.strptime(value, '%Y:%m:%d %H:%M:%S').date()
-                                    break
-                except Exception as e:
-                    logger.warning(f"Error extracting metadata for receipt {receipt_id}: {e}")
+            if not is_audio and captured_at:
+                extracted_date = captured_at.date()
 
             if not extracted_date:
                 # Fallback to current time in EST
@@ -69,12 +204,27 @@ def process_receipt_task(receipt_id: str, file_path: str):
 
             # 2. LLM Extraction
             if is_audio:
-                 # Audio processing
-                 from ..services.llm import process_receipt_audio
-                 ocr_result = asyncio.run(process_receipt_audio(file_path))
+                # Downmix, resample and trim silence before sending
+                with pipeline_stage("audio"):
+                    prepared = prepare_audio(file_path, timeout=deadline.budget("audio", FFMPEG_TIMEOUT_SECONDS))
+                try:
+                    with pipeline_stage("llm"):
+                        from ..services.llm import process_receipt_audio
+                        ocr_result = call_with_timeout(
+                            "llm",
+                            deadline.budget("llm", settings.llm_timeout_seconds),
+                            lambda: asyncio.run(process_receipt_audio(str(prepared.path), prepared.mime_type)),
+                        )
+                finally:
+                    prepared.cleanup()
             else:
-                 # Image processing
-                 ocr_result = asyncio.run(process_receipt_image(file_path))
+                with pipeline_stage("llm"):
+                    # The worker stops waiting on the provider at the deadline
+                    ocr_result = call_with_timeout(
+                        "llm",
+                        deadline.budget("llm", settings.llm_timeout_seconds),
+                        lambda: asyncio.run(process_receipt_image(file_path, mime_type)),
+                    )
             
             # Check for explicit failure returned by LLM service
             if ocr_result.get("confidence") == 0.0 and "Error" in ocr_result.get("raw_text", ""):
@@ -82,92 +232,240 @@ def process_receipt_task(receipt_id: str, file_path: str):
 
             # Update receipt with extracted data (with defaults for missing values)
             receipt.vendor = ocr_result.get("vendor") or "Unknown Vendor"
-            receipt.amount = ocr_result.get("amount") if ocr_result.get("amount") is not None else 0.0
             receipt.currency = ocr_result.get("currency", "USD") if ocr_result.get("currency") is not None else "USD"
+            receipt.amount = ocr_result.get("amount") if ocr_result.get("amount") is not None else 0.0
             receipt.raw_ocr_text = ocr_result.get("raw_text")
+            receipt.prompt_version = ocr_result.get("prompt_version")
 
-            # Convert to USD if amount is present
-            if receipt.amount:
-                 receipt.amount_usd = asyncio.run(convert_to_usd(
-                     receipt.amount, 
-                     receipt.currency, 
-                     receipt.transaction_date
-                 ))
-            else:
-                 receipt.amount_usd = 0.0
+            # Non-USD amounts are converted by the FX backfill job, off the pipeline
+            receipt.amount_usd = immediate_usd(receipt.amount, receipt.currency)
             
             # 3. Categorization
-            if ocr_result.get("category"):
-                # Try to find category by name returned by LLM
-                category = db.query(Category).filter(
-                    func.lower(Category.name) == func.lower(ocr_result["category"])
-                ).first()
-                if category:
-                    receipt.category_id = category.id
-            
-            # Fallback to keyword categorization
-            if not receipt.category_id and receipt.vendor:
-                category = auto_categorize(receipt.vendor, db)
-                if category:
-                    receipt.category_id = category.id
-
-            # Final fallback to 'Others' category
-            if not receipt.category_id:
-                others_category = db.query(Category).filter(
-                    func.lower(Category.name) == "others"
-                ).first()
-                if others_category:
-                    receipt.category_id = others_category.id
+            deadline.check("categorize")
+            with pipeline_stage("categorize"):
+                if ocr_result.get("category"):
+                    # Try to find category by name returned by LLM
+                    category = db.query(Category).filter(
+                        func.lower(Category.name) == func.lower(ocr_result["category"])
+                    ).first()
+                    if category:
+                        receipt.category_id = category.id
+                
+                # Fallback to keyword categorization
+                if not receipt.category_id and receipt.vendor:
+                    category = auto_categorize(receipt.vendor, db)
+                    if category:
+                        receipt.category_id = category.id
+
+                # Final fallback to 'Others' category
+                assign_fallback_category(receipt, db)
 
             receipt.status = "review"
+            outcome = "success"
             logger.info(f"Receipt {receipt_id} processed successfully")
 
         except Exception as e:
+            if isinstance(e, DeadlineExceeded) and not final_attempt:
+                db.rollback()
+                raise
             logger.error(f"Processing failed for receipt {receipt_id}: {e}", exc_info=True)
-            # Set default values on failure
-            receipt.vendor = receipt.vendor or "Unknown Vendor"
-            receipt.amount = receipt.amount if receipt.amount is not None else 0.0
-            receipt.amount_usd = 0.0
-            receipt.currency = receipt.currency or "USD"
-            # Assign 'Others' category on failure
-            if not receipt.category_id:
-                others_category = db.query(Category).filter(
-                    func.lower(Category.name) == "others"
-                ).first()
-                if others_category:
-                    receipt.category_id = others_category.id
-            receipt.status = "review"  # Still allow review even on failure
-            receipt.raw_ocr_text = f"Processing failed: {str(e)}"
+            apply_failure(receipt, db, e)
+            outcome = "timeout" if isinstance(e, DeadlineExceeded) else "failed"
             
-        db.commit()
+        receipt.processed_at = get_eastern_time()  # Feeds the drain rate used for admission control
+        with pipeline_stage("db_commit"):
+            # A run that outlived its deadline may finish after its
+            # replacement did, or after the receipt left processing
+            if not still_current(db, receipt_id, attempt):
+                db.rollback()
+                logger.warning(f"Dropping late result of attempt {attempt} for receipt {receipt_id}")
+                RECEIPTS_PROCESSED.labels(kind="audio" if is_audio else "image", outcome="superseded").inc()
+                return
+            db.commit()
+        if receipt.amount_usd_minor is None:
+            convert_later()
+        RECEIPTS_PROCESSED.labels(kind="audio" if is_audio else "image", outcome=outcome).inc()
+        publish_receipt(receipt)
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.critical(f"Critical error in worker for receipt {receipt_id}: {e}", exc_info=True)
     finally:
+        files.close()
         db.close()
 
 
-def worker_loop():
+def requeue(job: ReceiptJob) -> None:
+    """Run the job again after an exponential, jittered backoff."""
+    job.attempts += 1
+    delay = settings.job_retry_backoff_seconds * 2 ** (job.attempts - 1) * random.uniform(0.8, 1.2)
+    JOB_RETRIES.labels(lane=job.lane).inc()
+    logger.warning(f"Retrying receipt {job.receipt_id} in {delay:.0f}s (attempt {job.attempts + 1} of {settings.job_max_attempts})")
+    receipt_queue.retry(job, delay)
+
+
+def fail_receipt(receipt_id: str, error: Exception) -> None:
+    """Save a receipt whose every attempt ran out of time as failed, for review."""
+    db = SessionLocal()
+    try:
+        receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
+        if not receipt or receipt.status != "processing":
+            return
+        apply_failure(receipt, db, error)
+        receipt.processed_at = get_eastern_time()
+        db.commit()
+        if receipt.amount_usd_minor is None:
+            convert_later()
+        is_audio = receipt.file is not None and (receipt.file.mime_type or "").startswith("audio/")
+        RECEIPTS_PROCESSED.labels(kind="audio" if is_audio else "image", outcome="timeout").inc()
+        publish_receipt(receipt)
+    finally:
+        db.close()
+
+
+@dataclass
+class WorkerSlot:
+    """One worker thread and the job it's running."""
+    index: int
+    thread: Optional[threading.Thread] = None
+    job: Optional[ReceiptJob] = None
+    started_at: float = 0.0  # time.monotonic() when the job was taken
+    abandoned: bool = False  # Replaced by the watchdog; the thread exits when it returns
+    stopped: bool = False  # Exited because the queue closed
+
+
+class WorkerPool:
+    """The worker threads, and the watchdog that replaces stuck or dead ones."""
+
+    def __init__(self):
+        self._slots: List[WorkerSlot] = []
+        self._lock = threading.Lock()
+
+    def start(self, count: int) -> None:
+        with self._lock:
+            self._slots = [self._spawn(i) for i in range(count)]
+        scheduler.schedule("worker-watchdog", settings.worker_watchdog_interval_seconds, self.check)
+
+    def _spawn(self, index: int) -> WorkerSlot:
+        slot = WorkerSlot(index)
+        slot.thread = threading.Thread(target=worker_loop, args=(self, slot), name=f"receipt-worker-{index}", daemon=True)
+        slot.thread.start()
+        return slot
+
+    def begin(self, slot: WorkerSlot, job: ReceiptJob) -> None:
+        with self._lock:
+            slot.job, slot.started_at = job, time.monotonic()
+
+    def finish(self, slot: WorkerSlot) -> bool:
+        """Clear the slot's job; False if the watchdog took the job over meanwhile."""
+        with self._lock:
+            if slot.abandoned:
+                return False
+            slot.job = None
+            return True
+
+    def check(self) -> None:
+        """Replace workers that died or are stuck, and requeue their jobs."""
+        limit = settings.job_deadline_seconds + WATCHDOG_GRACE_SECONDS
+        now = time.monotonic()
+        replaced = []
+        with self._lock:
+            for position, slot in enumerate(self._slots):
+                if slot.thread.is_alive():
+                    if slot.job is None or now - slot.started_at < limit:
+                        continue
+                    reason = "stuck"
+                elif slot.stopped:
+                    continue
+                else:
+                    reason = "died"
+                slot.abandoned = True
+                replaced.append((reason, slot.index, slot.job, now - slot.started_at))
+                slot.job = None
+                self._slots[position] = self._spawn(slot.index)
+
+        for reason, index, job, running_for in replaced:
+            WORKER_RESTARTS.labels(reason=reason).inc()
+            if job is None:
+                logger.error(f"Worker {index} died; started a replacement")
+                continue
+            logger.error(
+                f"Worker {index} {reason} on receipt {job.receipt_id} after {running_for:.0f}s; "
+                f"started a replacement"
+            )
+            if job.attempts + 1 < settings.job_max_attempts:
+                requeue(job)
+            else:
+                receipt_queue.task_done(job)
+                fail_receipt(job.receipt_id, DeadlineExceeded("job", settings.job_deadline_seconds))
+
+    def join(self) -> None:
+        """Wait for every live worker to exit (after the queue is closed); stuck ones aren't waited for."""
+        while True:
+            with self._lock:
+                threads = [slot.thread for slot in self._slots if slot.thread.is_alive()]
+            if not threads:
+                return
+            for thread in threads:
+                thread.join()
+
+
+pool = WorkerPool()
+
+
+def worker_loop(pool: WorkerPool, slot: WorkerSlot):
     """
     Main loop for the background worker thread.
     """
     logger.info("Receipt processing worker started")
-    while True:
+    while not slot.abandoned:
+        # Blocking get
+        job = receipt_queue.get()
+        if job is None: # queue closed
+            slot.stopped = True
+            break
+
+        pool.begin(slot, job)
+        timed_out = False
         try:
-            # Blocking get
-            receipt_id, file_path = receipt_queue.get()
-            if receipt_id is None: # poison pill
-                break
-            
-            process_receipt_task(receipt_id, file_path)
-            
-            receipt_queue.task_done()
+            QUEUE_WAIT_SECONDS.labels(lane=job.lane).observe(time.time() - job.enqueued_at)
+            parent = extract_trace_context(job.trace_context)
+
+            # Record the time spent waiting as its own span in the upload's trace
+            tracer.start_span(
+                "queue.wait",
+                context=parent,
+                start_time=int(job.enqueued_at * 1e9),
+            ).end()
+
+            profiled = job.profile or random.random() < settings.profiling_job_sample_rate
+            with tracer.start_as_current_span(
+                "worker.process_receipt",
+                context=parent,
+                attributes={"receipt.id": job.receipt_id, "queue.lane": job.lane, "job.attempt": job.attempts + 1},
+            ), profile(f"job-{job.receipt_id}") if profiled else nullcontext():
+                process_receipt_task(
+                    job.receipt_id,
+                    job.file_path,
+                    JobDeadline(settings.job_deadline_seconds),
+                    final_attempt=job.attempts + 1 >= settings.job_max_attempts,
+                )
+        except DeadlineExceeded as e:
+            logger.warning(f"Receipt {job.receipt_id} ran out of time: {e}")
+            timed_out = True
         except Exception as e:
             logger.error(f"Error in worker loop: {e}", exc_info=True)
+        finally:
+            # A job the watchdog took over has been requeued already
+            if pool.finish(slot):
+                if timed_out:
+                    requeue(job)
+                else:
+                    receipt_queue.task_done(job)
 
 
-def start_worker():
-    """Start the background worker thread."""
-    thread = threading.Thread(target=worker_loop, daemon=True)
-    thread.start()
-    return thread
+def start_worker() -> WorkerPool:
+    """Start the pool of background worker threads and its watchdog."""
+    pool.start(settings.worker_concurrency)
+    return pool
@@ -0,0 +1,68 @@
+"""
+Standalone receipt processing worker.
+
+Run with `python -m app.worker` next to one or more API processes started
+with EMBEDDED_WORKER=false. Both sides must use QUEUE_BACKEND=database so
+they share the processing_jobs table; extraction then scales independently
+of the HTTP tier, across processes and machines.
+"""
+import logging
+import signal
+import sys
+
+from prometheus_client import start_http_server
+
+from .config import get_settings
+from .database import init_db
+from .services import fx_backfill, scheduler
+from .services.categorizer import seed_categories
+from .services.maintenance import run_maintenance
+from .services.profiling import continuous as continuous_profiler
+from .services.storage import collect_garbage
+from .services.tracing import setup_tracing
+from .services.worker import receipt_queue, start_worker
+
+settings = get_settings()
+logger = logging.getLogger("app.worker")
+
+
+def main() -> int:
+    logging.basicConfig(
+        level=logging.DEBUG if settings.debug else logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    if settings.queue_backend != "database":
+        logger.error("A standalone worker needs QUEUE_BACKEND=database to share jobs with the API")
+        return 1
+
+    setup_tracing()
+    if init_db():
+        seed_categories()
+    settings.receipts_dir.mkdir(parents=True, exist_ok=True)
+
+    if settings.worker_metrics_port:
+        start_http_server(settings.worker_metrics_port)
+        logger.info(f"Worker metrics on port {settings.worker_metrics_port}")
+
+    scheduler.schedule("storage-gc", settings.storage_gc_interval_hours * 3600, collect_garbage)
+    scheduler.schedule("db-maintenance", settings.db_maintenance_interval_hours * 3600, run_maintenance)
+    fx_backfill.start()
+    continuous_profiler.start()
+
+    def shutdown(signum, frame):
+        logger.info("Shutting down after in-flight receipts finish")
+        receipt_queue.close()
+        scheduler.stop()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    pool = start_worker()
+    logger.info(f"Worker {receipt_queue.worker_id} started with {settings.worker_concurrency} threads")
+    pool.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
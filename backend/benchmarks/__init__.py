@@ -0,0 +1 @@
+# Vyaya benchmarks
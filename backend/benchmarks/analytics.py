@@ -0,0 +1,104 @@
+"""
+Analytics snapshot load time, refresh cost and query latency.
+
+Seeds a scratch database (1M receipts by default), loads the columnar
+snapshot, then times each dashboard analytics query against the snapshot
+and, for comparison, the equivalent per-vendor GROUP BY in SQL.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.analytics --receipts 1000000 --repeat 20
+"""
+import argparse
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+from .env import configure_environment
+
+
+def timed(fn, repeat: int) -> float:
+    """Median wall time of `fn` in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(1000 * (time.perf_counter() - start))
+    return statistics.median(samples)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--receipts", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--changes", type=int, default=1000, help="receipts updated before timing a refresh")
+    args = parser.parse_args(argv)
+
+    configure_environment(analytics_refresh_seconds="0")
+
+    from sqlalchemy import func
+
+    from app.database import SessionLocal, init_db
+    from app.services.categorizer import seed_categories
+    from app.models import Receipt, get_eastern_date, get_eastern_time
+    from app.services.analytics import ReceiptSnapshot
+
+    from .seed import seed_receipts
+
+    init_db()
+    seed_categories()
+    print(f"Seeding {args.receipts} receipts...")
+    seed_receipts(args.receipts)
+
+    snapshot = ReceiptSnapshot()
+    start = time.perf_counter()
+    snapshot.ensure_fresh()
+    load_seconds = time.perf_counter() - start
+    memory = sum(array.nbytes for array in snapshot.arrays.values())
+    print(f"snapshot load          {load_seconds:>9.2f} s   ({memory / 1e6:.1f} MB for {snapshot.size} receipts)")
+
+    db = SessionLocal()
+    try:
+        ids = [row.id for row in db.query(Receipt.id).limit(args.changes)]
+        db.query(Receipt).filter(Receipt.id.in_(ids)).update(
+            {Receipt.updated_at: get_eastern_time()}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+    start = time.perf_counter()
+    snapshot.ensure_fresh()
+    print(f"refresh ({args.changes} changed)   {1000 * (time.perf_counter() - start):>9.2f} ms")
+
+    today = get_eastern_date()
+    year_ago = today - timedelta(days=364)
+    queries = {
+        "vendors (top 20)": lambda: snapshot.vendor_totals(year_ago, today, 20),
+        "heatmap (365 days)": lambda: (snapshot.daily_totals(year_ago, today), snapshot.weekday_totals(year_ago, today)),
+        "category matrix (12m)": lambda: snapshot.category_matrix(today.replace(day=1) - timedelta(days=335), today),
+        "anomalies (90 days)": lambda: snapshot.anomalies(today - timedelta(days=89), today, 3.5, 10),
+    }
+    for name, query in queries.items():
+        print(f"{name:<22} {timed(query, args.repeat):>9.2f} ms")
+
+    def sql_vendor_totals():
+        db = SessionLocal()
+        try:
+            return (
+                db.query(Receipt.vendor, func.sum(Receipt.amount_usd_minor), func.count(Receipt.id))
+                .filter(Receipt.transaction_date >= year_ago, Receipt.transaction_date <= today)
+                .group_by(Receipt.vendor)
+                .order_by(func.sum(Receipt.amount_usd_minor).desc())
+                .limit(20)
+                .all()
+            )
+        finally:
+            db.close()
+
+    print(f"{'vendors via SQL':<22} {timed(sql_vendor_totals, max(1, args.repeat // 4)):>9.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Bulk CSV import throughput.
+
+Writes a synthetic CSV with a mix of currencies spread over a year and
+imports it into a scratch database, with exchange rates served by the
+Frankfurter stub.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.bulk_import --rows 100000
+"""
+import argparse
+import csv
+import random
+import sys
+from datetime import date, timedelta
+
+from .env import configure_environment
+from .stubs import FX_RATES, FakeFxServer, FaultProfile, VENDORS
+
+
+def write_csv(path, rows: int, rng_seed: int = 42) -> None:
+    rng = random.Random(rng_seed)
+    currencies = ["USD"] * 4 + list(FX_RATES)
+    start = date.today() - timedelta(days=365)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Date", "Description", "Amount", "Currency"])
+        for _ in range(rows):
+            writer.writerow([
+                (start + timedelta(days=rng.randrange(365))).isoformat(),
+                rng.choice(VENDORS),
+                f"-{rng.uniform(1, 300):.2f}",
+                rng.choice(currencies),
+            ])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    fx = FakeFxServer(FaultProfile()).start()
+    workdir = configure_environment(fx_url=fx.url)
+    csv_path = workdir / "import.csv"
+    write_csv(csv_path, args.rows)
+
+    from app.database import init_db
+    from app.services.categorizer import seed_categories
+    from app.services.importer import import_receipts
+
+    init_db()
+    seed_categories()
+
+    try:
+        with open(csv_path, newline="") as f:
+            result = import_receipts(f, "csv")
+    finally:
+        fx.stop()
+
+    rate = result.imported / result.duration_seconds if result.duration_seconds else 0.0
+    print(f"{result.imported} rows in {result.duration_seconds:.2f}s ({rate:,.0f} rows/s), "
+          f"{result.failed} failed")
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
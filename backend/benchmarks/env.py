@@ -0,0 +1,28 @@
+"""
+Environment setup shared by the benchmark entry points.
+
+Settings are read when app modules are first imported, so these helpers must
+run before anything under `app` is imported.
+"""
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+
+def configure_environment(workdir: Optional[Path] = None, fx_url: Optional[str] = None, **extra: str) -> Path:
+    """Point the app at a scratch data directory and SQLite database."""
+    workdir = workdir or Path(tempfile.mkdtemp(prefix="vyaya-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    # app.main mounts the receipts directory as static files at import time
+    (workdir / "receipts").mkdir(exist_ok=True)
+
+    os.environ["DATA_DIR"] = str(workdir)
+    os.environ["RECEIPTS_DIR"] = str(workdir / "receipts")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'vyaya.db'}"
+    if fx_url:
+        os.environ["FX_API_URL"] = fx_url
+    for key, value in extra.items():
+        os.environ[key.upper()] = value
+    os.environ.pop("GOOGLE_API_KEY", None)
+    return workdir
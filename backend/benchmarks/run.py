@@ -0,0 +1,268 @@
+"""
+Load-test harness for the Vyaya API.
+
+Runs the FastAPI app in-process against a throwaway SQLite database seeded
+with synthetic receipts, with the genai client and the Frankfurter API
+replaced by local stubs. Requests are fired open-loop at a target rate so
+latency under load is measured rather than hidden by client back-off.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.run --receipts 100000 --rate 50 --duration 60 \\
+        --output results.json --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import socket
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from .env import configure_environment
+from .stubs import FakeFxServer, FaultProfile, VENDORS
+
+DEFAULT_MIX = "upload=1,list=4,search=2,dashboard=2,image=1"
+
+
+@dataclass
+class EndpointStats:
+    """Latencies and errors collected for one endpoint."""
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+
+    def summary(self, elapsed: float) -> dict:
+        ordered = sorted(self.latencies)
+        return {
+            "requests": len(ordered) + self.errors,
+            "errors": self.errors,
+            "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+            "mean_ms": round(1000 * sum(ordered) / len(ordered), 2) if ordered else None,
+            "p50_ms": percentile(ordered, 50),
+            "p95_ms": percentile(ordered, 95),
+            "p99_ms": percentile(ordered, 99),
+            "max_ms": round(1000 * ordered[-1], 2) if ordered else None,
+        }
+
+
+def percentile(ordered: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of a sorted list of seconds, in milliseconds."""
+    if not ordered:
+        return None
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return round(1000 * ordered[rank], 2)
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse 'upload=1,list=4' into a weight map."""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LoadDriver:
+    """Fires a weighted mix of requests at a fixed arrival rate."""
+
+    def __init__(self, base_url: str, args, receipt_ids: List[str], image_bytes: bytes):
+        self.base_url = base_url
+        self.args = args
+        self.receipt_ids = receipt_ids
+        self.image_bytes = image_bytes
+        self.rng = random.Random(args.seed)
+        self.stats: Dict[str, EndpointStats] = {}
+        self.review = EndpointStats()
+        self.watchers: List[asyncio.Task] = []
+
+    def _request(self, name: str):
+        """Build (method, url, kwargs) for one request of the given kind."""
+        if name == "upload":
+            files = {"file": ("receipt.jpg", self.image_bytes, "image/jpeg")}
+            return "POST", "/api/receipts/upload", {"files": files}
+        if name == "list":
+            params = {"page": self.rng.randint(1, 20), "per_page": self.rng.choice([20, 100])}
+            return "GET", "/api/receipts", {"params": params}
+        if name == "search":
+            term = self.rng.choice(VENDORS).split()[0]
+            return "GET", "/api/receipts", {"params": {"q": term}}
+        if name == "dashboard":
+            return "GET", "/api/dashboard/summary", {}
+        if name == "image":
+            return "GET", f"/api/receipts/image/{self.rng.choice(self.receipt_ids)}", {}
+        raise ValueError(f"Unknown endpoint kind: {name}")
+
+    async def _fire(self, client: httpx.AsyncClient, name: str):
+        method, url, kwargs = self._request(name)
+        stats = self.stats.setdefault(name, EndpointStats())
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            stats.errors += 1
+            return
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            stats.errors += 1
+            return
+        stats.latencies.append(elapsed)
+
+        if name == "upload":
+            receipt_id = response.json()["receipt"]["id"]
+            self.watchers.append(asyncio.create_task(self._await_review(client, receipt_id, start)))
+
+    async def _await_review(self, client: httpx.AsyncClient, receipt_id: str, start: float):
+        """Poll until the worker moves an upload out of 'processing'."""
+        deadline = start + self.args.review_timeout
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.args.poll_interval)
+            try:
+                response = await client.get(f"/api/receipts/{receipt_id}")
+            except httpx.HTTPError:
+                continue
+            if response.status_code == 200 and response.json()["status"] != "processing":
+                self.review.latencies.append(time.perf_counter() - start)
+                return
+        self.review.errors += 1
+
+    async def run(self) -> float:
+        mix = parse_mix(self.args.mix)
+        names, weights = list(mix), list(mix.values())
+        total = int(self.args.rate * self.args.duration)
+        limits = httpx.Limits(max_connections=self.args.concurrency)
+
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=60.0) as client:
+            loop = asyncio.get_running_loop()
+            tasks = []
+            start = loop.time()
+            for i in range(total):
+                delay = start + i / self.args.rate - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                name = self.rng.choices(names, weights)[0]
+                tasks.append(asyncio.create_task(self._fire(client, name)))
+            await asyncio.gather(*tasks)
+            elapsed = loop.time() - start
+            await asyncio.gather(*self.watchers)
+        return elapsed
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """Print p50/p95 deltas against a previous results file."""
+    print("\nDelta vs baseline (p50 / p95):")
+    for name, stats in results["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(name)
+        if not base or stats["p95_ms"] is None or base.get("p95_ms") is None:
+            continue
+        d50 = stats["p50_ms"] - base["p50_ms"]
+        d95 = stats["p95_ms"] - base["p95_ms"]
+        print(f"  {name:<12} {d50:+9.2f} ms  {d95:+9.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--receipts", type=int, default=10_000, help="synthetic receipts to seed")
+    parser.add_argument("--rate", type=float, default=20.0, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="load phase length in seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted endpoint mix")
+    parser.add_argument("--concurrency", type=int, default=100, help="max open connections")
+    parser.add_argument("--llm-latency-ms", type=float, default=1500.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=500.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--fx-latency-ms", type=float, default=80.0)
+    parser.add_argument("--fx-jitter-ms", type=float, default=20.0)
+    parser.add_argument("--fx-error-rate", type=float, default=0.0)
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="time-to-review poll interval")
+    parser.add_argument("--review-timeout", type=float, default=600.0)
+    parser.add_argument("--workdir", type=Path, help="keep the database and files here")
+    parser.add_argument("--seed", type=int, default=42, help="RNG seed for reproducible runs")
+    parser.add_argument("--output", type=Path, help="write JSON results to this file")
+    parser.add_argument("--baseline", type=Path, help="compare against a previous results file")
+    args = parser.parse_args(argv)
+
+    fx = FakeFxServer(FaultProfile(args.fx_latency_ms, args.fx_jitter_ms, args.fx_error_rate)).start()
+
+    # Settings are read at import time, so configure the environment first
+    workdir = configure_environment(args.workdir, fx.url)
+
+    import uvicorn
+    from sqlalchemy import func
+
+    from app.database import SessionLocal, init_db
+    from app.main import app
+    from app.services.categorizer import seed_categories
+    from app.models import Receipt
+    from app.services import llm
+
+    from .seed import sample_jpeg, seed_receipts
+    from .stubs import FakeGenaiClient
+
+    llm.client = FakeGenaiClient(FaultProfile(args.llm_latency_ms, args.llm_jitter_ms, args.llm_error_rate))
+
+    init_db()
+    seed_categories()
+    print(f"Seeding {args.receipts} receipts into {workdir} ...")
+    seed_start = time.perf_counter()
+    seed_receipts(args.receipts, rng_seed=args.seed)
+    seed_seconds = time.perf_counter() - seed_start
+
+    db = SessionLocal()
+    try:
+        receipt_ids = [r.id for r in db.query(Receipt.id).order_by(func.random()).limit(1000)]
+    finally:
+        db.close()
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    base_url = f"http://127.0.0.1:{port}"
+    while not server.started:
+        time.sleep(0.05)
+
+    print(f"Driving {args.rate} req/s for {args.duration}s with mix {args.mix} ...")
+    driver = LoadDriver(base_url, args, receipt_ids, sample_jpeg())
+    elapsed = asyncio.run(driver.run())
+
+    server.should_exit = True
+    fx.stop()
+
+    results = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {"python": sys.version.split()[0], "platform": platform.platform()},
+        "config": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        "seed_seconds": round(seed_seconds, 2),
+        "elapsed_seconds": round(elapsed, 2),
+        "endpoints": {name: stats.summary(elapsed) for name, stats in sorted(driver.stats.items())},
+        "time_to_review": driver.review.summary(elapsed),
+    }
+
+    print(f"\n{'endpoint':<14}{'reqs':>7}{'err':>6}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+    rows = list(results["endpoints"].items()) + [("time_to_review", results["time_to_review"])]
+    for name, s in rows:
+        print(
+            f"{name:<14}{s['requests']:>7}{s['errors']:>6}{s['throughput_rps']:>9}"
+            f"{str(s['p50_ms']):>10}{str(s['p95_ms']):>10}{str(s['p99_ms']):>10}"
+        )
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {args.output}")
+    if args.baseline and args.baseline.exists():
+        compare(results, json.loads(args.baseline.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Synthetic receipt seeding for benchmarks.
+"""
+import io
+import random
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from PIL import Image
+from sqlalchemy import insert
+
+from app.config import get_settings
+from app.database import SessionLocal, engine
+from app.models import Category, Receipt
+from app.services.money import USD_EXPONENT, currency_exponent, to_minor
+
+from .stubs import FX_RATES, VENDORS
+
+settings = get_settings()
+
+CHUNK_SIZE = 10_000
+
+
+def sample_jpeg(width: int = 600, height: int = 900) -> bytes:
+    """Render a small receipt-sized JPEG used for uploads and seeded rows."""
+    img = Image.new("RGB", (width, height), "white")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue()
+
+
+def seed_receipts(count: int, days: int = 730, rng_seed: int = 42) -> Path:
+    """
+    Insert `count` synthetic receipts spread over the last `days` days.
+
+    All seeded rows share one image file so the image endpoint has something
+    to serve without writing `count` files to disk.
+
+    Returns:
+        Path of the shared sample image
+    """
+    rng = random.Random(rng_seed)
+
+    image_path = settings.receipts_dir / "bench" / "sample.jpg"
+    image_path.parent.mkdir(parents=True, exist_ok=True)
+    image_path.write_bytes(sample_jpeg())
+
+    db = SessionLocal()
+    try:
+        category_ids = [c.id for c in db.query(Category.id).all()]
+    finally:
+        db.close()
+
+    currencies = ["USD"] * 6 + list(FX_RATES)
+    now = datetime.now()
+
+    inserted = 0
+    with engine.begin() as conn:
+        while inserted < count:
+            rows = []
+            for _ in range(min(CHUNK_SIZE, count - inserted)):
+                created = now - timedelta(seconds=rng.randint(0, days * 86400))
+                currency = rng.choice(currencies)
+                amount = round(rng.lognormvariate(3.2, 0.9), 2)
+                rows.append({
+                    "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                    "vendor": rng.choice(VENDORS),
+                    "amount_minor": to_minor(amount, currency_exponent(currency)),
+                    "amount_usd_minor": to_minor(amount * FX_RATES.get(currency, 1.0), USD_EXPONENT),
+                    "currency": currency,
+                    "currency_exponent": currency_exponent(currency),
+                    "transaction_date": created.date(),
+                    "category_id": rng.choice(category_ids) if category_ids else None,
+                    "image_path": str(image_path),
+                    "raw_ocr_text": None,
+                    "status": rng.choice(["review", "completed", "completed"]),
+                    "created_at": created,
+                    "updated_at": created,
+                })
+            conn.execute(insert(Receipt), rows)
+            inserted += len(rows)
+
+    return image_path
@@ -0,0 +1,86 @@
+"""
+Per-request CPU cost of the JSON read endpoints.
+
+Calls each endpoint repeatedly in-process against a seeded database and
+reports CPU time (not wall time) per request, so serialization changes show
+up without network or disk noise.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.serialization --receipts 10000 --requests 200 \\
+        --output serialization.json --baseline serialization-baseline.json
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from .env import configure_environment
+
+ENDPOINTS = {
+    "receipts_page_100": ("/api/receipts", {"per_page": 100}),
+    "dashboard_summary": ("/api/dashboard/summary", {}),
+    "dashboard_trends": ("/api/dashboard/trends", {}),
+}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--receipts", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--gzip", action="store_true", help="send Accept-Encoding: gzip")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    args = parser.parse_args(argv)
+
+    configure_environment()
+
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    from .seed import seed_receipts
+
+    headers = {"Accept-Encoding": "gzip" if args.gzip else "identity"}
+    results = {}
+
+    with TestClient(app) as client:
+        seed_receipts(args.receipts)
+        for name, (path, params) in ENDPOINTS.items():
+            # Warm up caches and lazy imports
+            for _ in range(5):
+                client.get(path, params=params, headers=headers)
+
+            cpu_start, wall_start = time.process_time(), time.perf_counter()
+            size = 0
+            for _ in range(args.requests):
+                response = client.get(path, params=params, headers=headers)
+                response.raise_for_status()
+                size = int(response.headers.get("content-length", len(response.content)))
+            cpu = time.process_time() - cpu_start
+            wall = time.perf_counter() - wall_start
+
+            results[name] = {
+                "cpu_ms_per_request": round(1000 * cpu / args.requests, 3),
+                "wall_ms_per_request": round(1000 * wall / args.requests, 3),
+                "response_bytes": size,
+            }
+            print(f"{name:<20} {results[name]['cpu_ms_per_request']:>9.3f} ms CPU/req  {size:>9} bytes")
+
+    if args.output:
+        config = {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()}
+        args.output.write_text(json.dumps({"config": config, "endpoints": results}, indent=2))
+    if args.baseline and args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())["endpoints"]
+        print("\nCPU per request vs baseline:")
+        for name, stats in results.items():
+            if name in baseline:
+                before = baseline[name]["cpu_ms_per_request"]
+                change = 100 * (stats["cpu_ms_per_request"] - before) / before if before else 0.0
+                print(f"  {name:<20} {before:>9.3f} -> {stats['cpu_ms_per_request']:>9.3f} ms ({change:+.1f}%)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
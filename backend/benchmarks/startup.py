@@ -0,0 +1,136 @@
+"""
+Import time and time to first healthy response.
+
+Each measurement runs in a fresh interpreter so nothing is already
+imported or cached. Import time is measured as `import app.main` minus a
+bare interpreter start. Time to healthy runs uvicorn and polls /health
+until it answers, twice against the same database: "cold" applies the
+schema to an empty database, "warm" is an ordinary restart.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.startup --runs 5 --output startup.json --baseline startup-baseline.json
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+from .env import configure_environment
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+HEALTH_TIMEOUT_SECONDS = 60
+
+
+def run_python(code: str, *flags: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+
+
+def timed_python(code: str) -> float:
+    start = time.perf_counter()
+    run_python(code)
+    return time.perf_counter() - start
+
+
+def slowest_imports(limit: int) -> list:
+    """Packages by total import time (self time of all their modules), from `python -X importtime`."""
+    result = run_python("import app.main", "-X", "importtime")
+    totals = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = [part.strip() for part in line[len("import time:"):].split("|")]
+        if len(fields) != 3 or not fields[0].isdigit():
+            continue  # Header line
+        package = fields[2].split(".")[0]
+        totals[package] = totals.get(package, 0) + int(fields[0])
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"package": package, "ms": round(us / 1000, 1)} for package, us in ranked]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_healthy() -> float:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        while time.perf_counter() - start < HEALTH_TIMEOUT_SECONDS:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"/health did not answer within {HEALTH_TIMEOUT_SECONDS}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="runs per measurement (median reported)")
+    parser.add_argument("--top", type=int, default=10, help="slowest imported packages to list")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    args = parser.parse_args(argv)
+
+    configure_environment()
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [str(BACKEND_DIR), os.environ.get("PYTHONPATH")]))
+
+    interpreter = statistics.median(timed_python("pass") for _ in range(args.runs))
+    imports = statistics.median(timed_python("import app.main") for _ in range(args.runs))
+
+    cold = time_to_healthy()
+    warm = statistics.median(time_to_healthy() for _ in range(args.runs))
+
+    results = {
+        "import_app_ms": round(1000 * (imports - interpreter), 1),
+        "healthy_cold_ms": round(1000 * cold, 1),
+        "healthy_warm_ms": round(1000 * warm, 1),
+    }
+    for name, value in results.items():
+        print(f"{name:<18} {value:>9.1f} ms")
+
+    slowest = slowest_imports(args.top)
+    print("\nSlowest imports under app.main:")
+    for entry in slowest:
+        print(f"  {entry['package']:<24} {entry['ms']:>8.1f} ms")
+
+    if args.output:
+        config = {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()}
+        args.output.write_text(json.dumps({"config": config, "results": results, "slowest_imports": slowest}, indent=2))
+    if args.baseline and args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())["results"]
+        print("\nVs baseline:")
+        for name, value in results.items():
+            if name in baseline:
+                before = baseline[name]
+                change = 100 * (value - before) / before if before else 0.0
+                print(f"  {name:<18} {before:>9.1f} -> {value:>9.1f} ms ({change:+.1f}%)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Local stand-ins for the external services the pipeline depends on.
+
+FakeGenaiClient mimics the subset of google.genai.Client used by
+services/llm.py, and FakeFxServer serves Frankfurter-shaped responses over
+HTTP. Both inject configurable latency and error rates so the benchmark can
+model slow or flaky providers without network access.
+"""
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+VENDORS = [
+    "Whole Foods Market", "Trader Joe's", "Starbucks", "Chipotle", "Shell",
+    "Comcast", "Amazon", "CVS Pharmacy", "Uber", "AMC Theatres",
+    "Corner Bakery", "Best Buy", "Kroger", "Lyft", "Netflix",
+]
+
+# Rates to USD; the stub adds a little noise per date so lookups aren't uniform
+FX_RATES = {"EUR": 1.08, "GBP": 1.27, "INR": 0.012, "JPY": 0.0067, "CAD": 0.74}
+
+
+@dataclass
+class FaultProfile:
+    """Latency and error injection for a stub service."""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+    def apply(self) -> None:
+        """Sleep for the configured latency, then fail with the configured probability."""
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError("Injected stub failure")
+
+
+class _FakeModels:
+    """Implements client.models.generate_content with canned receipt JSON."""
+
+    def __init__(self, faults: FaultProfile):
+        self.faults = faults
+
+    def generate_content(self, model, contents, config=None):
+        self.faults.apply()
+        currency = random.choice(["USD", "USD", "USD", *FX_RATES])
+        payload = {
+            "vendor": random.choice(VENDORS),
+            "date": time.strftime("%Y-%m-%d"),
+            "amount": round(random.uniform(1, 250), 2),
+            "currency": currency,
+            "category": None,
+        }
+        text = json.dumps(payload)
+        cached = getattr(config, "cached_content", None)
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=800,
+                candidates_token_count=len(text) // 4,
+                cached_content_token_count=550 if cached else None,
+            ),
+        )
+
+
+class _FakeFiles:
+    """Implements the client.files upload/get/delete calls used for large audio."""
+
+    def __init__(self, faults: FaultProfile):
+        self.faults = faults
+
+    def upload(self, path, config=None):
+        self.faults.apply()
+        name = f"files/{random.getrandbits(48):012x}"
+        return SimpleNamespace(name=name, uri=f"https://stub.invalid/{name}", state="ACTIVE")
+
+    def get(self, name):
+        return SimpleNamespace(name=name, uri=f"https://stub.invalid/{name}", state="ACTIVE")
+
+    def delete(self, name):
+        pass
+
+
+class _FakeCaches:
+    """Implements client.caches.create/delete for prompt instruction caching."""
+
+    def __init__(self, faults: FaultProfile):
+        self.faults = faults
+
+    def create(self, model, config=None):
+        self.faults.apply()
+        return SimpleNamespace(name=f"cachedContents/{random.getrandbits(48):012x}", model=model)
+
+    def delete(self, name):
+        pass
+
+
+class FakeGenaiClient:
+    """Drop-in replacement for google.genai.Client in services/llm.py."""
+
+    def __init__(self, faults: FaultProfile):
+        self.models = _FakeModels(faults)
+        self.files = _FakeFiles(faults)
+        self.caches = _FakeCaches(faults)
+
+
+class _FxHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET /<date|latest>?from=XXX&to=USD and the /<start>..<end>
+    time series like the Frankfurter API.
+    """
+
+    faults = FaultProfile()
+
+    def do_GET(self):
+        try:
+            self.faults.apply()
+        except RuntimeError:
+            self.send_error(503, "Injected stub failure")
+            return
+
+        path, _, query = self.path.partition("?")
+        params = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+        base = params.get("from", "EUR")
+        target = params.get("to", "USD")
+        if base != "USD" and base not in FX_RATES:
+            self.send_error(404, "Not found")
+            return
+
+        def rate():
+            return round(1.0 if base == target else FX_RATES.get(base, 1.0) * random.uniform(0.98, 1.02), 6)
+
+        if ".." in path:
+            start, end = (date.fromisoformat(d) for d in path.strip("/").split(".."))
+            days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+            body = json.dumps({
+                "amount": 1.0,
+                "base": base,
+                "start_date": start.isoformat(),
+                "end_date": end.isoformat(),
+                "rates": {d.isoformat(): {target: rate()} for d in days if d.weekday() < 5},
+            }).encode()
+        else:
+            body = json.dumps({
+                "amount": 1.0,
+                "base": base,
+                "date": path.strip("/") or "latest",
+                "rates": {target: rate()},
+            }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeFxServer:
+    """Frankfurter-compatible HTTP server running in a background thread."""
+
+    def __init__(self, faults: FaultProfile, host: str = "127.0.0.1", port: int = 0):
+        handler = type("FxHandler", (_FxHandler,), {"faults": faults})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeFxServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
@@ -0,0 +1,81 @@
+"""
+Upload admission control: 429 with Retry-After once the backlog is over its limits.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import get_settings
+from app.routers import receipts
+from app.services import admission, worker
+from app.services.job_queue import LaneQueue
+
+from .conftest import sample_jpeg
+
+settings = get_settings()
+
+
+@pytest.fixture
+def client(app_db, monkeypatch):
+    """The API in-process with an in-memory queue nobody works off, admitting at most two waiting uploads."""
+    queue = LaneQueue(settings.worker_concurrency, settings.lane_weights, settings.lane_starvation_seconds)
+    monkeypatch.setattr(worker, "receipt_queue", queue)
+    monkeypatch.setattr(receipts, "receipt_queue", queue)
+    monkeypatch.setattr(settings, "admission_max_queue_depth", 2)
+    monkeypatch.setattr(admission.drain_rate, "per_second", lambda: 0.0)
+
+    from app.main import app
+
+    # No lifespan: the embedded worker would drain the queue
+    yield TestClient(app)
+
+
+def upload(client, lane: str = "interactive"):
+    return client.post(
+        "/api/receipts/upload",
+        params={"lane": lane},
+        files={"file": ("receipt.jpg", sample_jpeg(), "image/jpeg")},
+    )
+
+
+def test_uploads_over_the_backlog_limit_get_429_with_retry_after(client):
+    assert [upload(client).status_code for _ in range(2)] == [200, 200]
+
+    refused = upload(client)
+    assert refused.status_code == 429
+    assert refused.headers["Retry-After"] == str(admission.RETRY_AFTER_UNKNOWN_SECONDS)
+    assert "2 receipts waiting" in refused.json()["detail"]
+
+    # Waiting interactive jobs are ahead of bulk ones as well
+    assert upload(client, lane="bulk").status_code == 429
+    assert receipts.receipt_queue.qsize() == 2
+
+
+def test_failed_uploads_leave_room_in_the_queue(client, monkeypatch):
+    def broken_store(source, default_ext):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(receipts, "store_upload", broken_store)
+        assert [upload(client).status_code for _ in range(3)] == [500, 500, 500]
+    assert receipts.receipt_queue.qsize() == 0
+
+    assert [upload(client).status_code for _ in range(3)] == [200, 200, 429]
+
+
+def test_retry_after_follows_the_drain_rate(monkeypatch):
+    lanes = {
+        "interactive": {"queued": 10, "oldest_age_seconds": 30.0},
+        "bulk": {"queued": 0, "oldest_age_seconds": 0.0},
+        "background": {"queued": 0, "oldest_age_seconds": 0.0},
+    }
+    monkeypatch.setattr(settings, "admission_max_queue_depth", 5)
+    monkeypatch.setattr(settings, "admission_max_queue_age_seconds", 0)
+    # Six jobs must finish before the backlog is under the limit
+    refused = admission.check_admission("interactive", lanes, rate=0.5)
+    assert (refused.accepting, refused.reason, refused.retry_after_seconds) == (False, "depth", 12)
+
+    monkeypatch.setattr(settings, "admission_max_queue_depth", 0)
+    monkeypatch.setattr(settings, "admission_max_queue_age_seconds", 20)
+    # The whole backlog ahead must be worked off
+    refused = admission.check_admission("bulk", lanes, rate=0.5)
+    assert (refused.accepting, refused.reason, refused.retry_after_seconds) == (False, "age", 20)
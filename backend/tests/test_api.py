@@ -0,0 +1,126 @@
+"""
+Receipt and dashboard endpoints against each database engine.
+"""
+import io
+import os
+import time
+from datetime import date
+from pathlib import Path
+
+import httpx
+import pyarrow.parquet as pq
+
+from .conftest import sample_jpeg
+
+
+def test_receipts_crud_search_and_dashboard(app_processes):
+    base_url = app_processes.start_api()
+    today = date.today()
+    month_start = today.replace(day=1).isoformat()
+
+    created = [
+        httpx.post(f"{base_url}/api/receipts", json={
+            "vendor": vendor, "amount": amount, "currency": "USD", "transaction_date": month_start,
+        }).json()
+        for vendor, amount in [("Corner Market", 12.5), ("Hardware Depot", 30.25), ("Cafe", 4.0)]
+    ]
+    assert all(receipt["amount_usd"] == receipt["amount"] for receipt in created)
+
+    listing = httpx.get(f"{base_url}/api/receipts", params={"q": "market"}).json()
+    assert [item["vendor"] for item in listing["items"]] == ["Corner Market"]
+
+    updated = httpx.put(f"{base_url}/api/receipts/{created[2]['id']}", json={"amount": 6.0})
+    assert updated.status_code == 200 and updated.json()["amount_usd"] == 6.0
+
+    assert httpx.delete(f"{base_url}/api/receipts/{created[1]['id']}").status_code == 200
+    assert httpx.get(f"{base_url}/api/receipts/{created[1]['id']}").status_code == 404
+
+    # Monthly grouping uses extract(), whose result types differ per engine
+    months = httpx.get(f"{base_url}/api/dashboard/trends", params={"months": 1}).json()["monthly_data"]
+    assert months == [{"year": today.year, "month": today.month, "total": 18.5, "count": 2}]
+    summary = httpx.get(f"{base_url}/api/dashboard/summary").json()
+    assert summary["current_month_total"] == 18.5 and summary["current_month_count"] == 2
+
+
+def test_parquet_export(app_processes):
+    base_url = app_processes.start_api()
+    httpx.post(f"{base_url}/api/receipts", json={"vendor": "Corner Market", "amount": 12.5, "currency": "USD"})
+
+    response = httpx.get(f"{base_url}/api/receipts/export", params={"format": "parquet"})
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.column("vendor").to_pylist() == ["Corner Market"]
+    assert table.column("amount").to_pylist() == [12.5]
+
+
+def test_deleting_receipts_releases_shared_blob(app_processes):
+    base_url = app_processes.start_api()
+    image = sample_jpeg()
+    uploads = [
+        httpx.post(f"{base_url}/api/receipts/upload", files={"file": ("receipt.jpg", image, "image/jpeg")}).json()
+        for _ in range(2)
+    ]
+    blob = Path(uploads[0]["receipt"]["image_path"])
+    assert blob.is_file() and uploads[1]["receipt"]["image_path"] == str(blob)
+    stale = time.time() - 2 * 3600
+    os.utime(blob, (stale, stale))
+
+    # The blob stays while another receipt still points at it
+    assert httpx.delete(f"{base_url}/api/receipts/{uploads[0]['receipt']['id']}").status_code == 200
+    assert blob.is_file()
+    assert httpx.delete(f"{base_url}/api/receipts/{uploads[1]['receipt']['id']}").status_code == 200
+    assert not blob.exists()
+
+    # A blob an upload just stored (or reused) is left to storage GC, in case
+    # another receipt with the same content is being created right now
+    upload = httpx.post(f"{base_url}/api/receipts/upload", files={"file": ("receipt.jpg", image, "image/jpeg")}).json()
+    assert httpx.delete(f"{base_url}/api/receipts/{upload['receipt']['id']}").status_code == 200
+    assert blob.is_file()
+
+
+def test_analytics_snapshot_refreshes_in_the_background(app_env, app_processes):
+    app_env["ANALYTICS_REFRESH_SECONDS"] = "0.2"
+    base_url = app_processes.start_api()
+
+    def vendors():
+        return {row["vendor"] for row in httpx.get(f"{base_url}/api/dashboard/vendors").json()}
+
+    httpx.post(f"{base_url}/api/receipts", json={"vendor": "Corner Market", "amount": 12.5, "currency": "USD"})
+    assert vendors() == {"Corner Market"}
+
+    # Requests answer from the loaded snapshot and the refresh they start catches up
+    httpx.post(f"{base_url}/api/receipts", json={"vendor": "Cafe", "amount": 4.0, "currency": "USD"})
+    deadline = time.monotonic() + 10
+    while vendors() != {"Corner Market", "Cafe"}:
+        assert time.monotonic() < deadline, "snapshot never picked up the new receipt"
+        time.sleep(0.2)
+
+
+def test_amounts_keep_their_currency_precision(app_processes):
+    base_url = app_processes.start_api()
+
+    yen = httpx.post(f"{base_url}/api/receipts", json={"vendor": "Konbini", "amount": 1500, "currency": "JPY"}).json()
+    dinar = httpx.post(f"{base_url}/api/receipts", json={"vendor": "Souq", "amount": 1.234, "currency": "KWD"}).json()
+    assert (yen["amount"], dinar["amount"]) == (1500, 1.234)
+
+    # An edit changing both fields converts the new amount at the new currency's precision
+    usd = httpx.post(f"{base_url}/api/receipts", json={"vendor": "Cafe", "amount": 4.0, "currency": "USD"}).json()
+    updated = httpx.put(f"{base_url}/api/receipts/{usd['id']}", json={"amount": 2.345, "currency": "KWD"}).json()
+    assert (updated["amount"], updated["currency"]) == (2.345, "KWD")
+    updated = httpx.put(f"{base_url}/api/receipts/{yen['id']}", json={"amount": 980.0}).json()
+    assert updated["amount"] == 980
+
+
+def test_cached_reads_revalidate_until_a_write(app_processes):
+    base_url = app_processes.start_api()
+    first = httpx.get(f"{base_url}/api/receipts")
+    etag = first.headers["ETag"]
+
+    revalidated = httpx.get(f"{base_url}/api/receipts", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304 and revalidated.headers["ETag"] == etag
+    assert httpx.get(f"{base_url}/api/receipts").json() == first.json()  # Served from the cache
+
+    created = httpx.post(f"{base_url}/api/receipts", json={"vendor": "Corner Cafe", "amount": 4.5}).json()
+    changed = httpx.get(f"{base_url}/api/receipts", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert [item["id"] for item in changed.json()["items"]] == [created["id"]]
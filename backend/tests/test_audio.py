@@ -0,0 +1,137 @@
+"""
+Audio note preprocessing: container sniffing, transcoding, downmix and silence trimming.
+"""
+import io
+import math
+import shutil
+import struct
+import subprocess
+import wave
+from pathlib import Path
+
+import pytest
+
+from app.config import get_settings
+from app.services import audio
+
+settings = get_settings()
+
+
+def write_wav(path: Path, segments, rate: int = 48000, channels: int = 2) -> Path:
+    """A 16-bit WAV of (seconds, frequency) segments; frequency 0 is silence."""
+    frames = io.BytesIO()
+    for seconds, frequency in segments:
+        for i in range(int(seconds * rate)):
+            sample = int(12000 * math.sin(2 * math.pi * frequency * i / rate)) if frequency else 0
+            frames.write(struct.pack("<h", sample) * channels)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(frames.getvalue())
+    return path
+
+
+def flac_stream_info(path: Path):
+    """(sample rate, channels, seconds) from a FLAC file's STREAMINFO block."""
+    data = path.read_bytes()
+    assert data[:4] == b"fLaC"
+    info = data[8:42]
+    rate = int.from_bytes(info[10:13], "big") >> 4
+    channels = ((info[12] >> 1) & 0x7) + 1
+    samples = int.from_bytes(info[13:18], "big") & 0xFFFFFFFFF
+    return rate, channels, samples / rate
+
+
+@pytest.mark.parametrize("header, mime_type", [
+    (b"RIFF\x24\x00\x00\x00WAVEfmt ", "audio/wav"),
+    (b"OggS\x00\x02", "audio/ogg"),
+    (b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81", "audio/webm"),
+    (b"fLaC\x00\x00\x00\x22", "audio/flac"),
+    (b"\x00\x00\x00\x1cftypM4A ", "audio/mp4"),
+    (b"ID3\x04\x00", "audio/mpeg"),
+    (b"\xff\xf1\x50\x80", "audio/aac"),
+    (b"\xff\xfb\x90\x64", "audio/mpeg"),
+    (b"\x89PNG\r\n\x1a\n", None),
+])
+def test_containers_are_recognised_by_their_magic_bytes(header, mime_type):
+    assert audio.sniff_audio_mime(header) == mime_type
+
+
+def test_unrecognised_files_are_refused(tmp_path):
+    path = tmp_path / "note.wav"
+    path.write_bytes(b"not audio at all")
+    with pytest.raises(ValueError, match="Unrecognised audio format"):
+        audio.prepare_audio(str(path))
+
+
+def test_without_ffmpeg_the_original_is_sent(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ffmpeg_path", str(tmp_path / "no-ffmpeg"))
+    source = write_wav(tmp_path / "note.bin", [(0.1, 440)])
+
+    prepared = audio.prepare_audio(str(source))
+    assert (prepared.path, prepared.mime_type, prepared.temporary) == (source, "audio/wav", False)
+
+
+def test_transcode_downmixes_resamples_trims_and_caps_the_duration(tmp_path, monkeypatch):
+    commands = []
+
+    def run(command, **kwargs):
+        commands.append(command)
+        Path(command[-1]).write_bytes(b"OggS")
+        return subprocess.CompletedProcess(command, 0)
+
+    monkeypatch.setattr(audio, "ffmpeg_available", lambda: True)
+    monkeypatch.setattr(audio, "probe_duration", lambda path: 300.0)
+    monkeypatch.setattr(audio.subprocess, "run", run)
+    monkeypatch.setattr(settings, "audio_max_duration_seconds", 60.0)
+    source = write_wav(tmp_path / "note.wav", [(0.1, 440)])
+
+    prepared = audio.prepare_audio(str(source))
+    try:
+        command = commands[0]
+        assert command[command.index("-t") + 1] == "60.0"
+        assert command[command.index("-ac") + 1] == "1"
+        assert command[command.index("-ar") + 1] == "16000"
+        assert command[command.index("-af") + 1] == audio.silence_filter(settings.audio_silence_threshold_db)
+        assert "libopus" in command
+        assert (prepared.mime_type, prepared.duration_seconds, prepared.temporary) == ("audio/ogg", 60.0, True)
+    finally:
+        prepared.cleanup()
+    assert not prepared.path.exists()
+
+
+@pytest.mark.parametrize("failure", [
+    subprocess.CalledProcessError(1, "ffmpeg", stderr=b"Invalid data found when processing input"),
+    subprocess.TimeoutExpired("ffmpeg", 1),
+])
+def test_failed_transcodes_send_the_original(tmp_path, monkeypatch, failure):
+    outputs = []
+
+    def run(command, **kwargs):
+        outputs.append(Path(command[-1]))
+        raise failure
+
+    monkeypatch.setattr(audio, "ffmpeg_available", lambda: True)
+    monkeypatch.setattr(audio, "probe_duration", lambda path: None)
+    monkeypatch.setattr(audio.subprocess, "run", run)
+    source = write_wav(tmp_path / "note.wav", [(0.1, 440)])
+
+    prepared = audio.prepare_audio(str(source))
+    assert (prepared.path, prepared.mime_type, prepared.temporary) == (source, "audio/wav", False)
+    assert not outputs[0].exists()
+
+
+@pytest.mark.skipif(shutil.which(settings.ffmpeg_path) is None, reason="ffmpeg is not installed")
+def test_ffmpeg_produces_trimmed_mono_16khz_audio(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "audio_codec", "flac")
+    source = write_wav(tmp_path / "note.wav", [(1.0, 0), (1.0, 440), (1.0, 0)])
+
+    prepared = audio.prepare_audio(str(source))
+    try:
+        assert prepared.mime_type == "audio/flac" and prepared.temporary
+        rate, channels, seconds = flac_stream_info(prepared.path)
+        assert (rate, channels) == (16000, 1)
+        assert 0.9 < seconds < 1.5  # The silence either side is gone, the tone is whole
+    finally:
+        prepared.cleanup()
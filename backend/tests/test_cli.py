@@ -0,0 +1,61 @@
+"""
+Command-line tools against each database engine.
+"""
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app import cli
+from app.database import create_db_engine
+from app.models import Receipt
+
+# Tables as created by the first release, before amounts moved to minor units
+BASELINE_SCHEMA = """
+CREATE TABLE categories (
+    id INTEGER NOT NULL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    icon VARCHAR(50),
+    color VARCHAR(7)
+);
+CREATE TABLE receipts (
+    id VARCHAR(36) NOT NULL PRIMARY KEY,
+    vendor VARCHAR(255),
+    amount FLOAT,
+    amount_usd FLOAT,
+    currency VARCHAR(3),
+    transaction_date DATE,
+    category_id INTEGER REFERENCES categories (id),
+    image_path VARCHAR(500) NOT NULL,
+    raw_ocr_text TEXT,
+    status VARCHAR(20),
+    created_at DATETIME,
+    updated_at DATETIME
+);
+INSERT INTO categories (id, name, icon, color) VALUES (1, 'Groceries', '🛒', '#86efac');
+INSERT INTO receipts (id, vendor, amount, amount_usd, currency, category_id, image_path, status)
+VALUES
+    ('r-usd', 'Corner Market', 0.285, 0.285, 'USD', 1, 'manual_entry', 'completed'),
+    ('r-jpy', 'Konbini', 1500, 10.05, 'JPY', NULL, 'manual_entry', 'completed'),
+    ('r-new', 'Processing...', NULL, NULL, 'USD', NULL, 'manual_entry', 'processing');
+"""
+
+
+def test_copy_db_converts_amounts_of_a_baseline_database(tmp_path, database_url):
+    source_url = f"sqlite:///{tmp_path / 'baseline.db'}"
+    source = create_engine(source_url)
+    with source.begin() as conn:
+        for statement in filter(str.strip, BASELINE_SCHEMA.split(";")):
+            conn.execute(text(statement))
+    source.dispose()
+
+    assert cli.main(["copy-db", "--source", source_url, "--target", database_url]) == 0
+
+    target = create_db_engine(database_url)
+    try:
+        with sessionmaker(bind=target)() as db:
+            receipts = {receipt.id: receipt for receipt in db.query(Receipt)}
+    finally:
+        target.dispose()
+    assert (receipts["r-usd"].amount_minor, receipts["r-usd"].amount_usd_minor) == (29, 29)
+    assert (receipts["r-jpy"].amount_minor, receipts["r-jpy"].currency_exponent) == (1500, 0)
+    assert receipts["r-jpy"].amount_usd == 10.05
+    assert receipts["r-new"].amount_minor is None and receipts["r-new"].currency_exponent == 2
@@ -0,0 +1,124 @@
+"""
+Engine setup and search on SQLite and PostgreSQL.
+"""
+import pytest
+from sqlalchemy import delete, text, update
+from sqlalchemy.orm import sessionmaker
+
+from app.config import get_settings
+from app.database import Base, SessionLocal, create_db_engine, current_data_version, engine_options
+from app.models import DataVersion, Receipt
+from app.services import search
+
+settings = get_settings()
+
+
+@pytest.fixture
+def db_engine(database_url, monkeypatch):
+    """An engine on an empty database with the schema and search indexes installed."""
+    # The FTS flag is per process, set by whichever engine installed indexes last
+    monkeypatch.setattr(search, "_fts_available", False)
+    engine = create_db_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    search.install_search_indexes(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_sqlite_engine_options_allow_cross_thread_use():
+    assert engine_options("sqlite:///vyaya.db") == {"connect_args": {"check_same_thread": False}}
+
+
+def test_postgres_engine_options_size_pool_and_set_statement_timeout():
+    options = engine_options("postgresql+psycopg://vyaya@db/vyaya")
+    assert options["pool_size"] == (settings.db_pool_size or settings.worker_concurrency + 5)
+    assert options["max_overflow"] == settings.db_max_overflow
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"] == {"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"}
+
+
+def test_postgres_connections_get_the_statement_timeout(db_engine):
+    if db_engine.dialect.name != "postgresql":
+        pytest.skip("PostgreSQL only")
+    with db_engine.connect() as conn:
+        timeout_ms = conn.execute(text("SELECT setting::int FROM pg_settings WHERE name = 'statement_timeout'")).scalar()
+    assert timeout_ms == settings.db_statement_timeout_ms
+    assert db_engine.pool.size() == engine_options(str(db_engine.url))["pool_size"]
+
+
+def test_search_matches_vendor_and_ocr_text(db_engine):
+    Session = sessionmaker(bind=db_engine)
+    with Session() as db:
+        db.add_all([
+            Receipt(vendor="Corner Market", raw_ocr_text="milk eggs", status="review", image_path="manual_entry"),
+            Receipt(vendor="Hardware Depot", raw_ocr_text="hammer, MARKET price", status="review", image_path="manual_entry"),
+            Receipt(vendor="Cafe", raw_ocr_text="latte", status="review", image_path="manual_entry"),
+        ])
+        db.commit()
+
+        def vendors(q):
+            return sorted(r.vendor for r in db.query(Receipt).filter(search.receipt_search_filter(q)))
+
+        assert vendors("market") == ["Corner Market", "Hardware Depot"]
+        assert vendors("LATTE") == ["Cafe"]
+        assert vendors("ca") == ["Cafe"]  # Below the trigram minimum: falls back to ILIKE
+        assert vendors("bakery") == []
+
+
+def test_postgres_trigram_indexes_are_created(db_engine):
+    if db_engine.dialect.name != "postgresql":
+        pytest.skip("PostgreSQL only")
+    with db_engine.connect() as conn:
+        if not conn.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first():
+            pytest.skip("pg_trgm is not available on this server")
+        indexes = set(conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'receipts'")).scalars())
+    assert {"ix_receipts_vendor_trgm", "ix_receipts_raw_ocr_text_trgm"} <= indexes
+
+
+def test_data_version_bumps_once_per_committed_transaction(db_engine):
+    with db_engine.begin() as conn:
+        conn.execute(DataVersion.__table__.insert().values(id=1, version=1))
+
+    with SessionLocal(bind=db_engine) as db:
+        receipt = Receipt(vendor="Cafe", status="review", image_path="manual_entry")
+        db.add(receipt)
+        db.flush()
+        receipt.vendor = "Corner Cafe"
+        db.flush()
+        db.query(Receipt).filter(Receipt.id == receipt.id).update({Receipt.status: "completed"})
+        db.commit()
+        assert current_data_version(db) == 2
+
+        # Left to the commit's own flush
+        receipt.vendor = "Cafe"
+        db.commit()
+        assert current_data_version(db) == 3
+
+        db.delete(receipt)
+        db.flush()
+        db.rollback()
+        db.query(Receipt).count()
+        db.commit()
+        assert current_data_version(db) == 3
+
+
+def test_bulk_writes_bump_data_version_only_when_committed(db_engine):
+    with db_engine.begin() as conn:
+        conn.execute(DataVersion.__table__.insert().values(id=1, version=1))
+
+    with SessionLocal(bind=db_engine) as db:
+        receipts = [Receipt(vendor=vendor, status="review", image_path="manual_entry") for vendor in ("Cafe", "Deli")]
+        db.add_all(receipts)
+        db.commit()
+        assert current_data_version(db) == 2
+
+        db.execute(update(Receipt).where(Receipt.vendor == "Cafe").values(status="completed"))
+        db.rollback()
+        db.commit()
+        assert current_data_version(db) == 2
+
+        db.execute(update(Receipt).values(status="completed"))
+        db.execute(delete(Receipt).where(Receipt.vendor == "Deli"))
+        db.commit()
+        assert current_data_version(db) == 3
+        assert db.query(Receipt.status).all() == [("completed",)]
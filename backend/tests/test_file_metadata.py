@@ -0,0 +1,137 @@
+"""
+Ingest-time file metadata: sniffing, EXIF headers and the receipt_files row stored with each upload.
+"""
+import hashlib
+import io
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import ExifTags, Image
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import Receipt, ReceiptFile
+from app.routers import receipts
+from app.services import file_metadata, worker
+from app.services.job_queue import LaneQueue
+
+from .conftest import sample_jpeg
+from .test_audio import write_wav
+from .test_worker import add_processing_receipt
+
+settings = get_settings()
+
+CAPTURED_AT = datetime(2026, 3, 2, 18, 45, 10)
+
+
+def exif_jpeg(orientation: int = 6, captured_at: datetime = CAPTURED_AT) -> bytes:
+    """A small JPEG carrying EXIF orientation and DateTimeOriginal."""
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = orientation
+    exif[ExifTags.IFD.Exif] = {ExifTags.Base.DateTimeOriginal: captured_at.strftime("%Y:%m:%d %H:%M:%S")}
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 48), "white").save(buf, format="JPEG", exif=exif)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def client(app_db, monkeypatch):
+    """The API in-process with a queue nobody works off, so uploads stay as stored."""
+    queue = LaneQueue(settings.worker_concurrency, settings.lane_weights, settings.lane_starvation_seconds)
+    monkeypatch.setattr(worker, "receipt_queue", queue)
+    monkeypatch.setattr(receipts, "receipt_queue", queue)
+
+    from app.main import app
+
+    # No lifespan: the embedded worker would drain the queue
+    yield TestClient(app)
+
+
+def test_save_upload_hashes_the_file_and_reads_its_exif(tmp_path):
+    data = exif_jpeg()
+    destination = tmp_path / "receipt.jpg"
+
+    metadata = file_metadata.save_upload(io.BytesIO(data), destination)
+    assert destination.read_bytes() == data
+    assert metadata == file_metadata.FileMetadata(
+        mime_type="image/jpeg", size_bytes=len(data), sha256=hashlib.sha256(data).hexdigest(),
+        width=64, height=48, orientation=6, captured_at=CAPTURED_AT,
+    )
+    assert file_metadata.read_file_metadata(destination) == metadata
+
+
+def test_files_are_sniffed_by_content_not_name(tmp_path):
+    png = io.BytesIO()
+    Image.new("RGB", (10, 20)).save(png, format="PNG")
+    (tmp_path / "scan.jpg").write_bytes(png.getvalue())
+    write_wav(tmp_path / "note.jpg", [(0.05, 440)])
+    (tmp_path / "notes.jpg").write_bytes(b"plain text")
+
+    described = {
+        name: file_metadata.read_file_metadata(tmp_path / name)
+        for name in ("scan.jpg", "note.jpg", "notes.jpg")
+    }
+    assert (described["scan.jpg"].mime_type, described["scan.jpg"].width, described["scan.jpg"].height) == ("image/png", 10, 20)
+    assert (described["note.jpg"].mime_type, described["note.jpg"].width) == ("audio/wav", None)
+    assert described["notes.jpg"].mime_type == "application/octet-stream"
+
+
+def test_truncated_headers_still_give_hash_and_size():
+    data = exif_jpeg()[:40]
+    metadata = file_metadata.describe(data, 1000, "abc")
+    assert (metadata.mime_type, metadata.size_bytes, metadata.sha256) == ("image/jpeg", 1000, "abc")
+    assert (metadata.width, metadata.captured_at) == (None, None)
+
+
+def test_upload_stores_file_metadata_with_the_receipt(client):
+    data = exif_jpeg()
+    response = client.post("/api/receipts/upload", files={"file": ("receipt.jpg", data, "image/jpeg")})
+    assert response.status_code == 200
+
+    with SessionLocal() as db:
+        receipt = db.get(Receipt, response.json()["receipt"]["id"])
+        stored = db.get(ReceiptFile, receipt.id)
+        assert stored is receipt.file
+        assert (stored.mime_type, stored.size_bytes, stored.sha256) == ("image/jpeg", len(data), hashlib.sha256(data).hexdigest())
+        assert (stored.width, stored.height, stored.orientation, stored.captured_at) == (64, 48, 6, CAPTURED_AT)
+
+
+def test_worker_dates_receipts_from_the_stored_capture_time(app_db, tmp_path, monkeypatch):
+    image = tmp_path / "receipt.jpg"
+    image.write_bytes(sample_jpeg())
+    receipt_id = add_processing_receipt(str(image))
+    with SessionLocal() as db:
+        # The stored row wins over the file, which has no EXIF
+        db.get(Receipt, receipt_id).file = ReceiptFile(
+            mime_type="image/jpeg", size_bytes=image.stat().st_size, sha256="0" * 64, captured_at=CAPTURED_AT,
+        )
+        db.commit()
+
+    async def extract(path, mime_type):
+        return {"vendor": "Corner Market", "amount": 4.5, "currency": "USD", "confidence": 0.9, "raw_text": ""}
+
+    monkeypatch.setattr(worker, "process_receipt_image", extract)
+    worker.process_receipt_task(receipt_id, str(image))
+
+    with SessionLocal() as db:
+        receipt = db.get(Receipt, receipt_id)
+        assert receipt.status == "review"
+        assert receipt.transaction_date == CAPTURED_AT.date()
+
+
+def test_worker_records_metadata_for_receipts_uploaded_without_it(app_db, tmp_path, monkeypatch):
+    image = tmp_path / "receipt.jpg"
+    image.write_bytes(exif_jpeg())
+    receipt_id = add_processing_receipt(str(image))
+
+    async def extract(path, mime_type):
+        return {"vendor": "Corner Market", "amount": 4.5, "currency": "USD", "confidence": 0.9, "raw_text": ""}
+
+    monkeypatch.setattr(worker, "process_receipt_image", extract)
+    worker.process_receipt_task(receipt_id, str(image))
+
+    with SessionLocal() as db:
+        receipt = db.get(Receipt, receipt_id)
+        assert (receipt.file.sha256, receipt.file.orientation) == (hashlib.sha256(image.read_bytes()).hexdigest(), 6)
+        assert receipt.transaction_date == CAPTURED_AT.date()
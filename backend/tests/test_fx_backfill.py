@@ -0,0 +1,92 @@
+"""
+Batched USD conversion of receipts missing a USD amount.
+"""
+from datetime import date
+
+import pytest
+
+from app.database import SessionLocal
+from app.models import Receipt
+from app.services import currency, fx_backfill
+
+DAY = date(2026, 3, 2)
+EUR_RATE = 1.1
+
+
+@pytest.fixture
+def fx_source(monkeypatch):
+    """An FX provider that knows EUR and nothing else; records the currencies asked for."""
+    requested = []
+
+    async def get_exchange_rate_series(code, start, end):
+        requested.append(code)
+        if code != "EUR":
+            raise ValueError(f"Unknown currency {code}")
+        return {DAY: EUR_RATE}
+
+    monkeypatch.setattr(currency, "get_exchange_rate_series", get_exchange_rate_series)
+    return requested
+
+
+def add_receipt(vendor: str, amount: float, code: str, amount_usd_minor=None, status: str = "review") -> str:
+    with SessionLocal() as db:
+        receipt = Receipt(
+            vendor=vendor, currency=code, amount=amount, amount_usd_minor=amount_usd_minor,
+            transaction_date=DAY, status=status, image_path="manual_entry",
+        )
+        db.add(receipt)
+        db.commit()
+        return receipt.id
+
+
+def usd_amounts() -> dict:
+    with SessionLocal() as db:
+        return dict(db.query(Receipt.vendor, Receipt.amount_usd_minor))
+
+
+def test_backfill_converts_missing_amounts_and_leaves_unknown_currencies(app_db, fx_source):
+    add_receipt("Paris Cafe", 10.0, "EUR")
+    add_receipt("Berlin Deli", 5.0, "EUR", amount_usd_minor=0)  # What failed conversions used to store
+    add_receipt("Mystery Shop", 7.0, "XYZ")
+    add_receipt("Free Sample", 0.0, "EUR", amount_usd_minor=0)
+    add_receipt("Still Processing", 3.0, "EUR", status="processing")
+
+    report = fx_backfill.backfill_usd_amounts(batch_size=1)
+    assert report.to_dict() == {"candidates": 2, "converted": 1, "unresolved": 1}
+    assert usd_amounts() == {
+        "Paris Cafe": 1100, "Berlin Deli": 0, "Mystery Shop": None, "Free Sample": 0, "Still Processing": None,
+    }
+
+    report = fx_backfill.backfill_usd_amounts(include_zero=True)
+    assert report.to_dict() == {"candidates": 2, "converted": 1, "unresolved": 1}
+    assert usd_amounts()["Berlin Deli"] == 550
+    assert set(fx_source) == {"EUR", "XYZ"}
+
+
+def test_second_run_changes_nothing(app_db, fx_source):
+    add_receipt("Paris Cafe", 10.0, "EUR")
+    add_receipt("Mystery Shop", 7.0, "XYZ")
+    fx_backfill.backfill_usd_amounts(include_zero=True)
+    with SessionLocal() as db:
+        before = db.query(Receipt.id, Receipt.amount_usd_minor, Receipt.updated_at).order_by(Receipt.id).all()
+
+    report = fx_backfill.backfill_usd_amounts(include_zero=True)
+    assert report.to_dict() == {"candidates": 1, "converted": 0, "unresolved": 1}
+    with SessionLocal() as db:
+        assert db.query(Receipt.id, Receipt.amount_usd_minor, Receipt.updated_at).order_by(Receipt.id).all() == before
+
+
+def test_receipts_edited_during_the_lookup_are_left_for_the_next_run(app_db, monkeypatch):
+    receipt_id = add_receipt("Paris Cafe", 10.0, "EUR")
+
+    async def get_exchange_rate_series(code, start, end):
+        # The amount changes while the rate is being fetched
+        with SessionLocal() as db:
+            db.get(Receipt, receipt_id).amount = 12.0
+            db.commit()
+        return {DAY: EUR_RATE}
+
+    monkeypatch.setattr(currency, "get_exchange_rate_series", get_exchange_rate_series)
+    report = fx_backfill.backfill_usd_amounts()
+    assert report.to_dict() == {"candidates": 1, "converted": 0, "unresolved": 1}
+    assert usd_amounts() == {"Paris Cafe": None}
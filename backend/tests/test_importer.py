@@ -0,0 +1,117 @@
+"""
+Bulk CSV/OFX import: parsing, the per-row error report and re-import dedupe.
+"""
+import argparse
+import io
+
+import pytest
+
+from app import cli
+from app.database import SessionLocal
+from app.models import Receipt
+from app.services import fx_backfill, importer
+
+CSV = """Date,Payee,Amount,Currency,Memo
+2026-03-02,Corner Cafe,4.50,USD,latte
+2026-03-02,Corner Cafe,4.50,USD,latte
+
+2026-03-03,Paris Bakery,"1,200.00",EUR,
+not a date,Broken Row,3.00,USD,
+2026-03-04,,9.99,USD,
+2026-03-05,Mystery Shop,7.00,XYZ,
+2026-03-06,Bad Amount,abc,USD,
+"""
+
+OFX = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><CURDEF>USD
+<BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20260302120000<TRNAMT>-12.50<FITID>tx-1<NAME>Hardware Depot
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20260303<TRNAMT>1000.00<FITID>tx-2<NAME>Payroll
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20260304<TRNAMT>-3.00<FITID>tx-3<NAME>Corner Cafe
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+
+@pytest.fixture(autouse=True)
+def fx_rates(monkeypatch):
+    """EUR converts at 1.1; other currencies have no rate."""
+    async def get_usd_rates(pairs):
+        return {(code, day): 1.1 if code == "EUR" else None for code, day in pairs}
+
+    monkeypatch.setattr(importer, "get_usd_rates", get_usd_rates)
+
+
+def stored() -> list:
+    with SessionLocal() as db:
+        return db.query(Receipt.vendor, Receipt.amount_minor, Receipt.amount_usd_minor).order_by(Receipt.vendor).all()
+
+
+def test_parse_csv_maps_header_aliases_and_skips_blank_rows():
+    rows = list(importer.parse_csv(io.StringIO(CSV)))
+    assert rows[0] == (2, {"date": "2026-03-02", "vendor": "Corner Cafe", "amount": "4.50", "currency": "USD", "memo": "latte"})
+    assert [number for number, _ in rows] == [2, 3, 5, 6, 7, 8, 9]
+
+    with pytest.raises(ValueError, match="missing required columns: amount"):
+        list(importer.parse_csv(io.StringIO("date,vendor\n2026-03-02,Cafe\n")))
+
+
+def test_parse_ofx_reads_unclosed_transactions_and_marks_credits():
+    rows = list(importer.parse_ofx(io.StringIO(OFX)))
+    assert [(number, fields["vendor"], fields["amount"], fields["fitid"], fields["skip"]) for number, fields in rows] == [
+        (1, "Hardware Depot", "12.50", "tx-1", ""),
+        (2, "Payroll", "1000.00", "tx-2", "credit"),
+        (3, "Corner Cafe", "3.00", "tx-3", ""),
+    ]
+    assert rows[0][1]["date"] == "20260302" and rows[0][1]["currency"] == "USD"
+
+
+def test_csv_import_reports_malformed_rows_and_skips_them_on_reimport(app_db):
+    result = importer.import_receipts(io.StringIO(CSV), "csv")
+    assert result.errors == [
+        {"row": 6, "error": "Invalid date 'not a date'"},
+        {"row": 7, "error": "Missing vendor"},
+        {"row": 9, "error": "Invalid amount 'abc'"},
+    ]
+    assert (result.imported, result.failed, result.duplicates, result.unconverted) == (4, 3, 0, 1)
+    # Identical rows in one file are separate purchases
+    assert stored() == [
+        ("Corner Cafe", 450, 450), ("Corner Cafe", 450, 450),
+        ("Mystery Shop", 700, None), ("Paris Bakery", 120000, 132000),
+    ]
+
+    again = importer.import_receipts(io.StringIO(CSV), "csv")
+    assert (again.imported, again.duplicates, again.failed) == (0, 4, 3)
+    assert len(stored()) == 4
+
+
+def test_ofx_import_skips_transactions_an_earlier_statement_imported(app_db):
+    first = importer.import_receipts(io.StringIO(OFX), "ofx")
+    assert (first.imported, first.skipped, first.duplicates) == (2, 1, 0)
+
+    overlapping = OFX.replace(
+        "</BANKTRANLIST>",
+        "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20260305<TRNAMT>-8.00<FITID>tx-4<NAME>Book Shop\n</BANKTRANLIST>",
+    )
+    second = importer.import_receipts(io.StringIO(overlapping), "ofx")
+    assert (second.imported, second.skipped, second.duplicates) == (1, 1, 2)
+    assert [vendor for vendor, _, _ in stored()] == ["Book Shop", "Corner Cafe", "Hardware Depot"]
+
+
+def test_cli_import_converts_rows_imported_without_a_usd_amount(app_db, tmp_path, monkeypatch):
+    calls = []
+
+    def backfill_usd_amounts():
+        calls.append("backfill")
+        return fx_backfill.BackfillReport(candidates=1, unresolved=1)
+
+    monkeypatch.setattr(fx_backfill, "backfill_usd_amounts", backfill_usd_amounts)
+    path = tmp_path / "history.csv"
+    path.write_text("date,vendor,amount,currency\n2026-03-02,Paris Bakery,5.00,EUR\n")
+
+    args = argparse.Namespace(file=str(path), format=None, currency="USD")
+    assert cli.import_file(args) == 0
+    assert calls == []
+
+    path.write_text("date,vendor,amount,currency\n2026-03-05,Mystery Shop,7.00,XYZ\n")
+    assert cli.import_file(args) == 0
+    assert calls == ["backfill"]
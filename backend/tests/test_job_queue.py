@@ -0,0 +1,99 @@
+"""
+Lane priorities, starvation protection and claiming, for both queue backends.
+"""
+import threading
+import time
+
+import pytest
+
+from app.services.job_queue import DatabaseJobQueue, LaneQueue, ReceiptJob
+
+WEIGHTS = {"interactive": 6, "bulk": 3, "background": 1}
+STARVATION_SECONDS = 60.0
+
+
+def job(name: str, lane: str, age: float = 0.0) -> ReceiptJob:
+    return ReceiptJob(receipt_id=name, file_path=f"/receipts/{name}.jpg", lane=lane, enqueued_at=time.time() - age)
+
+
+@pytest.fixture(params=["memory", "database"])
+def make_queue(request, app_db):
+    """Builds queues of the parametrized backend; database queues share one scratch database."""
+    if request.param == "memory" and app_db.dialect.name != "sqlite":
+        pytest.skip("The in-memory queue doesn't depend on the database engine")
+    queues = []
+
+    def make(concurrency: int = 4):
+        backend = DatabaseJobQueue if request.param == "database" else LaneQueue
+        queue = backend(concurrency, WEIGHTS, STARVATION_SECONDS)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.close()
+
+
+def test_lanes_are_served_in_priority_order(make_queue):
+    queue = make_queue()
+    for name, lane in [("sync", "background"), ("import", "bulk"), ("capture", "interactive")]:
+        queue.put(job(name, lane))
+
+    assert [queue.get().receipt_id for _ in range(3)] == ["capture", "import", "sync"]
+
+
+def test_overdue_jobs_overtake_higher_lanes(make_queue):
+    queue = make_queue()
+    queue.put(job("capture", "interactive"))
+    queue.put(job("import", "bulk", age=STARVATION_SECONDS + 10))
+    queue.put(job("sync", "background", age=STARVATION_SECONDS + 20))
+
+    assert [queue.get().receipt_id for _ in range(3)] == ["sync", "import", "capture"]
+
+
+def test_lower_lanes_never_take_every_worker(make_queue):
+    queue = make_queue(concurrency=4)
+    assert queue.caps == {"interactive": 4, "bulk": 2, "background": 1}
+    for i in range(3):
+        queue.put(job(f"import-{i}", "bulk"))
+
+    running = [queue.get(), queue.get()]
+    waiting = []
+    getter = threading.Thread(target=lambda: waiting.append(queue.get()))
+    getter.start()
+    getter.join(timeout=0.5)
+    assert getter.is_alive()  # Both bulk slots are taken
+
+    queue.task_done(running[0])
+    getter.join(timeout=5)
+    assert [item.receipt_id for item in waiting] == ["import-2"]
+
+
+def test_concurrent_workers_claim_a_job_once(app_db):
+    queues = [DatabaseJobQueue(4, WEIGHTS, STARVATION_SECONDS) for _ in range(2)]
+    for i, queue in enumerate(queues):
+        queue.worker_id = f"worker-{i}"
+    queues[0].put(job("capture", "interactive"))
+
+    claimed = []
+    start = threading.Barrier(len(queues))
+
+    def claim(queue):
+        start.wait()
+        claimed.append((queue.worker_id, queue.get()))
+
+    claimers = [threading.Thread(target=claim, args=(queue,)) for queue in queues]
+    for thread in claimers:
+        thread.start()
+    deadline = time.monotonic() + 10
+    while not any(item for _, item in claimed) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    for queue in queues:
+        queue.close()
+    for thread in claimers:
+        thread.join(timeout=5)
+
+    winners = [(worker_id, item) for worker_id, item in claimed if item is not None]
+    assert len(claimed) == 2 and len(winners) == 1
+    assert winners[0][1].receipt_id == "capture"
+    assert queues[0].status()["interactive"] == {"queued": 0, "running": 1, "max_running": 4, "oldest_age_seconds": 0.0}
@@ -0,0 +1,83 @@
+"""
+Context caching of prompt instructions: the minimum size, and creating caches outside the lock.
+"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import get_settings
+from app.services import llm
+from app.services.prompts import IMAGE_PROMPT, PromptTemplate
+
+settings = get_settings()
+
+MODEL = "models/gemini-2.5-flash"
+LONG_PROMPT = PromptTemplate(name="long", version=1, instructions="Read the receipt carefully. " * 400, request="")
+
+
+class Caches:
+    """client.caches that blocks each create until released, recording what it was asked."""
+
+    def __init__(self):
+        self.created, self.deleted = [], []
+        self.release = threading.Event()
+        self.entered = threading.Semaphore(0)
+
+    def create(self, model, config=None):
+        name = f"cachedContents/{len(self.created)}"
+        self.created.append(name)
+        self.entered.release()
+        assert self.release.wait(timeout=5)
+        return SimpleNamespace(name=name)
+
+    def delete(self, name):
+        self.deleted.append(name)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(llm, "_instruction_caches", {})
+    monkeypatch.setattr(llm, "_cache_retry_at", {})
+    monkeypatch.setattr(settings, "llm_prompt_cache_ttl_seconds", 3600)
+    monkeypatch.setattr(settings, "llm_prompt_cache_min_tokens", 1024)
+    return SimpleNamespace(caches=Caches())
+
+
+def test_prompts_under_the_minimum_size_are_not_cached(client):
+    assert llm.estimate_tokens(IMAGE_PROMPT.instructions) < settings.llm_prompt_cache_min_tokens
+    assert llm.cached_instructions(client, MODEL, IMAGE_PROMPT) is None
+    assert client.caches.created == []
+
+
+def test_concurrent_calls_keep_the_first_cache_created(client):
+    results = []
+    calls = [
+        threading.Thread(target=lambda: results.append(llm.cached_instructions(client, MODEL, LONG_PROMPT)))
+        for _ in range(2)
+    ]
+    for thread in calls:
+        thread.start()
+    # Both calls reach the provider at once: the lock isn't held while creating
+    assert client.caches.entered.acquire(timeout=5) and client.caches.entered.acquire(timeout=5)
+    client.caches.release.set()
+    for thread in calls:
+        thread.join(timeout=5)
+
+    assert len(set(results)) == 1 and results[0] in client.caches.created
+    assert client.caches.deleted == [name for name in client.caches.created if name != results[0]]
+
+    # Later calls reuse it
+    assert llm.cached_instructions(client, MODEL, LONG_PROMPT) == results[0]
+    assert len(client.caches.created) == 2
+
+
+def test_refusals_are_not_retried_until_the_ttl_passes(client, monkeypatch):
+    def refuse(model, config=None):
+        client.caches.created.append(model)
+        raise ValueError("Cached content is too small")
+
+    monkeypatch.setattr(client.caches, "create", refuse)
+    assert llm.cached_instructions(client, MODEL, LONG_PROMPT) is None
+    assert llm.cached_instructions(client, MODEL, LONG_PROMPT) is None
+    assert client.caches.created == [MODEL]
@@ -0,0 +1,69 @@
+"""
+Online SQLite backups.
+"""
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy import text
+
+from app.database import create_db_engine
+from app.services import maintenance
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path, monkeypatch):
+    """A file-backed SQLite database of a few hundred pages, used by the maintenance module."""
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'vyaya.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE notes (id INTEGER PRIMARY KEY, body TEXT)"))
+        conn.execute(text("INSERT INTO notes (body) VALUES (:body)"), [{"body": "x" * 500}] * 2000)
+    monkeypatch.setattr(maintenance, "engine", engine)
+    monkeypatch.setattr(maintenance, "IS_SQLITE", True)
+    yield engine
+    engine.dispose()
+
+
+def row_count(path) -> int:
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+        return conn.execute("SELECT count(*) FROM notes").fetchone()[0]
+
+
+def test_backup_copies_the_database(sqlite_engine, tmp_path):
+    report = maintenance.backup_database(tmp_path / "backup.db")
+
+    assert row_count(report.path) == 2000
+    assert (report.restarts, report.vacuumed) == (0, False)
+    assert not (tmp_path / "backup.db.partial").exists()
+
+
+def test_backup_finishes_while_another_connection_keeps_writing(sqlite_engine, tmp_path):
+    stop = threading.Event()
+
+    def write():
+        i = 0
+        while not stop.is_set():
+            with sqlite_engine.begin() as conn:
+                conn.execute(text("UPDATE notes SET body = :body WHERE id = 1"), {"body": f"note {i}"})
+            i += 1
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        report = maintenance.backup_database(tmp_path / "backup.db", pages_per_step=1, pause_seconds=0.001)
+    finally:
+        stop.set()
+        writer.join()
+
+    assert row_count(report.path) == 2000
+    assert report.restarts > 0 and report.vacuumed
+
+
+def test_backup_that_runs_out_of_time_fails(sqlite_engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(maintenance, "BACKUP_TIMEOUT_SECONDS", 0)
+
+    with pytest.raises(maintenance.BackupFailed):
+        maintenance.backup_database(tmp_path / "backup.db", pages_per_step=1)
+    assert not (tmp_path / "backup.db").exists()
+    assert not (tmp_path / "backup.db.partial").exists()
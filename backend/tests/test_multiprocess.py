@@ -0,0 +1,81 @@
+"""
+API and extraction in separate processes, sharing the database job queue.
+"""
+import json
+import threading
+import time
+
+import httpx
+
+from .conftest import sample_jpeg
+
+
+def collect_events(base_url: str, events: list, stop: threading.Event) -> None:
+    """Append (type, data) for each Server-Sent Event until stopped or disconnected."""
+    try:
+        with httpx.stream("GET", f"{base_url}/api/receipts/events", timeout=None) as response:
+            event_type = None
+            for line in response.iter_lines():
+                if stop.is_set():
+                    return
+                if line.startswith("event: "):
+                    event_type = line[len("event: "):]
+                elif line.startswith("data: ") and event_type:
+                    events.append((event_type, json.loads(line[len("data: "):])))
+    except httpx.HTTPError:
+        pass  # The API process stopped
+
+
+def wait_for(predicate, timeout: float = 30.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_standalone_worker_processes_uploads_and_events_reach_the_api(app_env, app_processes):
+    app_env.update({
+        "QUEUE_BACKEND": "database",
+        "EMBEDDED_WORKER": "false",
+        "QUEUE_POLL_INTERVAL_SECONDS": "0.2",
+        "EVENT_RELAY_INTERVAL_SECONDS": "0.2",
+    })
+    base_url = app_processes.start_api()
+
+    events, stop = [], threading.Event()
+    threading.Thread(target=collect_events, args=(base_url, events, stop), daemon=True).start()
+
+    # Without a worker the upload stays queued in the shared table
+    upload = httpx.post(
+        f"{base_url}/api/receipts/upload",
+        files={"file": ("receipt.jpg", sample_jpeg(), "image/jpeg")},
+    )
+    assert upload.status_code == 200
+    receipt_id = upload.json()["receipt"]["id"]
+    assert httpx.get(f"{base_url}/api/receipts/queue").json()["lanes"]["interactive"]["queued"] == 1
+
+    # A separate worker process claims it (extraction fails without an API
+    # key, which still moves the receipt to review)
+    app_processes.start("app.worker")
+    assert wait_for(lambda: httpx.get(f"{base_url}/api/receipts/{receipt_id}").json()["status"] == "review")
+
+    # The API process relays the worker's change to its event stream
+    assert wait_for(lambda: any(
+        event_type == "receipt.updated" and data["id"] == receipt_id and data["status"] == "review"
+        for event_type, data in events
+    ), timeout=10.0)
+    stop.set()
+
+
+def test_standalone_worker_starts_on_a_fresh_data_dir(app_env, app_processes, tmp_path):
+    receipts_dir = tmp_path / "fresh" / "receipts"
+    app_env.update({
+        "QUEUE_BACKEND": "database",
+        "EMBEDDED_WORKER": "false",
+        "RECEIPTS_DIR": str(receipts_dir),
+    })
+    worker = app_processes.start("app.worker")
+    assert wait_for(receipts_dir.is_dir)
+    assert worker.poll() is None
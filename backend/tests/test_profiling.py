@@ -0,0 +1,37 @@
+"""
+Request and job profiles.
+"""
+import threading
+import time
+
+from app.services import profiling
+
+
+def busy_handler(seconds: float) -> None:
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        sum(range(1000))
+
+
+def profiled_functions(monkeypatch, **options) -> set:
+    captured = {}
+
+    def write_profile(stacks, label, interval):
+        captured.update(stacks)
+        return None
+
+    monkeypatch.setattr(profiling, "write_profile", write_profile)
+    with profiling.profile("GET /api/dashboard/vendors", **options):
+        # Like a plain def handler, which FastAPI runs on its threadpool
+        worker = threading.Thread(target=busy_handler, args=(0.3,))
+        worker.start()
+        worker.join()
+    return {frame[0] for stack in captured for frame in stack}
+
+
+def test_request_profiles_sample_the_threads_doing_the_work(monkeypatch):
+    assert "busy_handler" in profiled_functions(monkeypatch, all_threads=True)
+
+
+def test_job_profiles_sample_only_their_own_thread(monkeypatch):
+    assert "busy_handler" not in profiled_functions(monkeypatch)
@@ -0,0 +1,81 @@
+"""
+SQL statement budgets per endpoint.
+
+Each endpoint is called once against a seeded database and must not issue
+more statements than its budget, as counted by count_statements() in the
+request middleware. Budgets are independent of page size, so an N+1
+regression (e.g. a lazy relationship load per row) fails immediately.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal
+from app.models import Receipt
+
+from .conftest import sample_jpeg
+
+SEEDED_RECEIPTS = 300
+
+# (method, path, request kwargs, max statements)
+#
+# Cacheable reads pay one SELECT of data_version (response_cache.lookup) on
+# top of their own queries; a cache hit or 304 costs only that SELECT, and
+# the changes feed reads it to bound the page. Every writing transaction pays
+# one UPDATE of data_version at commit and one UPDATE stamping the rows it
+# wrote with that version (change_seq, the sync cursor), however many rows it
+# touched. An upload also counts recent completions for admission
+# control (cached for a few seconds, so only the first upload of a burst
+# pays it) and stores the file metadata row. A delete records a tombstone,
+# prunes expired ones and, after the commit, checks whether another receipt
+# still shares the stored file.
+BUDGETS = [
+    ("GET", "/api/receipts", {"params": {"per_page": 100}}, 3),
+    ("GET", "/api/receipts", {"params": {"per_page": 100, "q": "Market"}}, 3),
+    ("GET", "/api/receipts/{id}", {}, 1),
+    ("PUT", "/api/receipts/{id}", {"json": {"vendor": "Budget Check"}}, 5),
+    ("POST", "/api/receipts", {"json": {"vendor": "Manual", "amount": 12.5, "currency": "USD"}}, 4),
+    ("POST", "/api/receipts/upload", {"files": "image"}, 6),
+    ("GET", "/api/receipts/image/{id}", {}, 1),
+    ("GET", "/api/dashboard/summary", {}, 4),
+    ("GET", "/api/dashboard/trends", {}, 2),
+    ("GET", "/api/dashboard/categories", {}, 2),
+    ("GET", "/api/receipts/changes", {"params": {"limit": 100}}, 2),
+    ("DELETE", "/api/receipts/{id}", {}, 7),
+]
+
+
+@pytest.fixture(scope="module")
+def client():
+    """The app in-process on the scratch SQLite database, seeded with receipts."""
+    from app.config import get_settings
+    from app.main import app
+    from app.services import llm
+    from benchmarks.seed import seed_receipts
+    from benchmarks.stubs import FakeGenaiClient, FaultProfile
+
+    settings = get_settings()
+    patch = pytest.MonkeyPatch()
+    patch.setattr(settings, "expose_query_count", True)
+    patch.setattr(llm, "client", FakeGenaiClient(FaultProfile()))
+    try:
+        with TestClient(app) as client:
+            seed_receipts(SEEDED_RECEIPTS)
+            yield client
+    finally:
+        patch.undo()
+
+
+@pytest.mark.parametrize(
+    "method, path, kwargs, budget",
+    BUDGETS,
+    ids=[f"{method} {path}" + (" search" if "q" in kwargs.get("params", {}) else "") for method, path, kwargs, _ in BUDGETS],
+)
+def test_endpoint_stays_within_its_statement_budget(client, method, path, kwargs, budget):
+    if kwargs.get("files") == "image":
+        kwargs = {"files": {"file": ("receipt.jpg", sample_jpeg(), "image/jpeg")}}
+    with SessionLocal() as db:
+        receipt_id = db.query(Receipt.id).filter(Receipt.status == "completed").order_by(Receipt.id).first().id
+
+    response = client.request(method, path.format(id=receipt_id), **kwargs)
+    assert response.status_code < 400
+    assert 0 <= int(response.headers["X-DB-Statements"]) <= budget
@@ -0,0 +1,107 @@
+"""
+Delta sync tokens against each database engine.
+"""
+import base64
+from datetime import timedelta
+
+import pytest
+
+from app.database import SessionLocal
+from app.models import Receipt, ReceiptTombstone, get_eastern_time
+from app.services.sync import InvalidSyncToken, SyncPosition, current_token, decode_token, encode_token, get_changes
+
+
+def add_receipts(*vendors: str) -> list:
+    with SessionLocal() as db:
+        receipts = [Receipt(vendor=vendor, status="review", image_path="manual_entry") for vendor in vendors]
+        db.add_all(receipts)
+        db.commit()
+        return [receipt.id for receipt in receipts]
+
+
+def delete_receipt(receipt_id: str) -> None:
+    with SessionLocal() as db:
+        db.delete(db.get(Receipt, receipt_id))
+        db.add(ReceiptTombstone(receipt_id=receipt_id))
+        db.commit()
+
+
+def pull(token, limit=100) -> dict:
+    with SessionLocal() as db:
+        return get_changes(db, token, limit)
+
+
+def test_token_round_trip():
+    position = SyncPosition(42, "receipt-id", get_eastern_time())
+    assert decode_token(encode_token(position)) == position
+    assert decode_token("") is None and encode_token(None) == ""
+
+
+@pytest.mark.parametrize("token", ["not-base64!", base64.urlsafe_b64encode(b"x|y|z").decode()])
+def test_invalid_tokens_are_rejected(token):
+    with pytest.raises(InvalidSyncToken):
+        decode_token(token)
+
+
+def test_pulls_return_each_change_once_across_pages(app_db):
+    first = add_receipts("Corner Market", "Cafe", "Hardware Depot")
+    initial = pull(None, limit=2)
+    assert initial["has_more"] and len(initial["items"]) == 2
+    rest = pull(initial["next_token"], limit=2)
+    assert not rest["has_more"]
+    assert sorted(item["id"] for item in initial["items"] + rest["items"]) == sorted(first)
+
+    # Nothing new: an empty pull that keeps the position
+    assert pull(rest["next_token"])["items"] == []
+
+    second = add_receipts("Bakery")
+    delete_receipt(first[0])
+    with SessionLocal() as db:
+        receipt = db.get(Receipt, first[1])
+        receipt.vendor = "Corner Cafe"
+        # A clock that went backwards (DST fall-back) doesn't hide the change
+        receipt.updated_at = get_eastern_time() - timedelta(hours=1)
+        db.commit()
+
+    changes = pull(rest["next_token"])
+    assert sorted(item["id"] for item in changes["items"]) == sorted([second[0], first[1]])
+    assert changes["deleted"] == [first[0]]
+    caught_up = pull(changes["next_token"])
+    assert (caught_up["items"], caught_up["deleted"], caught_up["has_more"]) == ([], [], False)
+
+
+def test_deletions_at_a_page_boundary_are_returned_once(app_db):
+    ids = add_receipts("Corner Market", "Cafe")
+    token = pull(None)["next_token"]
+
+    # One transaction: an update and a deletion share a sequence number
+    with SessionLocal() as db:
+        db.get(Receipt, ids[0]).vendor = "Corner Cafe"
+        db.delete(db.get(Receipt, ids[1]))
+        db.add(ReceiptTombstone(receipt_id=ids[1]))
+        db.add(Receipt(vendor="Bakery", status="review", image_path="manual_entry"))
+        db.commit()
+
+    deleted, items = [], []
+    while True:
+        page = pull(token, limit=1)
+        deleted += page["deleted"]
+        items += page["items"]
+        token = page["next_token"]
+        if not page["has_more"]:
+            break
+    assert deleted == [ids[1]] and len(items) == 2
+
+
+def test_tokens_older_than_the_tombstone_retention_reset_the_replica(app_db):
+    add_receipts("Corner Market")
+    with SessionLocal() as db:
+        position = decode_token(current_token(db))
+    expired = SyncPosition(position.change_seq, "", position.issued_at - timedelta(days=365))
+
+    changes = pull(encode_token(expired))
+    assert changes["reset"] and len(changes["items"]) == 1
+
+    # Tokens from before positions were sequence numbers are treated as expired
+    legacy = base64.urlsafe_b64encode(f"{get_eastern_time().isoformat()}|abc".encode()).decode()
+    assert pull(legacy)["reset"]
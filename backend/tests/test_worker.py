@@ -0,0 +1,59 @@
+"""
+The receipt worker against each database engine.
+"""
+import pytest
+
+from app.database import SessionLocal
+from app.models import Receipt
+from app.services import worker
+from app.services.worker import claim_attempt, still_current
+
+from .conftest import sample_jpeg
+
+
+def add_processing_receipt(image_path: str = "manual_entry") -> str:
+    with SessionLocal() as db:
+        receipt = Receipt(vendor="Processing...", status="processing", image_path=image_path)
+        db.add(receipt)
+        db.commit()
+        return receipt.id
+
+
+def test_late_attempt_cannot_save_its_result(app_db):
+    receipt_id = add_processing_receipt()
+    with SessionLocal() as db:
+        # The first run is abandoned and its job handed to a second one
+        first, second = claim_attempt(db, receipt_id), claim_attempt(db, receipt_id)
+        assert (first, second) == (1, 2)
+        assert not still_current(db, receipt_id, first)
+        assert still_current(db, receipt_id, second)
+        db.rollback()
+
+        # Nor can any run save once the receipt has left processing
+        db.query(Receipt).filter(Receipt.id == receipt_id).update({Receipt.status: "review"})
+        db.commit()
+        assert not still_current(db, receipt_id, second)
+        assert claim_attempt(db, receipt_id) is None
+
+
+@pytest.mark.parametrize("amount, currency, amount_minor", [
+    (1500, "JPY", 1500),
+    (1.234, "KWD", 1234),
+    (12.5, "USD", 1250),
+])
+def test_extracted_amounts_keep_their_currency_precision(app_db, tmp_path, monkeypatch, amount, currency, amount_minor):
+    image = tmp_path / "receipt.jpg"
+    image.write_bytes(sample_jpeg())
+    receipt_id = add_processing_receipt(str(image))
+
+    async def extract(path, mime_type):
+        return {"vendor": "Corner Market", "amount": amount, "currency": currency, "confidence": 0.9, "raw_text": ""}
+
+    monkeypatch.setattr(worker, "process_receipt_image", extract)
+    worker.process_receipt_task(receipt_id, str(image))
+
+    with SessionLocal() as db:
+        receipt = db.get(Receipt, receipt_id)
+        assert receipt.status == "review"
+        assert (receipt.amount_minor, receipt.currency) == (amount_minor, currency)
+        assert receipt.amount == amount
@@ -10,22 +10,41 @@ const client = axios.create({
     timeout: 10000, // 10 second timeout for all requests
 })
 
+/**
+ * How long the server asked us to wait before retrying, in milliseconds.
+ * Returns null unless the error is a 429/503 backpressure response.
+ * @param {Error} err - An axios error
+ */
+export function retryAfterMs(err) {
+    const status = err?.response?.status
+    if (status !== 429 && status !== 503) return null
+    const seconds = Number(err.response.headers?.['retry-after'])
+    return Number.isFinite(seconds) && seconds > 0 ? seconds * 1000 : 30000
+}
+
 // Receipts API
 export const receiptsApi = {
-    upload: async (file) => {
+    /**
+     * Upload a receipt image.
+     * @param {File|Blob} file - The receipt image
+     * @param {string} lane - Processing lane: 'interactive' (default) or 'bulk' for syncs
+     */
+    upload: async (file, lane = 'interactive') => {
         const formData = new FormData()
         formData.append('file', file)
         const response = await client.post('/receipts/upload', formData, {
+            params: { lane },
             headers: { 'Content-Type': 'multipart/form-data' },
             timeout: 15000, // 15 second timeout for uploads (larger files)
         })
         return response.data
     },
 
-    uploadAudio: async (blob) => {
+    uploadAudio: async (blob, lane = 'interactive') => {
         const formData = new FormData()
         formData.append('file', blob, 'audio_note.webm') // Default filename, backend handles extension
         const response = await client.post('/receipts/upload-audio', formData, {
+            params: { lane },
             headers: { 'Content-Type': 'multipart/form-data' },
             timeout: 30000, // 30 second timeout for audio processing which might take longer
         })
@@ -41,6 +60,17 @@ export const receiptsApi = {
         return response.data
     },
 
+    /**
+     * Pull receipts changed since a sync token (omit for a full pull).
+     * Returns { items, deleted, next_token, has_more, reset }.
+     */
+    changes: async (since, limit = 500) => {
+        const response = await client.get('/receipts/changes', {
+            params: { since: since || undefined, limit },
+        })
+        return response.data
+    },
+
     get: async (id) => {
         const response = await client.get(`/receipts/${id}`)
         return response.data
@@ -56,7 +86,89 @@ export const receiptsApi = {
         return response.data
     },
 
+    reprocess: async (id) => {
+        const response = await client.post(`/receipts/${id}/reprocess`)
+        return response.data
+    },
+
+    getQueueStatus: async () => {
+        const response = await client.get('/receipts/queue')
+        return response.data
+    },
+
     getImageUrl: (id) => `/api/receipts/image/${id}`,
+
+    /**
+     * Subscribe to receipt change events pushed by the server.
+     * All subscribers on a page share one EventSource.
+     * @param {Object} handlers - Callbacks keyed by event type
+     *   (created, updated, deleted), each receiving the event payload, plus
+     *   reconnected, called once the stream is back after an error (events
+     *   sent while it was down are lost, so refetch)
+     * @returns {Function} - Call to close the subscription
+     */
+    subscribe: (handlers) => {
+        receiptEvents.subscribers.add(handlers)
+        receiptEvents.open()
+        return () => {
+            receiptEvents.subscribers.delete(handlers)
+            if (receiptEvents.subscribers.size === 0) receiptEvents.close()
+        }
+    },
+}
+
+// Delay before reopening a stream the browser gave up on (e.g. after a 5xx)
+const EVENTS_REOPEN_MS = 5000
+
+/**
+ * The page's single receipt event stream, opened while anyone subscribes.
+ */
+const receiptEvents = {
+    subscribers: new Set(),
+    source: null,
+    failed: false,
+    reopenTimer: null,
+
+    dispatch(type, payload) {
+        for (const handlers of this.subscribers) {
+            handlers[type]?.(payload)
+        }
+    },
+
+    open() {
+        if (this.source) return
+        const source = new EventSource(`${API_BASE}/receipts/events`)
+        for (const type of ['created', 'updated', 'deleted']) {
+            source.addEventListener(`receipt.${type}`, (event) => {
+                this.dispatch(type, JSON.parse(event.data))
+            })
+        }
+        source.onopen = () => {
+            if (this.failed) {
+                this.failed = false
+                this.dispatch('reconnected')
+            }
+        }
+        source.onerror = () => {
+            this.failed = true
+            // The browser retries on its own unless the stream is closed for good
+            if (source.readyState === EventSource.CLOSED) {
+                this.source = null
+                clearTimeout(this.reopenTimer)
+                this.reopenTimer = setTimeout(() => {
+                    if (this.subscribers.size > 0) this.open()
+                }, EVENTS_REOPEN_MS)
+            }
+        }
+        this.source = source
+    },
+
+    close() {
+        clearTimeout(this.reopenTimer)
+        this.source?.close()
+        this.source = null
+        this.failed = false
+    },
 }
 
 // Dashboard API
@@ -1,7 +1,10 @@
-import { useState, useEffect, useCallback, useMemo } from 'react'
+import { useState, useEffect, useCallback, useMemo, useRef } from 'react'
 import { receiptsApi, dashboardApi } from '../api/client'
 import { useOfflineMode } from '../context/OfflineModeContext'
 
+// Safety net for missed events: refetch this often while anything shown is processing
+const PROCESSING_POLL_MS = 15000
+
 /**
  * Hook for fetching and managing receipts list
  */
@@ -20,8 +23,15 @@ export function useReceipts(initialParams = {}) {
     // Stable params to prevent infinite loops - using JSON.stringify to deep compare
     const paramsKey = JSON.stringify(initialParams)
 
-    const fetchReceipts = useCallback(async (params = {}) => {
-        setLoading(true)
+    // Remember the last page requested so background refreshes reload it
+    const lastParams = useRef({})
+
+    const fetchReceipts = useCallback(async (params = {}, options = {}) => {
+        lastParams.current = params
+        // Only set loading if not a background refresh
+        if (!options.background) {
+            setLoading(true)
+        }
         setError(null)
 
         if (offlineMode) {
@@ -45,14 +55,57 @@ export function useReceipts(initialParams = {}) {
         } catch (err) {
             setError(err.message || 'Failed to fetch receipts')
         } finally {
-            setLoading(false)
+            if (!options.background) {
+                setLoading(false)
+            }
         }
     }, [paramsKey, offlineMode])
 
+    const refreshReceipts = useCallback(
+        () => fetchReceipts(lastParams.current, { background: true }),
+        [fetchReceipts]
+    )
+
     useEffect(() => {
         fetchReceipts()
     }, [fetchReceipts])
 
+    // Apply pushed status changes instead of polling the list
+    const refreshTimer = useRef(null)
+    useEffect(() => {
+        if (offlineMode) return
+
+        const unsubscribe = receiptsApi.subscribe({
+            // New receipts change ordering and totals; coalesce bursts (e.g. an
+            // offline sync) into a single list refresh
+            created: () => {
+                clearTimeout(refreshTimer.current)
+                refreshTimer.current = setTimeout(refreshReceipts, 1000)
+            },
+            updated: (updated) => {
+                setReceipts((current) =>
+                    current.map((r) => (r.id === updated.id ? updated : r))
+                )
+            },
+            deleted: ({ id }) => {
+                setReceipts((current) => current.filter((r) => r.id !== id))
+            },
+            reconnected: refreshReceipts,
+        })
+        return () => {
+            clearTimeout(refreshTimer.current)
+            unsubscribe()
+        }
+    }, [refreshReceipts, offlineMode])
+
+    // Slow fallback poll in case a status change was never pushed
+    const anyProcessing = receipts.some((r) => r.status === 'processing')
+    useEffect(() => {
+        if (offlineMode || !anyProcessing) return
+        const interval = setInterval(refreshReceipts, PROCESSING_POLL_MS)
+        return () => clearInterval(interval)
+    }, [anyProcessing, refreshReceipts, offlineMode])
+
     return {
         receipts,
         loading,
@@ -95,6 +148,26 @@ export function useReceipt(id) {
         fetchReceipt()
     }, [fetchReceipt])
 
+    // Receive status changes (e.g. processing -> review) as they happen
+    useEffect(() => {
+        if (!id) return
+
+        return receiptsApi.subscribe({
+            updated: (updated) => {
+                if (updated.id === id) setReceipt(updated)
+            },
+            reconnected: () => fetchReceipt({ background: true }),
+        })
+    }, [id, fetchReceipt])
+
+    // Slow fallback poll in case the status change was never pushed
+    const processing = receipt?.status === 'processing'
+    useEffect(() => {
+        if (!processing) return
+        const interval = setInterval(() => fetchReceipt({ background: true }), PROCESSING_POLL_MS)
+        return () => clearInterval(interval)
+    }, [processing, fetchReceipt])
+
     return {
         receipt,
         loading,
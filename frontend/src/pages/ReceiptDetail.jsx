@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState } from 'react'
 import { createPortal } from 'react-dom'
 import { useParams, useNavigate, Link } from 'react-router-dom'
 import { format } from 'date-fns'
@@ -18,13 +18,6 @@ export default function ReceiptDetail() {
     const [showDeleteConfirm, setShowDeleteConfirm] = useState(false)
     const [isZoomed, setIsZoomed] = useState(false)
 
-    useEffect(() => {
-        if (receipt?.status === 'processing' && !showDeleteConfirm) {
-            const timer = setInterval(() => refetch({ background: true }), 5000)
-            return () => clearInterval(timer)
-        }
-    }, [receipt?.status, refetch, showDeleteConfirm])
-
     const handleSave = async (data) => {
         setSaving(true)
         try {
@@ -75,20 +75,8 @@ export default function Receipts() {
             setSyncResult(result)
             // Reload pending list and receipts
             await loadPendingReceipts()
+            // Processing results arrive as pushed receipt events
             refetch()
-
-            // Poll for updates as receipts are processed
-            if (result.success > 0) {
-                let pollCount = 0
-                const maxPolls = 10
-                const pollInterval = setInterval(() => {
-                    pollCount++
-                    refetch()
-                    if (pollCount >= maxPolls) {
-                        clearInterval(pollInterval)
-                    }
-                }, 3000)
-            }
         } catch (err) {
             setSyncResult({ success: 0, failed: pendingReceipts.length, error: err.message })
         } finally {
@@ -104,20 +92,11 @@ export default function Receipts() {
     // Track previous offline mode to detect transitions
     const wasOffline = useRef(offlineMode)
 
-    // When transitioning from offline to online, poll for receipt updates
+    // When transitioning from offline to online, refresh once; later status
+    // changes are pushed over the receipt event stream
     useEffect(() => {
         if (wasOffline.current && !offlineMode) {
             refetch()
-            let pollCount = 0
-            const maxPolls = 10
-            const pollInterval = setInterval(() => {
-                pollCount++
-                refetch()
-                if (pollCount >= maxPolls) {
-                    clearInterval(pollInterval)
-                }
-            }, 3000)
-            return () => clearInterval(pollInterval)
         }
         wasOffline.current = offlineMode
     }, [offlineMode, refetch])
@@ -391,7 +370,8 @@ export default function Receipts() {
                     {syncResult && (
                         <div className={`mt-3 text-sm ${syncResult.failed > 0 ? 'text-red-400' : 'text-emerald-400'}`}>
                             {syncResult.success > 0 && `${syncResult.success} uploaded successfully. `}
-                            {syncResult.failed > 0 && `${syncResult.failed} failed.`}
+                            {syncResult.failed > 0 && `${syncResult.failed} failed. `}
+                            {syncResult.deferred > 0 && `Server busy: ${syncResult.deferred} will retry in ${syncResult.retryAfter}s.`}
                         </div>
                     )}
                 </div>
@@ -1,5 +1,5 @@
 import { get, set, del, keys } from 'idb-keyval'
-import { receiptsApi } from '../api/client'
+import { receiptsApi, retryAfterMs } from '../api/client'
 
 const QUEUE_PREFIX = 'pending_receipt_'
 
@@ -142,17 +142,50 @@ export async function getQueueCount() {
 }
 
 let isSyncing = false
+let retryTimer = null
+
+/**
+ * Try the sync again once the server's Retry-After has passed, with some
+ * jitter so several devices coming back online don't retry in lockstep
+ */
+function scheduleRetry(delayMs, onProgress, onError) {
+    clearTimeout(retryTimer)
+    const jittered = delayMs * (1 + Math.random() * 0.2)
+    console.log(`Server busy, retrying sync in ${Math.round(jittered / 1000)}s`)
+    retryTimer = setTimeout(() => {
+        retryTimer = null
+        syncQueue(onProgress, onError)
+    }, jittered)
+}
+
+/**
+ * Seconds until the server accepts bulk uploads, or 0 if it does now
+ * (or its status can't be read)
+ */
+async function bulkRetryAfter() {
+    try {
+        const status = await receiptsApi.getQueueStatus()
+        const bulk = status.admission?.bulk
+        return bulk && !bulk.accepting ? bulk.retry_after_seconds : 0
+    } catch {
+        return 0
+    }
+}
 
 /**
  * Sync all pending receipts to the server
+ *
+ * Stops as soon as the server reports it is overloaded (429 with
+ * Retry-After) and schedules another attempt; the remaining receipts stay
+ * queued and are reported as deferred.
  * @param {Function} onProgress - Optional callback (uploaded, total) for progress updates
  * @param {Function} onError - Optional callback (receipt, error) for individual errors
- * @returns {Promise<{success: number, failed: number}>}
+ * @returns {Promise<{success: number, failed: number, deferred: number, retryAfter: number}>}
  */
 export async function syncQueue(onProgress, onError) {
     if (isSyncing) {
         console.log('Sync already in progress, skipping')
-        return { success: 0, failed: 0 }
+        return { success: 0, failed: 0, deferred: 0, retryAfter: 0 }
     }
 
     try {
@@ -160,7 +193,14 @@ export async function syncQueue(onProgress, onError) {
         const queue = await getQueue()
         const total = queue.length
 
-        if (total === 0) return { success: 0, failed: 0 }
+        if (total === 0) return { success: 0, failed: 0, deferred: 0, retryAfter: 0 }
+
+        // Don't start uploading into a backlog the server would refuse anyway
+        const waitSeconds = await bulkRetryAfter()
+        if (waitSeconds > 0) {
+            scheduleRetry(waitSeconds * 1000, onProgress, onError)
+            return { success: 0, failed: 0, deferred: total, retryAfter: waitSeconds }
+        }
 
         let success = 0
         let failed = 0
@@ -180,12 +220,14 @@ export async function syncQueue(onProgress, onError) {
                         continue
                     }
 
+                    // Synced captures go to the bulk lane so they don't delay
+                    // receipts the user is capturing right now
                     if (receipt.type && receipt.type.startsWith('audio/')) {
                         console.log('Uploading audio note:', receipt.id)
-                        await receiptsApi.uploadAudio(receipt.file)
+                        await receiptsApi.uploadAudio(receipt.file, 'bulk')
                     } else {
                         console.log('Uploading receipt file:', receipt.id)
-                        await receiptsApi.upload(receipt.file)
+                        await receiptsApi.upload(receipt.file, 'bulk')
                     }
                 }
 
@@ -193,6 +235,12 @@ export async function syncQueue(onProgress, onError) {
                 success++
                 console.log('Successfully synced:', receipt.id)
             } catch (err) {
+                const waitMs = retryAfterMs(err)
+                if (waitMs !== null) {
+                    // Server is shedding load: keep the rest queued and back off
+                    scheduleRetry(waitMs, onProgress, onError)
+                    return { success, failed, deferred: total - i, retryAfter: Math.ceil(waitMs / 1000) }
+                }
                 console.error('Failed to sync receipt:', receipt.id, err)
                 failed++
                 if (onError) {
@@ -206,7 +254,7 @@ export async function syncQueue(onProgress, onError) {
         }
 
         console.log('Sync complete:', success, 'success,', failed, 'failed')
-        return { success, failed }
+        return { success, failed, deferred: 0, retryAfter: 0 }
     } finally {
         isSyncing = false
     }